@@ -0,0 +1,122 @@
+# app/cache.py
+"""
+Caché de respuestas de corta duración (TTL de segundos).
+
+Si REDIS_URL está configurada se usa Redis (compartido entre workers);
+si no, un diccionario en memoria por proceso. La invalidación se hace por
+"namespace": cada escritura incrementa la versión del namespace y la versión
+forma parte de la clave, así las entradas antiguas dejan de leerse.
+"""
+from __future__ import annotations
+
+import hashlib
+import time
+from collections import OrderedDict
+from typing import Optional, Tuple
+
+from app.config import settings
+
+CachedResponse = Tuple[bytes, str, str]  # (body, etag, media_type)
+
+
+def make_etag(body: bytes) -> str:
+    """ETag fuerte a partir del contenido de la respuesta."""
+    return '"' + hashlib.sha1(body).hexdigest() + '"'
+
+
+class _MemoryBackend:
+    """
+    Backend en memoria (un proceso). Suficiente para desarrollo o un solo worker.
+    Acotado a `max_entries` con expulsión LRU: las claves incluyen la query string
+    (fechas, cursores...), así que sin escrituras que invaliden el dict crecería sin límite.
+    """
+
+    def __init__(self, max_entries: int):
+        self._max_entries = max_entries
+        self._entries: OrderedDict[str, tuple[float, CachedResponse]] = OrderedDict()
+        self._versions: dict[str, int] = {}
+
+    async def get(self, key: str) -> Optional[CachedResponse]:
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+        expires_at, value = entry
+        if expires_at < time.monotonic():
+            self._entries.pop(key, None)
+            return None
+        self._entries.move_to_end(key)
+        return value
+
+    async def set(self, key: str, value: CachedResponse, ttl: int) -> None:
+        self._entries[key] = (time.monotonic() + ttl, value)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self._max_entries:
+            self._entries.popitem(last=False)
+
+    async def version(self, namespace: str) -> int:
+        return self._versions.get(namespace, 0)
+
+    async def bump(self, namespace: str) -> None:
+        self._versions[namespace] = self._versions.get(namespace, 0) + 1
+        # Las entradas de versiones anteriores ya no se leerán: liberarlas
+        prefix = f"resp:{namespace}:"
+        for key in [k for k in self._entries if k.startswith(prefix)]:
+            self._entries.pop(key, None)
+
+
+class _RedisBackend:
+    """Backend Redis: cada entrada es un hash {body, etag, media_type} con EXPIRE."""
+
+    def __init__(self, url: str):
+        import redis.asyncio as redis  # Solo necesario si se configura REDIS_URL
+
+        self._redis = redis.from_url(url)
+
+    async def get(self, key: str) -> Optional[CachedResponse]:
+        data = await self._redis.hgetall(key)
+        if not data:
+            return None
+        return data[b"body"], data[b"etag"].decode(), data[b"media_type"].decode()
+
+    async def set(self, key: str, value: CachedResponse, ttl: int) -> None:
+        body, etag, media_type = value
+        async with self._redis.pipeline(transaction=True) as pipe:
+            pipe.hset(key, mapping={"body": body, "etag": etag, "media_type": media_type})
+            pipe.expire(key, ttl)
+            await pipe.execute()
+
+    async def version(self, namespace: str) -> int:
+        return int(await self._redis.get(f"ver:{namespace}") or 0)
+
+    async def bump(self, namespace: str) -> None:
+        await self._redis.incr(f"ver:{namespace}")
+
+
+class ResponseCache:
+    """Fachada sobre el backend configurado."""
+
+    def __init__(self, ttl: int):
+        self.ttl = ttl
+        if settings.redis_url:
+            self._backend = _RedisBackend(settings.redis_url)
+        else:
+            self._backend = _MemoryBackend(settings.response_cache_max_entries)
+
+    async def key(self, namespace: str, *parts: str) -> str:
+        version = await self._backend.version(namespace)
+        digest = hashlib.sha1("\x1f".join(parts).encode("utf-8")).hexdigest()
+        return f"resp:{namespace}:v{version}:{digest}"
+
+    async def get(self, key: str) -> Optional[CachedResponse]:
+        return await self._backend.get(key)
+
+    async def set(self, key: str, body: bytes, etag: str, media_type: str, ttl: Optional[int] = None) -> None:
+        await self._backend.set(key, (body, etag, media_type), ttl or self.ttl)
+
+    async def invalidate(self, *namespaces: str) -> None:
+        """Invalida todas las respuestas cacheadas de los namespaces."""
+        for namespace in namespaces:
+            await self._backend.bump(namespace)
+
+
+response_cache = ResponseCache(ttl=settings.response_cache_ttl)
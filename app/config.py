@@ -10,6 +10,18 @@ class Settings(BaseModel):
     jwt_alg: str = os.getenv("JWT_ALG", "HS256")
     alias_hash_alg: str = os.getenv("ALIAS_HASH_ALG", "sha256")
     cors_origins: str = os.getenv("CORS_ORIGINS", "*")
+    redis_url: str | None = os.getenv("REDIS_URL") or None
+    response_cache_ttl: int = int(os.getenv("RESPONSE_CACHE_TTL", "10"))
+    response_cache_max_entries: int = int(os.getenv("RESPONSE_CACHE_MAX_ENTRIES", "10000"))
+    bcrypt_rounds: int = int(os.getenv("BCRYPT_ROUNDS", "12"))
+    bcrypt_max_pending: int = int(os.getenv("BCRYPT_MAX_PENDING", "500"))
+    bcrypt_workers: int = int(os.getenv("BCRYPT_WORKERS", str(min(4, os.cpu_count() or 1))))
+    db_pool_size: int = int(os.getenv("DB_POOL_SIZE", "20"))
+    db_max_overflow: int = int(os.getenv("DB_MAX_OVERFLOW", "30"))
+    db_pool_recycle: int = int(os.getenv("DB_POOL_RECYCLE", "1800"))
+    db_pool_timeout: int = int(os.getenv("DB_POOL_TIMEOUT", "5"))
+    db_statement_cache_size: int = int(os.getenv("DB_STATEMENT_CACHE_SIZE", "500"))
+    db_query_cache_size: int = int(os.getenv("DB_QUERY_CACHE_SIZE", "1200"))
 
 settings = Settings()
 
@@ -2,7 +2,9 @@
 from __future__ import annotations
 
 from sqlalchemy.ext.asyncio import AsyncSession, create_async_engine, async_sessionmaker
-from sqlalchemy import text
+from sqlalchemy import event, exists, func, literal, select, text
+from sqlalchemy.orm import Session
+from sqlalchemy.pool import AsyncAdaptedQueuePool
 from app.config import settings
 
 # Crea el engine async (Postgres). La URL viene de .env (DATABASE_URL)
@@ -17,13 +19,27 @@ if not database_url.startswith(('postgresql+asyncpg://', 'postgresql+psycopg://'
     elif database_url.startswith('postgres://'):
         database_url = database_url.replace('postgres://', 'postgresql+asyncpg://', 1)
 
+# asyncpg: sin JIT de Postgres (las consultas OLTP cortas pagan la compilación sin amortizarla)
+# y caché de sentencias preparadas por conexión mayor que la de por defecto (100):
+# set_config y las consultas frecuentes se parsean/planifican una sola vez por conexión
+connect_args = {
+    "server_settings": {"jit": "off"},
+    "prepared_statement_cache_size": settings.db_statement_cache_size,
+} if database_url.startswith("postgresql+asyncpg://") else {}
+
 engine = create_async_engine(
     database_url,
     future=True,
-    pool_size=10,              # Conexiones activas en el pool
-    max_overflow=20,           # Conexiones extras en picos de tráfico
-    pool_pre_ping=True,        # Verifica conexión antes de usar
-    pool_recycle=3600,         # Recicla conexiones cada 1 hora
+    poolclass=AsyncAdaptedQueuePool,         # Pool compatible con asyncio (no QueuePool)
+    pool_size=settings.db_pool_size,         # Conexiones activas en el pool (20)
+    max_overflow=settings.db_max_overflow,   # Conexiones extras en picos de tráfico (30)
+    pool_pre_ping=True,                      # Verifica conexión antes de usar
+    pool_recycle=settings.db_pool_recycle,   # Recicla conexiones cada 30 min
+    pool_timeout=settings.db_pool_timeout,   # Espera máxima por una conexión libre (5s)
+    connect_args=connect_args,
+    # Caché de SQL compilado de SQLAlchemy (por forma de sentencia). Los UPDATE parciales
+    # y las combinaciones de filtros de los listados generan muchas formas: más que las 500 por defecto
+    query_cache_size=settings.db_query_cache_size,
     echo=False,                # No loguear queries SQL (ya tienes logging estructurado)
 )
 
@@ -34,15 +50,101 @@ AsyncSessionLocal = async_sessionmaker(
     class_=AsyncSession,
 )
 
+_SET_USER_GUC = text("SELECT set_config('app.user_id', :uid, true)")
+
+def _user_guc_pending(session: Session) -> bool:
+    """True si la transacción en curso aún no tiene app.user_id (o aún no ha empezado)."""
+    transaction = session.get_transaction()
+    return transaction is None or session.info.get("_user_guc_transaction") is not transaction
+
+def _ensure_user_guc(session: Session) -> None:
+    """
+    Fija app.user_id (auditoría: lo lee el trigger de resident_history) con
+    session.info["user_id"] una vez por transacción, antes de su primera
+    escritura. Las transacciones de solo lectura no pagan el round-trip, y tras un
+    commit la siguiente escritura vuelve a fijarlo (set_config con is_local=true
+    dura solo una transacción).
+    """
+    user_id = session.info.get("user_id")
+    if not user_id or not _user_guc_pending(session):
+        return
+    session.connection().execute(_SET_USER_GUC, {"uid": user_id})
+    session.info["_user_guc_transaction"] = session.get_transaction()
+
+async def first_with_user_guc(session: AsyncSession, stmt):
+    """
+    Ejecuta `stmt` (un SELECT) añadiendo set_config('app.user_id') como columna extra y
+    devuelve su primera fila sin esa columna (o None). Para consultas que ya se hacen al
+    empezar la petición (contexto de residencia): si luego hay escrituras, el GUC ya
+    está fijado en la transacción y _ensure_user_guc no necesita otro round-trip.
+    """
+    user_id = session.info.get("user_id")
+    if not user_id:
+        return (await session.execute(stmt)).first()
+    row = (await session.execute(
+        stmt.add_columns(func.set_config("app.user_id", user_id, True))
+    )).first()
+    if row is None:
+        # Sin filas set_config no se evaluó
+        return None
+    session.info["_user_guc_transaction"] = session.sync_session.get_transaction()
+    return row[:-1]
+
+@event.listens_for(Session, "do_orm_execute")
+def _user_guc_before_statement(orm_execute_state):
+    """INSERT/UPDATE/DELETE explícitos (update(), insert(), delete())."""
+    session = orm_execute_state.session
+    if orm_execute_state.is_update or orm_execute_state.is_delete:
+        user_id = session.info.get("user_id")
+        if user_id and _user_guc_pending(session):
+            # set_config va en el propio UPDATE/DELETE como EXISTS no correlacionado
+            # (InitPlan): se evalúa antes de que ninguna fila llegue a modificarse, así
+            # que el trigger ya lo ve, sin round-trip aparte. Tiene que ir en el WHERE del
+            # EXISTS: Postgres descarta la lista de columnas de un EXISTS y no la evalúa.
+            # No se marca la transacción: si no hay filas puede no evaluarse, y la
+            # siguiente escritura lo vuelve a fijar
+            orm_execute_state.statement = orm_execute_state.statement.where(
+                exists(select(literal(1)).where(func.set_config("app.user_id", user_id, True).is_not(None)))
+            )
+        return
+    if orm_execute_state.is_insert:
+        _ensure_user_guc(session)
+
+@event.listens_for(Session, "before_flush")
+def _user_guc_before_flush(session, flush_context, instances):
+    """Escrituras por unit of work (db.add, cambios de atributos, db.delete)."""
+    if session.new or session.dirty or session.deleted:
+        _ensure_user_guc(session)
+
+async def ensure_measurement_partitions(months_ahead: int = 3) -> int:
+    """
+    Crea (si faltan) las particiones de measurement del mes actual y los `months_ahead`
+    siguientes con ensure_measurement_partition (init_database.py), para no depender
+    de un cron: así las mediciones nuevas no caen en measurement_default.
+    Devuelve cuántas filas quedan en measurement_default (fuera de toda partición mensual).
+    """
+    async with engine.begin() as conn:
+        await conn.execute(
+            text("""
+                SELECT ensure_measurement_partition(m::DATE)
+                FROM generate_series(
+                    date_trunc('month', now()),
+                    date_trunc('month', now()) + make_interval(months => :ahead),
+                    INTERVAL '1 month'
+                ) AS m
+            """),
+            {"ahead": months_ahead},
+        )
+        return await conn.scalar(text("SELECT count(*) FROM measurement_default"))
+
 async def get_session(user_id: str | None):
     """
     Devuelve una sesión configurando app.user_id para RLS/auditoría.
     Úsala en endpoints que requieren usuario autenticado.
     """
     async with AsyncSessionLocal() as session:
-        uid = user_id or ""
-        # Fija el user_id de la petición para las políticas RLS en Postgres
-        await session.execute(text("SELECT set_config('app.user_id', :uid, true)"), {"uid": uid})
+        # user_id de la petición para auditoría en Postgres (ver _ensure_user_guc)
+        session.info["user_id"] = user_id or ""
         yield session
 
 async def get_session_anon():
@@ -51,5 +153,5 @@ async def get_session_anon():
     Útil para /auth/login (no hay usuario aún).
     """
     async with AsyncSessionLocal() as session:
-        await session.execute(text("SELECT set_config('app.user_id', '', true)"))
+        session.info["user_id"] = ""
         yield session
@@ -3,10 +3,11 @@ from __future__ import annotations
 from fastapi import Depends, HTTPException, status, Header, Query
 from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
 from sqlalchemy.ext.asyncio import AsyncSession
-from sqlalchemy import select, text
-from app.db import AsyncSessionLocal
-from app.security import decode_token
+from sqlalchemy import select, func, and_, case, cast, text, Text
+from app.db import AsyncSessionLocal, first_with_user_guc
 from app.models import UserResidence
+from app.security import decode_token
+from app.services.permission_service import PermissionService
 
 bearer = HTTPBearer(auto_error=False)
 
@@ -28,7 +29,9 @@ async def get_db(current=Depends(get_current_user)) -> AsyncSession:
     No obliga a elegir residencia.
     """
     async with AsyncSessionLocal() as session:
-        await session.execute(text("SELECT set_config('app.user_id', :uid, true)"), {"uid": current["id"]})
+        # app.user_id se fija antes de la primera escritura de cada transacción (app.db._ensure_user_guc):
+        # los endpoints no necesitan hacerlo antes de escribir, ni siquiera tras un commit.
+        session.info["user_id"] = current["id"]
         yield session
 
 async def get_db_with_residence(
@@ -48,18 +51,61 @@ async def get_db_with_residence(
         )
 
     async with AsyncSessionLocal() as session:
-        await session.execute(text("SELECT set_config('app.user_id', :uid, true)"), {"uid": current["id"]})
+        session.info["user_id"] = current["id"]
 
         if residence_id:
-            ok = await session.execute(
-                select(UserResidence).where(
-                    UserResidence.user_id == current["id"],
-                    UserResidence.residence_id == residence_id,
-                )
-            )
-            if current["role"] != "superadmin" and ok.scalar_one_or_none() is None:
+            if current["role"] != "superadmin" and not await PermissionService.is_assigned(
+                session, current["id"], residence_id
+            ):
                 raise HTTPException(status_code=403, detail="Residence not allowed for this user")
 
             await session.execute(text("SELECT set_config('app.residence_id', :rid, true)"), {"rid": residence_id})
 
-        yield session
\ No newline at end of file
+        yield session
+
+async def bind_inferred_residence(db: AsyncSession, current: dict, model, obj_id: str, not_found: str) -> str:
+    """
+    Infiere residence_id a partir de un residente/dispositivo, valida la pertenencia
+    del usuario y fija app.residence_id en una sola consulta: el CASE solo evalúa
+    set_config si existe la fila de user_residence.
+    """
+    row = await first_with_user_guc(
+        db,
+        select(
+            model.residence_id,
+            case((
+                UserResidence.user_id.is_not(None),
+                func.set_config("app.residence_id", cast(model.residence_id, Text), True),
+            )),
+        )
+        .outerjoin(
+            UserResidence,
+            and_(
+                UserResidence.residence_id == model.residence_id,
+                UserResidence.user_id == current["id"],
+            ),
+        )
+        .where(model.id == obj_id, model.deleted_at.is_(None))
+    )
+    if row is None:
+        raise HTTPException(status_code=400, detail=not_found)
+    rid, bound = row
+    if bound is None:
+        raise HTTPException(status_code=403, detail="Residence not allowed for this user")
+    return rid
+
+async def bind_residence_if_member(db: AsyncSession, user_id: str, residence_id: str) -> bool:
+    """
+    Comprueba la pertenencia y fija app.residence_id en una sola consulta:
+    set_config solo se evalúa si existe la fila de user_residence.
+    Devuelve False si el usuario no está asignado a la residencia.
+    """
+    ok = await db.scalar(
+        select(func.set_config("app.residence_id", residence_id, True))
+        .select_from(UserResidence)
+        .where(
+            UserResidence.user_id == user_id,
+            UserResidence.residence_id == residence_id,
+        )
+    )
+    return ok is not None
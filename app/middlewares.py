@@ -1,14 +1,105 @@
 from fastapi import FastAPI, Request
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.middleware.gzip import GZipMiddleware
-from fastapi.responses import JSONResponse
+from fastapi.responses import JSONResponse, Response
 from app.config import settings
+from app.cache import response_cache, make_etag
+from app.security import decode_token
+import re
 import time
 import logging
 from collections import defaultdict
 from datetime import datetime, timedelta
 
+_UUID = r"[0-9a-fA-F]{8}-[0-9a-fA-F]{4}-[0-9a-fA-F]{4}-[0-9a-fA-F]{4}-[0-9a-fA-F]{12}"
+
+# Lecturas GET cacheables: (ruta, namespace que las invalida, TTL en segundos o None = por defecto)
+CACHEABLE_PATHS = [
+    # Mediciones: TTL corto, invalidadas al escribir mediciones
+    (
+        re.compile(
+            r"^/measurements/("
+            r"by-day"
+            r"|residents/[^/]+/measurements"
+            r"|" + _UUID +
+            r")$"
+        ),
+        "measurements",
+        None,
+    ),
+    # Residencias y usuarios: cambian muy poco y se piden en cada navegación.
+    # Comparten namespace porque cada listado muestra datos del otro
+    # (usuarios de una residencia, residencias asignadas a un usuario).
+    (re.compile(r"^/residences/(mine|" + _UUID + r"|" + _UUID + r"/users)?$"), "residences", 60),
+    (re.compile(r"^/users/(" + _UUID + r")?$"), "residences", 60),
+    # Residentes (listado y detalle): TTL corto. Se invalidan al escribir residentes y
+    # también con cambios de residencias/asignaciones (nombres y permisos que muestran).
+    # Los renombrados de camas/habitaciones/plantas se ven como mucho TTL segundos tarde.
+    (re.compile(r"^/residents/(" + _UUID + r")?$"), "residents", None),
+]
+
+
+def _match_cacheable(path: str):
+    for pattern, namespace, ttl in CACHEABLE_PATHS:
+        if pattern.match(path):
+            return namespace, ttl
+    return None
+
+
+async def response_cache_middleware(request: Request, call_next):
+    """
+    Caché de respuestas GET (ver CACHEABLE_PATHS) con ETag.
+    Un acierto devuelve el cuerpo guardado (o 304 si coincide If-None-Match)
+    sin abrir sesión de base de datos.
+    """
+    match = _match_cacheable(request.url.path) if request.method == "GET" else None
+    if match is None:
+        return await call_next(request)
+    namespace, ttl = match
+
+    # La clave incluye el usuario: sin token válido se deja que el endpoint responda 401
+    auth = request.headers.get("authorization", "")
+    try:
+        user_id = decode_token(auth.split(" ", 1)[1])["sub"] if auth.lower().startswith("bearer ") else None
+    except Exception:
+        user_id = None
+    if not user_id:
+        return await call_next(request)
+
+    key = await response_cache.key(
+        namespace,
+        user_id,
+        request.url.path,
+        request.url.query,
+        request.headers.get("residence-id", ""),
+    )
+    cached = await response_cache.get(key)
+    if cached is not None:
+        body, etag, media_type = cached
+        if request.headers.get("if-none-match") == etag:
+            return Response(status_code=304, headers={"ETag": etag})
+        return Response(content=body, media_type=media_type, headers={"ETag": etag})
+
+    resp = await call_next(request)
+    if resp.status_code != 200:
+        return resp
+
+    body = b"".join([chunk async for chunk in resp.body_iterator])
+    etag = make_etag(body)
+    media_type = resp.media_type or resp.headers.get("content-type", "application/json")
+    await response_cache.set(key, body, etag, media_type, ttl=ttl)
+
+    headers = {k: v for k, v in resp.headers.items() if k.lower() != "content-length"}
+    headers["ETag"] = etag
+    if request.headers.get("if-none-match") == etag:
+        return Response(status_code=304, headers={"ETag": etag})
+    return Response(content=body, status_code=200, headers=headers, media_type=media_type)
+
+
 def setup_middlewares(app: FastAPI):
+    # Caché de lecturas GET (se registra primero para quedar por dentro de GZIP)
+    app.middleware("http")(response_cache_middleware)
+
     # GZIP Compression - comprime respuestas > 1KB
     app.add_middleware(GZipMiddleware, minimum_size=1000)
 
@@ -48,6 +48,9 @@ resident_history_change_type_enum = ENUM(
 
 class User(Base):
     __tablename__ = "user"
+    # created_at/updated_at (server_default) vuelven en el RETURNING del INSERT
+    # en lugar de necesitar un refresh
+    __mapper_args__ = {"eager_defaults": True}
 
     id: Mapped[str] = mapped_column(UUID(as_uuid=False), primary_key=True)
     role: Mapped[str] = mapped_column(user_role_enum, nullable=False)
@@ -137,6 +140,8 @@ class UserResidence(Base):
 
 class Floor(Base):
     __tablename__ = "floor"
+    # server defaults en el RETURNING del INSERT (sin refresh)
+    __mapper_args__ = {"eager_defaults": True}
 
     id: Mapped[str] = mapped_column(UUID(as_uuid=False), primary_key=True)
     residence_id: Mapped[str] = mapped_column(
@@ -163,6 +168,8 @@ class Floor(Base):
 
 class Room(Base):
     __tablename__ = "room"
+    # server defaults en el RETURNING del INSERT (sin refresh)
+    __mapper_args__ = {"eager_defaults": True}
 
     id: Mapped[str] = mapped_column(UUID(as_uuid=False), primary_key=True)
     residence_id: Mapped[str] = mapped_column(
@@ -194,6 +201,8 @@ class Room(Base):
 
 class Bed(Base):
     __tablename__ = "bed"
+    # server defaults en el RETURNING del INSERT (sin refresh)
+    __mapper_args__ = {"eager_defaults": True}
 
     id: Mapped[str] = mapped_column(UUID(as_uuid=False), primary_key=True)
     residence_id: Mapped[str] = mapped_column(
@@ -324,6 +333,8 @@ class Resident(Base):
 
 class Device(Base):
     __tablename__ = "device"
+    # server defaults en el RETURNING del INSERT (sin refresh)
+    __mapper_args__ = {"eager_defaults": True}
 
     id: Mapped[str] = mapped_column(UUID(as_uuid=False), primary_key=True)
     residence_id: Mapped[str] = mapped_column(
@@ -403,6 +414,9 @@ class Device(Base):
 
 class Measurement(Base):
     __tablename__ = "measurement"
+    # Particionada por rango mensual de taken_at (ver init_database.py).
+    # Postgres exige que la PK incluya la clave de partición: PK (id, taken_at).
+    __table_args__ = {"postgresql_partition_by": "RANGE (taken_at)"}
 
     id: Mapped[str] = mapped_column(UUID(as_uuid=False), primary_key=True)
     residence_id: Mapped[str] = mapped_column(
@@ -437,7 +451,7 @@ class Measurement(Base):
     weight_kg: Mapped[Optional[float]]
     temperature_c: Mapped[Optional[float]]
 
-    taken_at: Mapped[datetime] = mapped_column(DateTime(timezone=True), nullable=False)
+    taken_at: Mapped[datetime] = mapped_column(DateTime(timezone=True), primary_key=True, nullable=False)
     created_at: Mapped[datetime] = mapped_column(DateTime(timezone=True), server_default=func.now())
     updated_at: Mapped[datetime] = mapped_column(DateTime(timezone=True), server_default=func.now())
 
@@ -659,6 +673,8 @@ class TaskApplication(Base):
 
 class Tag(Base):
     __tablename__ = "tag"
+    # server defaults en el RETURNING del INSERT (sin refresh)
+    __mapper_args__ = {"eager_defaults": True}
 
     id: Mapped[str] = mapped_column(UUID(as_uuid=False), primary_key=True)
     name: Mapped[str] = mapped_column(Text, unique=True, nullable=False)
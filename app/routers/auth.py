@@ -7,7 +7,7 @@ from sqlalchemy.ext.asyncio import AsyncSession
 
 from app.schemas import LoginRequest, TokenResponse
 from app.models import User
-from app.security import hash_alias, verify_password, create_access_token
+from app.security import hash_alias, verify_password_async, create_access_token
 from app.db import get_session_anon
 
 router = APIRouter(prefix="/auth", tags=["auth"])
@@ -26,7 +26,7 @@ async def login(
     )
     user = q.scalar_one_or_none()
 
-    if not user or not verify_password(data.password, user.password_hash):
+    if not user or not await verify_password_async(data.password, user.password_hash):
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
             detail="Invalid credentials",
@@ -43,36 +43,36 @@ router = APIRouter(prefix="/dashboard", tags=["dashboard"])
 
 async def apply_residence_context(db: AsyncSession, current: dict, residence_id: str | None):
     """Apply residence context for RLS"""
+    # Superadmin can see all - no residence context needed (ni comprobación ni GUC)
+    if current["role"] == "superadmin":
+        return
+
     if residence_id:
-        # User is filtering by specific residence - check access
-        if current["role"] != "superadmin":
-            result = await db.execute(
-                select(UserResidence).where(
-                    UserResidence.user_id == current["id"],
-                    UserResidence.residence_id == residence_id,
-                    UserResidence.deleted_at.is_(None)
-                )
+        # User is filtering by specific residence - check access y fijar contexto
+        # en la misma consulta (set_config solo se evalúa si existe la asignación)
+        ok = await db.scalar(
+            select(func.set_config("app.residence_id", residence_id, True))
+            .select_from(UserResidence)
+            .where(
+                UserResidence.user_id == current["id"],
+                UserResidence.residence_id == residence_id,
+                UserResidence.deleted_at.is_(None)
             )
-            if result.scalar_one_or_none() is None:
-                raise HTTPException(status_code=403, detail="Access denied to this residence")
-        await db.execute(text("SELECT set_config('app.residence_id', :rid, true)"), {"rid": residence_id})
+        )
+        if ok is None:
+            raise HTTPException(status_code=403, detail="Access denied to this residence")
     else:
-        # No specific residence_id - user can see their assigned residences or all if superadmin
-        if current["role"] != "superadmin":
-            # Get user's assigned residences
-            result = await db.execute(
-                select(UserResidence.residence_id).where(
-                    UserResidence.user_id == current["id"],
-                    UserResidence.deleted_at.is_(None)
-                )
+        # No specific residence_id - set context to first assigned residence
+        ok = await db.scalar(
+            select(func.set_config("app.residence_id", UserResidence.residence_id, True))
+            .where(
+                UserResidence.user_id == current["id"],
+                UserResidence.deleted_at.is_(None)
             )
-            user_residences = [row[0] for row in result.all()]
-            if user_residences:
-                # Set context to first assigned residence
-                await db.execute(text("SELECT set_config('app.residence_id', :rid, true)"), {"rid": user_residences[0]})
-            else:
-                raise HTTPException(status_code=403, detail="No residences assigned to user")
-        # Superadmin can see all - no residence context needed
+            .limit(1)
+        )
+        if ok is None:
+            raise HTTPException(status_code=403, detail="No residences assigned to user")
 
 async def get_resident_stats(db: AsyncSession, residence_id: str, days: int = 30) -> ResidentStats:
     """Get resident statistics"""
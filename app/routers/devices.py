@@ -6,13 +6,14 @@ from sqlalchemy import select, func, and_, or_, text
 from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.orm import selectinload
 
-from app.deps import get_db, get_current_user
+from app.deps import get_db, get_current_user, bind_residence_if_member
 from app.models import Device, Residence, User, UserResidence
 from app.schemas import (
     DeviceCreate, DeviceUpdate, DeviceOut,
     PaginationParams, PaginatedResponse, FilterParams
 )
-from app.security import new_uuid
+from app.security import new_uuid, decrypt_data
+from app.services.permission_service import PermissionService
 
 router = APIRouter(prefix="/devices", tags=["devices"])
 
@@ -21,17 +22,9 @@ router = APIRouter(prefix="/devices", tags=["devices"])
 async def apply_residence_context(db: AsyncSession, current: dict, residence_id: str | None):
     """Apply residence context for RLS"""
     if residence_id:
-        if current["role"] != "superadmin":
-            result = await db.execute(
-                select(UserResidence).where(
-                    UserResidence.user_id == current["id"],
-                    UserResidence.residence_id == residence_id,
-                )
-            )
-            if result.scalar_one_or_none() is None:
-                raise HTTPException(status_code=403, detail="Access denied to this residence")
-
-        await db.execute(text("SELECT set_config('app.residence_id', :rid, true)"), {"rid": residence_id})
+        # Superadmin no necesita comprobación ni GUC
+        if current["role"] != "superadmin" and not await bind_residence_if_member(db, current["id"], residence_id):
+            raise HTTPException(status_code=403, detail="Access denied to this residence")
     elif current["role"] != "superadmin":
         raise HTTPException(status_code=400, detail="Residence ID required for non-superadmin users")
 
@@ -67,8 +60,8 @@ async def paginate_query_devices(
                 Device.mac.ilike(search_term)
             ))
 
-    count_query = select(func.count()).select_from(query.subquery())
-    total = await db.scalar(count_query)
+    # Se guarda sin orden ni límite por si hace falta el COUNT de respaldo
+    count_source = query
 
     if pagination.sort_by:
         sort_field = getattr(Device, pagination.sort_by, Device.created_at)
@@ -78,11 +71,19 @@ async def paginate_query_devices(
     else:
         query = query.order_by(Device.created_at.desc())
 
-    offset = (pagination.page - 1) * pagination.size
-    query = query.offset(offset).limit(pagination.size)
-
-    result = await db.execute(query)
-    devices = result.scalars().all()
+    # Total en la misma consulta (count() OVER () se calcula antes del LIMIT)
+    query = query.add_columns(func.count().over().label("total_count"))
+    query = query.offset(pagination.offset).limit(pagination.size)
+
+    rows = (await db.execute(query)).all()
+    devices = [row[0] for row in rows]
+    if rows:
+        total = rows[0].total_count
+    elif pagination.offset:
+        # Página fuera de rango: no hay filas de las que leer el total
+        total = await db.scalar(select(func.count()).select_from(count_source.subquery()))
+    else:
+        total = 0
     
     # Agregar created_by_info y residence_info a cada dispositivo
     items = []
@@ -101,7 +102,6 @@ async def paginate_query_devices(
         
         # Obtener información del usuario creador
         if device.created_by:
-            from app.security import decrypt_data
             creator_result = await db.execute(
                 select(User.name, User.alias_encrypted).where(User.id == device.created_by)
             )
@@ -169,8 +169,6 @@ async def create_device(
     if existing:
         raise HTTPException(status_code=409, detail="Device MAC already exists in this residence")
 
-    await db.execute(text("SELECT set_config('app.user_id', :uid, true)"), {"uid": current["id"]})
-
     device = Device(
         id=new_uuid(),
         residence_id=residence_id,
@@ -180,10 +178,8 @@ async def create_device(
 
     db.add(device)
     await db.commit()
-    await db.refresh(device)
 
     # Obtener información del usuario creador
-    from app.security import decrypt_data
     created_by_info = None
     if device.created_by:
         creator_result = await db.execute(
@@ -271,19 +267,12 @@ async def get_device(
     device = await get_device_or_404(id, db)
 
     if current["role"] != "superadmin":
-        result = await db.execute(
-            select(UserResidence).where(
-                UserResidence.user_id == current["id"],
-                UserResidence.residence_id == device.residence_id,
-            )
-        )
-        if result.scalar_one_or_none() is None:
+        if not await PermissionService.is_assigned(db, current["id"], device.residence_id):
             raise HTTPException(status_code=403, detail="Access denied to this device")
 
     # Obtener información del usuario creador
     created_by_info = None
     if device.created_by:
-        from app.security import decrypt_data
         creator_result = await db.execute(
             select(User.name, User.alias_encrypted).where(User.id == device.created_by)
         )
@@ -332,13 +321,7 @@ async def update_device(
     device = await get_device_or_404(id, db)
 
     if current["role"] != "superadmin":
-        result = await db.execute(
-            select(UserResidence).where(
-                UserResidence.user_id == current["id"],
-                UserResidence.residence_id == device.residence_id,
-            )
-        )
-        if result.scalar_one_or_none() is None:
+        if not await PermissionService.is_assigned(db, current["id"], device.residence_id):
             raise HTTPException(status_code=403, detail="Access denied to this device")
 
     if data.mac and data.mac != device.mac:
@@ -353,19 +336,15 @@ async def update_device(
         if existing:
             raise HTTPException(status_code=409, detail="Device MAC already exists in this residence")
 
-    await db.execute(text("SELECT set_config('app.user_id', :uid, true)"), {"uid": current["id"]})
-
     update_data = data.dict(exclude_unset=True)
     for field, value in update_data.items():
         setattr(device, field, value)
 
     await db.commit()
-    await db.refresh(device)
 
     # Obtener información del usuario creador
     created_by_info = None
     if device.created_by:
-        from app.security import decrypt_data
         creator_result = await db.execute(
             select(User.name, User.alias_encrypted).where(User.id == device.created_by)
         )
@@ -413,17 +392,9 @@ async def delete_device(
     device = await get_device_or_404(id, db)
 
     if current["role"] != "superadmin":
-        result = await db.execute(
-            select(UserResidence).where(
-                UserResidence.user_id == current["id"],
-                UserResidence.residence_id == device.residence_id,
-            )
-        )
-        if result.scalar_one_or_none() is None:
+        if not await PermissionService.is_assigned(db, current["id"], device.residence_id):
             raise HTTPException(status_code=403, detail="Access denied to this device")
 
-    await db.execute(text("SELECT set_config('app.user_id', :uid, true)"), {"uid": current["id"]})
-
     device.deleted_at = func.now()
     await db.commit()
 
@@ -439,13 +410,7 @@ async def get_device_history(
     device = await get_device_or_404(id, db)
 
     if current["role"] != "superadmin":
-        result = await db.execute(
-            select(UserResidence).where(
-                UserResidence.user_id == current["id"],
-                UserResidence.residence_id == device.residence_id,
-            )
-        )
-        if result.scalar_one_or_none() is None:
+        if not await PermissionService.is_assigned(db, current["id"], device.residence_id):
             raise HTTPException(status_code=403, detail="Access denied to this device")
 
     result = await db.execute(
@@ -2,25 +2,58 @@
 from __future__ import annotations
 
 from fastapi import APIRouter, Depends, HTTPException, status, Header, Query
-from sqlalchemy import select, update, func, and_, or_
+from sqlalchemy import select, insert, update, exists, func, and_, or_, tuple_, literal, lambda_stmt, cast, Date
 from sqlalchemy.ext.asyncio import AsyncSession
-from datetime import datetime, date
+from sqlalchemy.orm import joinedload
+from datetime import datetime, date, timedelta, timezone
 from typing import List
 
-from app.deps import get_db, get_current_user
+from pydantic import TypeAdapter
+
+from app.deps import get_db, get_current_user, bind_inferred_residence
+from app.db import first_with_user_guc
+from app.cache import response_cache
 from app.security import new_uuid
 from app.models import (
     Measurement, Resident, Device, UserResidence, Bed, User
 )
 from app.schemas import (
     MeasurementCreate, MeasurementOut, MeasurementUpdate, MeasurementDailySummary,
-    PaginationParams, PaginatedResponse, FilterParams,
-    VoiceMeasurementTranscript, VoiceMeasurementResponse, VoiceMeasurementConfirm
+    PaginationParams, PaginatedResponse, FilterParams, MeasurementType, MeasurementTimeFilter, TIME_FILTER_DELTAS,
+    encode_cursor, decode_cursor,
+    VoiceMeasurementTranscript, VoiceMeasurementResponse, VoiceMeasurementConfirm,
+    VoiceMeasurementData, MeasurementValuesOut
 )
-from sqlalchemy import text
+from app.schemas.measurement import ResidentOption
+from app.services.voice_measurement_service import VoiceMeasurementService
+from sqlalchemy import table, column, literal_column, bindparam, DateTime
+from sqlalchemy.dialects.postgresql import UUID as PG_UUID
 
 router = APIRouter(prefix="/measurements", tags=["measurements"])
 
+# Ventana por defecto del listado paginado cuando no se indica date_from/date_to.
+# measurement está particionada por mes en taken_at: acotar el rango permite
+# al planner descartar particiones antiguas.
+DEFAULT_LIST_WINDOW = timedelta(days=30)
+
+# Validador reutilizable para listas de MeasurementOut (se construye una sola vez)
+_measurement_list_adapter = TypeAdapter(List[MeasurementOut])
+
+# measurement_history (versiones de cada medición, valid_from DESC). Consulta
+# construida una vez: mismo SQL en cada llamada -> asyncpg reutiliza el prepared statement.
+_measurement_history = table(
+    "measurement_history",
+    column("measurement_id", PG_UUID(as_uuid=False)),
+    column("valid_from", DateTime(timezone=True)),
+)
+_MEASUREMENT_HISTORY_QUERY = (
+    select(literal_column("*"))
+    .select_from(_measurement_history)
+    .where(_measurement_history.c.measurement_id == bindparam("measurement_id"))
+    .order_by(_measurement_history.c.valid_from.desc())
+    .limit(bindparam("limit"))
+)
+
 # -------------------- helpers --------------------
 
 async def apply_residence_context_or_infer(
@@ -39,6 +72,14 @@ async def apply_residence_context_or_infer(
     """
     rid = residence_id
 
+    # Sin residencia explícita y no superadmin: inferir, validar y fijar contexto
+    # en un único round-trip
+    if not rid and current["role"] != "superadmin":
+        if resident_id:
+            return await bind_inferred_residence(db, current, Resident, resident_id, "Resident not found")
+        if device_id:
+            return await bind_inferred_residence(db, current, Device, device_id, "Device not found")
+
     # Inferir por residente
     if not rid and resident_id:
         rid = await db.scalar(
@@ -67,21 +108,23 @@ async def apply_residence_context_or_infer(
             detail="Select a residence (send residence_id or include resident_id/device_id to infer)"
         )
 
-    # Validar pertenencia (salvo superadmin)
+    # Validar pertenencia (salvo superadmin) y fijar contexto en la misma consulta:
+    # set_config solo se evalúa si existe la fila de user_residence, así que no
+    # hace falta un round-trip aparte para el GUC. Superadmin no necesita ninguno.
     if rid and current["role"] != "superadmin":
-        ok = await db.execute(
-            select(UserResidence).where(
+        # app.user_id va en la misma consulta (first_with_user_guc)
+        ok = await first_with_user_guc(
+            db,
+            select(func.set_config("app.residence_id", rid, True))
+            .select_from(UserResidence)
+            .where(
                 UserResidence.user_id == current["id"],
                 UserResidence.residence_id == rid,
             )
         )
-        if ok.scalar_one_or_none() is None:
+        if ok is None:
             raise HTTPException(status_code=403, detail="Residence not allowed for this user")
 
-    # Fijar contexto
-    if rid:
-        await db.execute(text("SELECT set_config('app.residence_id', :rid, true)"), {"rid": rid})
-
     return rid
 
 def _check_measurement_fields_by_type(payload: MeasurementCreate | MeasurementUpdate):
@@ -114,9 +157,48 @@ def _can_edit_delete(current: dict, recorder_id: str, role_manager_label: str =
     # professional: solo lo suyo
     return current["id"] == recorder_id
 
+def _day_start(day: date):
+    """
+    Inicio del día para filtrar taken_at por rango y no con func.date(). El cast
+    date -> timestamptz se hace en SQL para usar el TimeZone de la sesión, igual
+    que func.date(taken_at).
+    """
+    return cast(literal(day, Date), DateTime(timezone=True))
+
+def _build_measurement_outs(rows) -> List[MeasurementOut]:
+    """
+    Construye MeasurementOut a partir de filas (Measurement, resident_full_name,
+    bed_name, recorded_by_name, device_name).
+    """
+    measurements = []
+    for measurement, resident_full_name, bed_name, recorded_by_name, device_name in rows:
+        measurements.append(MeasurementOut.model_construct(
+            id=measurement.id,
+            residence_id=measurement.residence_id,
+            resident_id=measurement.resident_id,
+            resident_full_name=resident_full_name,
+            bed_name=bed_name,
+            recorded_by=measurement.recorded_by,
+            recorded_by_name=recorded_by_name,  # Nombre del profesional/gestor
+            source=measurement.source,
+            device_id=measurement.device_id,
+            device_name=device_name,  # Nombre del dispositivo
+            type=measurement.type,
+            systolic=measurement.systolic,
+            diastolic=measurement.diastolic,
+            pulse_bpm=measurement.pulse_bpm,
+            spo2=measurement.spo2,
+            weight_kg=measurement.weight_kg,
+            temperature_c=measurement.temperature_c,
+            taken_at=measurement.taken_at,
+            created_at=measurement.created_at,
+            updated_at=measurement.updated_at,
+            deleted_at=measurement.deleted_at,
+        ))
+    return measurements
+
 async def get_measurement_or_404(measurement_id: str, db: AsyncSession) -> Measurement:
     """Get measurement by ID or raise 404"""
-    from sqlalchemy.orm import joinedload
 
     result = await db.execute(
         select(Measurement)
@@ -165,8 +247,7 @@ async def paginate_query_measurements(
     else:
         query = query.order_by(Measurement.taken_at.desc())
 
-    offset = (pagination.page - 1) * pagination.size
-    query = query.offset(offset).limit(pagination.size)
+    query = query.offset(pagination.offset).limit(pagination.size)
 
     result = await db.execute(query)
     
@@ -236,27 +317,27 @@ async def create_measurement(
 
     # Coherencia de residente y (opcional) dispositivo dentro de la residencia
     res_ok = await db.scalar(
-        select(Resident.id).where(
+        select(exists().where(
             Resident.id == payload.resident_id,
             Resident.residence_id == rid,
             Resident.deleted_at.is_(None),
-        )
+        ))
     )
     if not res_ok:
         raise HTTPException(status_code=400, detail="Resident does not belong to selected residence")
 
     if payload.device_id:
         dev_ok = await db.scalar(
-            select(Device.id).where(
+            select(exists().where(
                 Device.id == payload.device_id,
                 Device.residence_id == rid,
                 Device.deleted_at.is_(None),
-            )
+            ))
         )
         if not dev_ok:
             raise HTTPException(status_code=400, detail="Device does not belong to selected residence")
 
-    m = Measurement(
+    stmt = insert(Measurement).values(
         id=new_uuid(),
         residence_id=rid,
         resident_id=payload.resident_id,
@@ -271,11 +352,12 @@ async def create_measurement(
         weight_kg=payload.weight_kg,
         temperature_c=payload.temperature_c,
         taken_at=payload.taken_at,
-    )
-    db.add(m)
+    ).returning(*Measurement.__table__.c)
+    # RETURNING trae los server defaults (created_at/updated_at) sin un refresh posterior
+    row = (await db.execute(stmt)).mappings().one()
     await db.commit()
-    await db.refresh(m)
-    return m
+    await response_cache.invalidate("measurements")
+    return MeasurementOut.model_construct(**row)
 
 @router.get("/", response_model=PaginatedResponse[MeasurementOut])
 async def list_measurements(
@@ -287,7 +369,10 @@ async def list_measurements(
     resident_id: str | None = Query(None),
 ) -> PaginatedResponse[MeasurementOut]:
     """
-    List measurements with pagination and filters
+    List measurements with pagination and filters.
+
+    Sin date_from ni date_to se devuelven solo los últimos 30 días
+    (DEFAULT_LIST_WINDOW); envía date_from para consultar más atrás.
     """
     rid = await apply_residence_context_or_infer(db, current, residence_id, resident_id=resident_id)
 
@@ -316,6 +401,10 @@ async def list_measurements(
     if resident_id:
         query = query.where(Measurement.resident_id == resident_id)
 
+    # Sin rango explícito, acotar a la ventana por defecto (poda de particiones)
+    if not filters.date_from and not filters.date_to:
+        query = query.where(Measurement.taken_at >= datetime.now(timezone.utc) - DEFAULT_LIST_WINDOW)
+
     # Apply filters from FilterParams
     if filters:
         if filters.date_from:
@@ -376,10 +465,13 @@ async def paginate_query_daily_summary(
     
     # Apply filters
     if filter_params:
+        # Rangos sobre taken_at (no func.date) para poder usar el índice
         if filter_params.date_from:
-            query = query.where(func.date(Measurement.taken_at) >= filter_params.date_from.date())
+            query = query.where(Measurement.taken_at >= _day_start(filter_params.date_from.date()))
         if filter_params.date_to:
-            query = query.where(func.date(Measurement.taken_at) <= filter_params.date_to.date())
+            query = query.where(
+                Measurement.taken_at < _day_start(filter_params.date_to.date() + timedelta(days=1))
+            )
         if filter_params.search:
             search_term = f"%{filter_params.search}%"
             query = query.where(Resident.full_name.ilike(search_term))
@@ -389,8 +481,7 @@ async def paginate_query_daily_summary(
     total = await db.scalar(count_query)
     
     # Apply pagination
-    offset = (pagination.page - 1) * pagination.size
-    query = query.offset(offset).limit(pagination.size)
+    query = query.offset(pagination.offset).limit(pagination.size)
     
     # Execute query
     result = await db.execute(query)
@@ -489,6 +580,7 @@ async def get_measurements_by_day(
         target_date = datetime.strptime(date, "%Y-%m-%d").date()
     except ValueError:
         raise HTTPException(status_code=400, detail="date debe estar en formato YYYY-MM-DD")
+
     
     # Construir query con JOINs para obtener datos completos incluyendo nombres
     query = select(
@@ -508,7 +600,8 @@ async def get_measurements_by_day(
     ).where(
         and_(
             Measurement.resident_id == resident_id,
-            func.date(Measurement.taken_at) == target_date,
+            Measurement.taken_at >= _day_start(target_date),
+            Measurement.taken_at < _day_start(target_date + timedelta(days=1)),
             Measurement.deleted_at.is_(None),
             Resident.deleted_at.is_(None),
             User.deleted_at.is_(None)  # Solo usuarios activos
@@ -519,36 +612,8 @@ async def get_measurements_by_day(
     result = await db.execute(query)
     rows = result.all()
     
-    # Convertir a objetos MeasurementOut con nombres completos
-    measurements = []
-    for row in rows:
-        measurement, resident_full_name, bed_name, recorded_by_name, device_name = row
-        measurement_dict = {
-            "id": measurement.id,
-            "residence_id": measurement.residence_id,
-            "resident_id": measurement.resident_id,
-            "resident_full_name": resident_full_name,
-            "bed_name": bed_name,
-            "recorded_by": measurement.recorded_by,
-            "recorded_by_name": recorded_by_name,  # Nombre del profesional/gestor
-            "source": measurement.source,
-            "device_id": measurement.device_id,
-            "device_name": device_name,  # Nombre del dispositivo
-            "type": measurement.type,
-            "systolic": measurement.systolic,
-            "diastolic": measurement.diastolic,
-            "pulse_bpm": measurement.pulse_bpm,
-            "spo2": measurement.spo2,
-            "weight_kg": measurement.weight_kg,
-            "temperature_c": measurement.temperature_c,
-            "taken_at": measurement.taken_at,
-            "created_at": measurement.created_at,
-            "updated_at": measurement.updated_at,
-            "deleted_at": measurement.deleted_at
-        }
-        measurements.append(MeasurementOut(**measurement_dict))
-    
-    return measurements
+    # Convertir a objetos MeasurementOut
+    return _build_measurement_outs(rows)
 
 @router.get("/residents/{resident_id}/measurements", response_model=List[MeasurementOut])
 async def get_resident_measurements_by_type(
@@ -606,36 +671,8 @@ async def get_resident_measurements_by_type(
     result = await db.execute(query)
     rows = result.all()
     
-    # Convertir a objetos MeasurementOut con nombres completos
-    measurements = []
-    for row in rows:
-        measurement, resident_full_name, bed_name, recorded_by_name, device_name = row
-        measurement_dict = {
-            "id": measurement.id,
-            "residence_id": measurement.residence_id,
-            "resident_id": measurement.resident_id,
-            "resident_full_name": resident_full_name,
-            "bed_name": bed_name,
-            "recorded_by": measurement.recorded_by,
-            "recorded_by_name": recorded_by_name,  # Nombre del profesional/gestor
-            "source": measurement.source,
-            "device_id": measurement.device_id,
-            "device_name": device_name,  # Nombre del dispositivo
-            "type": measurement.type,
-            "systolic": measurement.systolic,
-            "diastolic": measurement.diastolic,
-            "pulse_bpm": measurement.pulse_bpm,
-            "spo2": measurement.spo2,
-            "weight_kg": measurement.weight_kg,
-            "temperature_c": measurement.temperature_c,
-            "taken_at": measurement.taken_at,
-            "created_at": measurement.created_at,
-            "updated_at": measurement.updated_at,
-            "deleted_at": measurement.deleted_at
-        }
-        measurements.append(MeasurementOut(**measurement_dict))
-    
-    return measurements
+    # Convertir a objetos MeasurementOut
+    return _build_measurement_outs(rows)
 
 # -------------------- ENDPOINTS GENÉRICOS --------------------
 
@@ -713,39 +750,95 @@ async def update_measurement(
     current = Depends(get_current_user),
     residence_id: str | None = Query(None, description="Filter by residence ID"),
 ):
-    """Update a measurement"""
-    measurement = await get_measurement_or_404(measurement_id, db)
+    """
+    Update a measurement.
+    Carga, permisos, pertenencia a la residencia y validación del dispositivo van
+    dentro de un único UPDATE ... RETURNING. Solo si no se actualiza ninguna fila
+    se consulta de nuevo para distinguir 404 / 403 / 400.
+    """
+    conditions = [Measurement.id == measurement_id, Measurement.deleted_at.is_(None)]
 
-    # Contexto/validación de residencia
-    rid = await apply_residence_context_or_infer(db, current, residence_id, resident_id=measurement.resident_id)
+    if residence_id:
+        conditions.append(Measurement.residence_id == residence_id)
 
-    # Permisos: superadmin/manager cualquiera; professional solo si es suyo
-    if not _can_edit_delete(current, measurement.recorded_by):
-        raise HTTPException(status_code=403, detail="You cannot edit this measurement")
+    # Pertenencia a la residencia (salvo superadmin)
+    if current["role"] != "superadmin":
+        conditions.append(exists().where(
+            UserResidence.user_id == current["id"],
+            UserResidence.residence_id == Measurement.residence_id,
+        ))
 
-    # Validación de tipo si lo cambia (normalmente no se cambia el tipo)
-    if payload.type is not None and payload.type != measurement.type:
-        _check_measurement_fields_by_type(payload)
+    # Permisos: superadmin/manager cualquiera; professional solo si es suyo
+    if current["role"] not in ("superadmin", "manager"):
+        conditions.append(Measurement.recorded_by == current["id"])
 
     # Validar device si lo cambian
     if payload.device_id:
-        dev_ok = await db.scalar(
-            select(Device.id).where(
-                Device.id == payload.device_id,
-                Device.residence_id == rid,
-                Device.deleted_at.is_(None),
-            )
+        conditions.append(exists().where(
+            Device.id == payload.device_id,
+            Device.residence_id == Measurement.residence_id,
+            Device.deleted_at.is_(None),
+        ))
+
+    update_data = payload.model_dump(exclude_unset=True)
+    stmt = (
+        update(Measurement)
+        .where(*conditions)
+        .values(**update_data, updated_at=func.now())
+        .returning(*Measurement.__table__.c)
+    )
+
+    # Camino rápido: el tipo no cambia (lo normal), así que no hay que validar
+    # los campos contra el tipo nuevo
+    fast_stmt = stmt.where(Measurement.type == payload.type) if payload.type is not None else stmt
+    row = (await db.execute(fast_stmt)).mappings().one_or_none()
+
+    if row is None:
+        # Diagnóstico en una sola consulta, en el mismo orden que antes:
+        # 404 -> 403 residencia -> 403 rol -> 400
+        member_q = exists().where(
+            UserResidence.user_id == current["id"],
+            UserResidence.residence_id == Measurement.residence_id,
         )
-        if not dev_ok:
+        device_q = exists().where(
+            Device.id == payload.device_id,
+            Device.residence_id == Measurement.residence_id,
+            Device.deleted_at.is_(None),
+        ) if payload.device_id else literal(True)
+        existing = (await db.execute(
+            select(
+                Measurement.residence_id,
+                Measurement.type,
+                Measurement.recorded_by,
+                member_q.label("is_member"),
+                device_q.label("device_ok"),
+            ).where(
+                Measurement.id == measurement_id,
+                Measurement.deleted_at.is_(None),
+            )
+        )).one_or_none()
+        if existing is None or (residence_id and existing.residence_id != residence_id):
+            raise HTTPException(status_code=404, detail="Measurement not found")
+        if current["role"] != "superadmin" and not existing.is_member:
+            raise HTTPException(status_code=403, detail="Residence not allowed for this user")
+        if not _can_edit_delete(current, existing.recorded_by):
+            raise HTTPException(status_code=403, detail="You cannot edit this measurement")
+
+        # Validación de tipo si lo cambia (normalmente no se cambia el tipo)
+        if payload.type is not None and payload.type != existing.type:
+            _check_measurement_fields_by_type(payload)
+
+        if not existing.device_ok:
             raise HTTPException(status_code=400, detail="Device does not belong to selected residence")
 
-    update_data = payload.dict(exclude_unset=True)
-    for field, value in update_data.items():
-        setattr(measurement, field, value)
+        # Cambio de tipo válido: se aplica sin la condición del camino rápido
+        row = (await db.execute(stmt)).mappings().one_or_none()
+        if row is None:
+            raise HTTPException(status_code=404, detail="Measurement not found")
 
     await db.commit()
-    await db.refresh(measurement)
-    return measurement
+    await response_cache.invalidate("measurements")
+    return MeasurementOut.model_construct(**row)
 
 @router.patch("/{measurement_id}", response_model=MeasurementOut)
 async def patch_measurement(
@@ -777,6 +870,7 @@ async def delete_measurement(
         update(Measurement).where(Measurement.id == measurement_id).values(deleted_at=func.now(), updated_at=func.now())
     )
     await db.commit()
+    await response_cache.invalidate("measurements")
 
 # -------------------- Additional Endpoints --------------------
 
@@ -787,8 +881,9 @@ async def get_measurements_by_resident(
     current = Depends(get_current_user),
     pagination: PaginationParams = Depends(),
     residence_id: str | None = Query(None, description="Filter by residence ID"),
-    type: str | None = Query(None, description="Filter by measurement type: bp|spo2|weight|temperature"),
-    time_filter: str = Query("all", description="Time filter: 7d|15d|30d|1y|all"),
+    type: MeasurementType | None = Query(None, description="Filter by measurement type: bp|spo2|weight|temperature"),
+    time_filter: MeasurementTimeFilter = Query("all", description="Time filter: 7d|15d|30d|1y|all"),
+    cursor: str | None = Query(None, description="Cursor de la página siguiente (next_cursor de la respuesta anterior)"),
 ) -> PaginatedResponse[MeasurementOut]:
     """
     Get measurements for a specific resident with time filters.
@@ -799,31 +894,29 @@ async def get_measurements_by_resident(
     - 30d: Last 30 days
     - 1y: Last year
     - all: All measurements
+
+    Paginación keyset sobre (taken_at, id) DESC: si llega `cursor` se ignora
+    `page` y se continúa tras la última fila de la página anterior, sin OFFSET.
     """
-    from datetime import datetime, timedelta
-    
-    # Validate time filter
-    valid_filters = ["7d", "15d", "30d", "1y", "all"]
-    if time_filter not in valid_filters:
-        raise HTTPException(status_code=400, detail=f"Invalid time_filter. Must be one of: {valid_filters}")
-    
+    # type y time_filter ya llegan validados por FastAPI (Literal -> 422 si no encajan)
+
     # Apply residence context
     rid = await apply_residence_context_or_infer(db, current, residence_id, resident_id=resident_id)
     
     # Validate resident exists and belongs to residence
-    resident_check = await db.scalar(
-        select(Resident.id).where(
+    resident_check = await db.scalar(lambda_stmt(
+        lambda: select(exists().where(
             Resident.id == resident_id,
             Resident.residence_id == rid,
             Resident.deleted_at.is_(None)
-        )
-    )
+        ))
+    ))
     if not resident_check:
         raise HTTPException(status_code=404, detail="Resident not found or not accessible")
     
     # Build base query with resident name and bed name
     query = select(
-        Measurement,
+        *Measurement.__table__.c,
         Resident.full_name.label("resident_full_name"),
         Bed.name.label("bed_name")
     ).join(
@@ -838,65 +931,46 @@ async def get_measurements_by_resident(
     )
     
     # Apply time filter
-    if time_filter != "all":
-        now = datetime.utcnow()
-        time_deltas = {
-            "7d": timedelta(days=7),
-            "15d": timedelta(days=15),
-            "30d": timedelta(days=30),
-            "1y": timedelta(days=365)
-        }
-        date_from = now - time_deltas[time_filter]
+    time_delta = TIME_FILTER_DELTAS.get(time_filter)  # None para "all"
+    if time_delta is not None:
+        date_from = datetime.now(timezone.utc) - time_delta
         query = query.where(Measurement.taken_at >= date_from)
     
     # Apply type filter
     if type:
-        if type not in ["bp", "spo2", "weight", "temperature"]:
-            raise HTTPException(status_code=400, detail="Invalid type. Must be: bp|spo2|weight|temperature")
         query = query.where(Measurement.type == type)
     
-    # Order by most recent first
-    query = query.order_by(Measurement.taken_at.desc())
-    
-    # Custom pagination to handle the join
-    count_query = select(func.count()).select_from(query.subquery())
-    total = await db.scalar(count_query)
+    # Order by most recent first (id desempata para que el cursor sea estable)
+    query = query.order_by(Measurement.taken_at.desc(), Measurement.id.desc())
     
-    offset = (pagination.page - 1) * pagination.size
-    result = await db.execute(query.offset(offset).limit(pagination.size))
+    # Total solo bajo demanda (with_total) y nunca en modo cursor: el COUNT
+    # re-ejecuta todo el join y has_next ya sale de la fila extra.
+    total = None
+    if pagination.with_total and not cursor:
+        count_query = select(func.count()).select_from(query.subquery())
+        total = await db.scalar(count_query)
     
-    items = []
-    for row in result.all():
-        measurement, resident_full_name, bed_name = row
-        
-        # Build item dictionary with resident name and bed name
-        item_dict = {
-            "id": measurement.id,
-            "residence_id": measurement.residence_id,
-            "resident_id": measurement.resident_id,
-            "resident_full_name": resident_full_name,
-            "bed_name": bed_name,
-            "recorded_by": measurement.recorded_by,
-            "source": measurement.source,
-            "device_id": measurement.device_id,
-            "type": measurement.type,
-            "systolic": measurement.systolic,
-            "diastolic": measurement.diastolic,
-            "pulse_bpm": measurement.pulse_bpm,
-            "spo2": measurement.spo2,
-            "weight_kg": measurement.weight_kg,
-            "temperature_c": measurement.temperature_c,
-            "taken_at": measurement.taken_at,
-            "created_at": measurement.created_at,
-            "updated_at": measurement.updated_at,
-            "deleted_at": measurement.deleted_at
-        }
-        items.append(item_dict)
+    if cursor:
+        cursor_taken_at, cursor_id = decode_cursor(cursor)
+        query = query.where(tuple_(Measurement.taken_at, Measurement.id) < tuple_(
+            literal(cursor_taken_at, Measurement.taken_at.type),
+            literal(cursor_id, Measurement.id.type),
+        ))
+    else:
+        query = query.offset(pagination.offset)
+
+    # Se pide una fila de más para saber si hay página siguiente
+    rows = (await db.execute(query.limit(pagination.size + 1))).mappings().all()
+    has_next = len(rows) > pagination.size
+    rows = rows[:pagination.size]
+    next_cursor = encode_cursor(rows[-1]["taken_at"], rows[-1]["id"]) if has_next else None
+
+    # Validación de la página completa en una sola llamada al core de Pydantic
+    items = _measurement_list_adapter.validate_python(rows)
     
     # Calculate pagination metadata
-    pages = (total + pagination.size - 1) // pagination.size
-    has_next = pagination.page < pages
-    has_prev = pagination.page > 1
+    pages = (total + pagination.size - 1) // pagination.size if total is not None else None
+    has_prev = cursor is not None or pagination.page > 1
     
     return PaginatedResponse(
         items=items,
@@ -905,7 +979,8 @@ async def get_measurements_by_resident(
         size=pagination.size,
         pages=pages,
         has_next=has_next,
-        has_prev=has_prev
+        has_prev=has_prev,
+        next_cursor=next_cursor
     )
 
 @router.get("/{measurement_id}/history", response_model=list[dict])
@@ -914,23 +989,31 @@ async def get_measurement_history(
     db: AsyncSession = Depends(get_db),
     current = Depends(get_current_user),
     residence_id: str | None = Query(None, description="Filter by residence ID"),
+    limit: int = Query(50, ge=1, le=500, description="Máximo de versiones a devolver"),
+    before: datetime | None = Query(None, description="Cursor: valid_from de la última versión recibida"),
 ):
-    """Get measurement history"""
-    measurement = await get_measurement_or_404(measurement_id, db)
+    """
+    Get measurement history (más reciente primero).
+    Paginado por keyset sobre valid_from: para la página siguiente se envía
+    `before` con el valid_from de la última fila recibida.
+    """
+    resident_id = await db.scalar(
+        select(Measurement.resident_id).where(
+            Measurement.id == measurement_id,
+            Measurement.deleted_at.is_(None),
+        )
+    )
+    if not resident_id:
+        raise HTTPException(status_code=404, detail="Measurement not found")
 
-    await apply_residence_context_or_infer(db, current, residence_id, resident_id=measurement.resident_id)
+    await apply_residence_context_or_infer(db, current, residence_id, resident_id=resident_id)
 
-    result = await db.execute(
-        text("""
-            SELECT h.*
-            FROM measurement_history h
-            WHERE h.measurement_id = :measurement_id
-            ORDER BY h.valid_from DESC
-        """),
-        {"measurement_id": measurement_id}
-    )
+    query = _MEASUREMENT_HISTORY_QUERY
+    if before is not None:
+        query = query.where(_measurement_history.c.valid_from < before)
 
-    return [dict(row._mapping) for row in result.fetchall()]
+    result = await db.execute(query, {"measurement_id": measurement_id, "limit": limit})
+    return result.mappings().all()
 
 
 # -------------------- ENDPOINTS DE VOZ --------------------
@@ -950,9 +1033,6 @@ async def process_voice_measurement(
     - "Peso de Pedro López 75 kilos"
     - "Temperatura de Ana Martínez 36.5"
     """
-    from app.services.voice_measurement_service import VoiceMeasurementService
-    from app.schemas import VoiceMeasurementResponse, VoiceMeasurementData, MeasurementValuesOut
-    from datetime import datetime, timezone
 
     # Validar residencia
     residence_id = await apply_residence_context_or_infer(db, current, payload.residence_id)
@@ -993,7 +1073,6 @@ async def process_voice_measurement(
 
     # Si hay ambigüedad en el residente
     if resident_result[2]:  # options list
-        from app.schemas.measurement import ResidentOption
         return VoiceMeasurementResponse(
             status="ambiguous",
             message="Hay múltiples residentes con ese nombre",
@@ -1044,6 +1123,7 @@ async def process_voice_measurement(
 
     db.add(new_measurement)
     await db.commit()
+    await response_cache.invalidate("measurements")
     await db.refresh(new_measurement)
 
     # Generar mensaje de confirmación
@@ -1083,9 +1163,6 @@ async def confirm_voice_measurement(
     Confirma y registra una medición después de resolver ambigüedad.
     Se usa cuando el usuario selecciona manualmente el residente correcto.
     """
-    from app.services.voice_measurement_service import VoiceMeasurementService
-    from app.schemas import VoiceMeasurementResponse, VoiceMeasurementData, MeasurementValuesOut
-    from datetime import datetime, timezone
 
     # Validar residencia
     residence_id = await apply_residence_context_or_infer(db, current, payload.residence_id)
@@ -1148,6 +1225,7 @@ async def confirm_voice_measurement(
 
     db.add(new_measurement)
     await db.commit()
+    await response_cache.invalidate("measurements")
     await db.refresh(new_measurement)
 
     # Generar mensaje de confirmación
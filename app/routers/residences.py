@@ -1,24 +1,27 @@
 # app/routers/residences.py
 from __future__ import annotations
 
-import bcrypt
-
 from fastapi import APIRouter, Depends, HTTPException, status, Query, Body
-from sqlalchemy import select, func, and_, or_, text
+from sqlalchemy import select, update, delete, exists, func, and_, or_, literal, lambda_stmt, tuple_
+from sqlalchemy.dialects.postgresql import insert as pg_insert
 from sqlalchemy.ext.asyncio import AsyncSession
-from sqlalchemy.orm import selectinload
+from sqlalchemy.orm import aliased, selectinload
 
 from app.deps import get_db, get_current_user
+from app.cache import response_cache
 from app.models import Residence, User, UserResidence
 from app.schemas import (
     ResidenceCreate, ResidenceUpdate, ResidenceOut,
-    PaginationParams, PaginatedResponse, FilterParams,
+    PaginationParams, PaginatedResponse, FilterParams, encode_cursor, decode_cursor,
     UserCreate, UserOut, UserResidenceAssignment,
 )
-from app.security import new_uuid, decrypt_data, encrypt_data, hash_alias
+from app.security import new_uuid, encrypt_data, hash_alias
 from app.services.permission_service import PermissionService
 
 router = APIRouter(prefix="/residences", tags=["residences"])
+
+# Tope de filas para los listados sin paginar (/mine, /{id}/users)
+MAX_UNPAGINATED_ROWS = 500
 # Los endpoints de usuarios ahora están en app/routers/users.py
 
 # -------------------- Helper Functions --------------------
@@ -33,31 +36,60 @@ async def get_residence_or_404(id: str, db: AsyncSession) -> Residence:
         raise HTTPException(status_code=404, detail="Residence not found")
     return residence
 
-async def apply_residence_context(db: AsyncSession, current: dict, residence_id: str | None):
-    """Apply residence context for RLS"""
-    if residence_id:
-        if current["role"] != "superadmin":
-            # Check if user has access to this residence
-            result = await db.execute(
-                select(UserResidence).where(
-                    UserResidence.user_id == current["id"],
-                    UserResidence.residence_id == residence_id,
-                )
-            )
-            if result.scalar_one_or_none() is None:
-                raise HTTPException(status_code=403, detail="Access denied to this residence")
+async def get_accessible_residence_or_404(id: str, db: AsyncSession, current: dict) -> Residence:
+    """
+    Get residence by ID comprobando el acceso en la misma consulta:
+    404 si no existe, 403 si el usuario no está asignado (salvo superadmin).
+    """
+    if current["role"] == "superadmin":
+        return await get_residence_or_404(id, db)
 
-        await db.execute(text("SELECT set_config('app.residence_id', :rid, true)"), {"rid": residence_id})
-    elif current["role"] != "superadmin":
-        raise HTTPException(status_code=400, detail="Residence ID required for non-superadmin users")
+    has_access = exists().where(
+        UserResidence.user_id == current["id"],
+        UserResidence.residence_id == Residence.id,
+    )
+    row = (await db.execute(
+        select(Residence, has_access).where(Residence.id == id, Residence.deleted_at.is_(None))
+    )).one_or_none()
+    if row is None:
+        raise HTTPException(status_code=404, detail="Residence not found")
+    residence, allowed = row
+    if not allowed:
+        raise HTTPException(status_code=403, detail="Access denied to this residence")
+    return residence
+
+async def ensure_residence_access(id: str, db: AsyncSession, current: dict) -> None:
+    """
+    Igual que get_accessible_residence_or_404 pero sin cargar la residencia:
+    para endpoints que solo necesitan saber que existe y que hay acceso.
+    """
+    residence_exists = exists().where(Residence.id == id, Residence.deleted_at.is_(None))
+    if current["role"] == "superadmin":
+        found, allowed = await db.scalar(select(residence_exists)), True
+    else:
+        has_access = exists().where(
+            UserResidence.user_id == current["id"],
+            UserResidence.residence_id == id,
+        )
+        found, allowed = (await db.execute(select(residence_exists, has_access))).one()
+    if not found:
+        raise HTTPException(status_code=404, detail="Residence not found")
+    if not allowed:
+        raise HTTPException(status_code=403, detail="Access denied to this residence")
 
 async def paginate_query(
     query,
     db: AsyncSession,
     pagination: PaginationParams,
-    filter_params: FilterParams = None
+    filter_params: FilterParams = None,
+    cursor: str | None = None,
 ) -> PaginatedResponse:
-    """Apply pagination and filters to a query"""
+    """
+    Apply pagination and filters to a query.
+    Con el orden por defecto (created_at DESC) la respuesta incluye next_cursor:
+    si llega `cursor` se pagina por keyset sobre (created_at, id) DESC en vez de
+    OFFSET y se ignoran page y sort_by.
+    """
 
     # Apply filters
     if filter_params:
@@ -65,53 +97,81 @@ async def paginate_query(
             query = query.where(Residence.created_at >= filter_params.date_from)
         if filter_params.date_to:
             query = query.where(Residence.created_at <= filter_params.date_to)
-        if getattr(filter_params, 'search', None):
-            search_term = f"%{getattr(filter_params, 'search', '')}%"
+        if filter_params.search:
+            search_term = f"%{filter_params.search}%"
             query = query.where(or_(
                 Residence.name.ilike(search_term),
                 Residence.address.ilike(search_term)
             ))
 
-    # Get total count
-    count_query = select(func.count()).select_from(query.subquery())
-    total = await db.scalar(count_query)
+    # Se guarda sin orden ni límite por si hace falta el COUNT de respaldo
+    count_source = query
+
+    # Keyset posible solo con el orden por defecto (el de idx_residence_created_keyset)
+    keyset = cursor is not None or pagination.sort_by is None or (
+        pagination.sort_by == 'created_at' and pagination.sort_order == 'desc'
+    )
 
     # Apply sorting
-    if pagination.sort_by:
+    if keyset:
+        # id desempata para que el cursor sea estable
+        query = query.order_by(Residence.created_at.desc(), Residence.id.desc())
+    else:
         sort_field = getattr(Residence, pagination.sort_by, Residence.created_at)
         if pagination.sort_order == 'desc':
             sort_field = sort_field.desc()
         query = query.order_by(sort_field)
-    else:
-        query = query.order_by(Residence.created_at.desc())
 
     # Apply pagination
-    offset = (pagination.page - 1) * pagination.size
-    query = query.offset(offset).limit(pagination.size)
-
-    # Execute query
+    if cursor:
+        cursor_created_at, cursor_id = decode_cursor(cursor)
+        query = query.where(tuple_(Residence.created_at, Residence.id) < tuple_(
+            literal(cursor_created_at, Residence.created_at.type),
+            literal(cursor_id, Residence.id.type),
+        ))
+        query = query.limit(pagination.size + 1)
+    else:
+        query = query.offset(pagination.offset).limit(pagination.size + 1)
+
+    # Solo las columnas de ResidenceOut (+ created_at para el cursor): sin hidratar ORM
+    # ni descifrar teléfono/email, que el response_model no expone
+    columns = [Residence.id, Residence.name, Residence.address, Residence.created_at]
+    # Sin total en modo cursor: el filtro keyset lo falsearía
+    with_total = pagination.with_total and not cursor
+    if with_total:
+        # Total en la misma consulta (count() OVER () se calcula antes del LIMIT)
+        columns.append(func.count().over().label("_total"))
+    query = query.with_only_columns(*columns)
+
+    # Execute query (una fila de más indica si hay página siguiente)
     result = await db.execute(query)
-    items = []
-    for row in result.scalars().all():
-        # Desencriptar datos de contacto
-        phone = decrypt_data(row.phone_encrypted) if row.phone_encrypted else 'No especificado'
-        email = decrypt_data(row.email_encrypted) if row.email_encrypted else 'No especificado'
-
-        item = {
-            'id': row.id,
-            'name': row.name,
-            'address': row.address,
-            'phone': phone,
-            'email': email,
-            'created_at': row.created_at,
-            'updated_at': row.updated_at
-        }
-        items.append(item)
+    rows = result.mappings().all()
+    has_next = len(rows) > pagination.size
+    # Datos de la BD: model_construct sin revalidar (el response_model ya serializa)
+    items = [
+        ResidenceOut.model_construct(id=row["id"], name=row["name"], address=row["address"])
+        for row in rows[:pagination.size]
+    ]
+
+    next_cursor = None
+    if keyset and has_next and rows[pagination.size - 1]["created_at"] is not None:
+        last = rows[pagination.size - 1]
+        next_cursor = encode_cursor(last["created_at"], last["id"])
+
+    # Total solo si el cliente lo pide
+    total = None
+    if with_total:
+        if rows:
+            total = rows[0]["_total"]
+        elif pagination.offset:
+            # Página fuera de rango: no hay filas de las que leer el total
+            total = await db.scalar(select(func.count()).select_from(count_source.subquery()))
+        else:
+            total = 0
 
     # Calculate pagination metadata
-    pages = (total + pagination.size - 1) // pagination.size
-    has_next = pagination.page < pages
-    has_prev = pagination.page > 1
+    pages = (total + pagination.size - 1) // pagination.size if total is not None else None
+    has_prev = cursor is not None or pagination.page > 1
 
     return PaginatedResponse(
         items=items,
@@ -120,7 +180,8 @@ async def paginate_query(
         size=pagination.size,
         pages=pages,
         has_next=has_next,
-        has_prev=has_prev
+        has_prev=has_prev,
+        next_cursor=next_cursor
     )
 
 
@@ -130,10 +191,10 @@ async def paginate_query(
 async def _ensure_alias_available(db: AsyncSession, alias_hash: str) -> None:
     """Valida que el alias no esté en uso."""
 
-    result = await db.execute(
-        select(User).where(User.alias_hash == alias_hash, User.deleted_at.is_(None))
+    in_use = await db.scalar(
+        select(exists().where(User.alias_hash == alias_hash, User.deleted_at.is_(None)))
     )
-    if result.scalar_one_or_none():
+    if in_use:
         raise HTTPException(status_code=status.HTTP_409_CONFLICT, detail="Alias already in use")
 
 
@@ -170,11 +231,6 @@ async def _validate_assignment_scope(
         raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="Cannot assign unowned residences")
 
 
-def _hash_password(password: str) -> str:
-    salt = bcrypt.gensalt()
-    return bcrypt.hashpw(password.encode("utf-8"), salt).decode("utf-8")
-
-
 # Los endpoints de usuarios han sido movidos a app/routers/users.py
 
 # -------------------- CRUD Endpoints --------------------
@@ -199,9 +255,6 @@ async def create_residence(
     if existing:
         raise HTTPException(status_code=409, detail="Residence name already exists")
 
-    # Set user context for triggers
-    await db.execute(text("SELECT set_config('app.user_id', :uid, true)"), {"uid": current["id"]})
-
     residence = Residence(
         id=new_uuid(),
         name=data.name,
@@ -217,7 +270,9 @@ async def create_residence(
 
     db.add(residence)
     await db.commit()
-    await db.refresh(residence)
+    await response_cache.invalidate("residences", "residents")
+    # ResidenceOut solo usa id/name/address, ya en memoria: sin refresh (evita otra
+    # conexión del pool tras el commit)
     return residence
 
 @router.get("/", response_model=PaginatedResponse[ResidenceOut])
@@ -227,6 +282,7 @@ async def list_residences(
     db: AsyncSession = Depends(get_db),
     current = Depends(get_current_user),
     residence_id: str | None = Query(None, alias="residence_id"),
+    cursor: str | None = Query(None, description="Cursor de la página siguiente (next_cursor de la respuesta anterior)"),
 ) -> PaginatedResponse[ResidenceOut]:
     """List residences with pagination and filters"""
     
@@ -237,7 +293,8 @@ async def list_residences(
         if residence_id:
             query = query.where(Residence.id == residence_id)
     else:
-        # Only show residences the user has access to
+        # Only show residences the user has access to: el JOIN con user_residence es
+        # la comprobación de acceso (un residence_id ajeno da lista vacía, sin consulta previa)
         query = (
             select(Residence)
             .join(UserResidence, UserResidence.residence_id == Residence.id)
@@ -251,7 +308,7 @@ async def list_residences(
         if residence_id:
             query = query.where(Residence.id == residence_id)
 
-    return await paginate_query(query, db, pagination, filters)
+    return await paginate_query(query, db, pagination, filters, cursor)
 
 @router.get("/mine", response_model=list[dict])
 async def my_residences(
@@ -259,23 +316,28 @@ async def my_residences(
     current = Depends(get_current_user),
 ):
     """Get residences assigned to current user"""
+    # lambda_stmt: la construcción del SELECT se cachea por lambda y en cada
+    # llamada solo se enlazan los parámetros (uid)
     if current["role"] == "superadmin":
-        result = await db.execute(
-            select(Residence.id, Residence.name)
+        result = await db.execute(lambda_stmt(
+            lambda: select(Residence.id, Residence.name)
             .where(Residence.deleted_at.is_(None))
             .order_by(Residence.name)
-        )
+            .limit(MAX_UNPAGINATED_ROWS)
+        ))
     else:
-        result = await db.execute(
-            select(Residence.id, Residence.name)
+        uid = current["id"]
+        result = await db.execute(lambda_stmt(
+            lambda: select(Residence.id, Residence.name)
             .join(UserResidence, UserResidence.residence_id == Residence.id)
             .where(
-                UserResidence.user_id == current["id"],
+                UserResidence.user_id == uid,
                 UserResidence.deleted_at.is_(None),
                 Residence.deleted_at.is_(None)
             )
             .order_by(Residence.name)
-        )
+            .limit(MAX_UNPAGINATED_ROWS)
+        ))
     return [{"id": rid, "name": name} for (rid, name) in result.all()]
 
 @router.get("/{id}", response_model=ResidenceOut)
@@ -285,20 +347,7 @@ async def get_residence(
     current = Depends(get_current_user),
 ):
     """Get a specific residence"""
-    residence = await get_residence_or_404(id, db)
-
-    # Check access permissions
-    if current["role"] != "superadmin":
-        result = await db.execute(
-            select(UserResidence).where(
-                UserResidence.user_id == current["id"],
-                UserResidence.residence_id == id,
-            )
-        )
-        if result.scalar_one_or_none() is None:
-            raise HTTPException(status_code=403, detail="Access denied to this residence")
-
-    return residence
+    return await get_accessible_residence_or_404(id, db, current)
 
 @router.put("/{id}", response_model=ResidenceOut)
 async def update_residence(
@@ -307,38 +356,41 @@ async def update_residence(
     db: AsyncSession = Depends(get_db),
     current = Depends(get_current_user),
 ):
-    """Update a residence"""
-    residence = await get_residence_or_404(id, db)
-
-    # Check permissions
-    if current["role"] != "superadmin":
-        result = await db.execute(
-            select(UserResidence).where(
-                UserResidence.user_id == current["id"],
-                UserResidence.residence_id == id,
-            )
-        )
-        if result.scalar_one_or_none() is None:
-            raise HTTPException(status_code=403, detail="Access denied to this residence")
-
-    # Set user context for triggers
-    await db.execute(text("SELECT set_config('app.user_id', :uid, true)"), {"uid": current["id"]})
-
-    # Update fields
-    update_data = data.dict(exclude_unset=True)
-    for field, value in update_data.items():
-        if field not in ['phone', 'email']:  # Handle encrypted fields separately
-            setattr(residence, field, value)
+    """
+    Update a residence.
+    Un único UPDATE ... RETURNING con la comprobación de acceso en el WHERE;
+    solo si no actualiza nada se consulta el motivo (404 / 403).
+    """
+    update_data = data.model_dump(exclude_unset=True)
+    values = {field: value for field, value in update_data.items() if field not in ('phone', 'email')}
 
     # Handle encrypted fields if provided
     if 'phone' in update_data:
-        residence.phone_encrypted = encrypt_data(update_data['phone']) if update_data['phone'] else None
+        values['phone_encrypted'] = encrypt_data(update_data['phone']) if update_data['phone'] else None
     if 'email' in update_data:
-        residence.email_encrypted = encrypt_data(update_data['email']) if update_data['email'] else None
+        values['email_encrypted'] = encrypt_data(update_data['email']) if update_data['email'] else None
+
+    conditions = [Residence.id == id, Residence.deleted_at.is_(None)]
+    if current["role"] != "superadmin":
+        conditions.append(exists().where(
+            UserResidence.user_id == current["id"],
+            UserResidence.residence_id == Residence.id,
+        ))
+
+    row = (await db.execute(
+        update(Residence)
+        .where(*conditions)
+        .values(**values, updated_at=func.now())
+        .returning(Residence.id, Residence.name, Residence.address)
+    )).mappings().one_or_none()
+
+    if row is None:
+        await ensure_residence_access(id, db, current)
+        raise HTTPException(status_code=404, detail="Residence not found")
 
     await db.commit()
-    await db.refresh(residence)
-    return residence
+    await response_cache.invalidate("residences", "residents")
+    return ResidenceOut.model_validate(row)
 
 @router.delete("/{id}", status_code=204)
 async def delete_residence(
@@ -346,17 +398,24 @@ async def delete_residence(
     db: AsyncSession = Depends(get_db),
     current = Depends(get_current_user),
 ):
-    """Soft delete a residence (superadmin only)"""
+    """
+    Soft delete a residence (superadmin only).
+    Comprobación de existencia y borrado en un único UPDATE ... RETURNING.
+    """
     if current["role"] != "superadmin":
         raise HTTPException(status_code=403, detail="Only superadmin can delete residences")
 
-    residence = await get_residence_or_404(id, db)
-
-    # Set user context for triggers
-    await db.execute(text("SELECT set_config('app.user_id', :uid, true)"), {"uid": current["id"]})
+    deleted = await db.scalar(
+        update(Residence)
+        .where(Residence.id == id, Residence.deleted_at.is_(None))
+        .values(deleted_at=func.now())
+        .returning(Residence.id)
+    )
+    if deleted is None:
+        raise HTTPException(status_code=404, detail="Residence not found")
 
-    residence.deleted_at = func.now()
     await db.commit()
+    await response_cache.invalidate("residences", "residents", "measurements")
 
 # -------------------- Additional Endpoints --------------------
 
@@ -367,37 +426,21 @@ async def get_residence_users(
     current = Depends(get_current_user),
 ):
     """Get users assigned to a residence"""
-    # Check permissions
-    if current["role"] != "superadmin":
-        result = await db.execute(
-            select(UserResidence).where(
-                UserResidence.user_id == current["id"],
-                UserResidence.residence_id == id,
-            )
-        )
-        if result.scalar_one_or_none() is None:
-            raise HTTPException(status_code=403, detail="Access denied to this residence")
+    await ensure_residence_access(id, db, current)
 
-    await get_residence_or_404(id, db)
-
-    result = await db.execute(
-        select(User)
+    # Solo las columnas que se devuelven: sin hidratar objetos User
+    result = await db.execute(lambda_stmt(
+        lambda: select(User.id, User.role, User.created_at)
         .join(UserResidence, UserResidence.user_id == User.id)
         .where(
             UserResidence.residence_id == id,
             User.deleted_at.is_(None)
         )
-    )
+        .order_by(User.created_at)
+        .limit(MAX_UNPAGINATED_ROWS)
+    ))
 
-    users = result.scalars().all()
-    return [
-        {
-            "id": user.id,
-            "role": user.role,
-            "created_at": user.created_at
-        }
-        for user in users
-    ]
+    return [dict(row) for row in result.mappings().all()]
 
 @router.post("/{id}/users/{user_id}", response_model=dict, status_code=201)
 async def assign_user_to_residence(
@@ -406,43 +449,49 @@ async def assign_user_to_residence(
     db: AsyncSession = Depends(get_db),
     current = Depends(get_current_user),
 ):
-    """Assign a user to a residence"""
-    # Check permissions
+    """
+    Assign a user to a residence.
+    Un único INSERT ... SELECT ... ON CONFLICT DO NOTHING RETURNING: solo inserta si
+    la residencia y el usuario existen y hay acceso. Si no inserta nada se
+    comprueba el motivo (404 / 403 / 409).
+    """
+    conditions = [
+        exists().where(Residence.id == id, Residence.deleted_at.is_(None)),
+        exists().where(User.id == user_id, User.deleted_at.is_(None)),
+    ]
     if current["role"] != "superadmin":
-        result = await db.execute(
-            select(UserResidence).where(
-                UserResidence.user_id == current["id"],
-                UserResidence.residence_id == id,
-            )
+        conditions.append(exists().where(
+            UserResidence.user_id == current["id"],
+            UserResidence.residence_id == id,
+        ))
+
+    stmt = (
+        pg_insert(UserResidence)
+        .from_select(
+            ["user_id", "residence_id", "created_by"],
+            select(
+                literal(user_id, UserResidence.user_id.type),
+                literal(id, UserResidence.residence_id.type),
+                literal(current["id"], UserResidence.created_by.type),
+            ).where(*conditions),
         )
-        if result.scalar_one_or_none() is None:
-            raise HTTPException(status_code=403, detail="Access denied to this residence")
-
-    await get_residence_or_404(id, db)
-
-    # Check if user exists
-    user_result = await db.execute(
-        select(User).where(User.id == user_id, User.deleted_at.is_(None))
+        .on_conflict_do_nothing(index_elements=["user_id", "residence_id"])
+        .returning(UserResidence.user_id)
     )
-    if not user_result.scalar_one_or_none():
-        raise HTTPException(status_code=404, detail="User not found")
+    inserted = await db.scalar(stmt)
 
-    # Check if already assigned
-    existing = await db.execute(
-        select(UserResidence).where(
-            UserResidence.user_id == user_id,
-            UserResidence.residence_id == id,
+    if inserted is None:
+        await ensure_residence_access(id, db, current)
+        user_exists = await db.scalar(
+            select(exists().where(User.id == user_id, User.deleted_at.is_(None)))
         )
-    )
-    if existing.scalar_one_or_none():
+        if not user_exists:
+            raise HTTPException(status_code=404, detail="User not found")
         raise HTTPException(status_code=409, detail="User already assigned to this residence")
 
-    # Set user context for triggers
-    await db.execute(text("SELECT set_config('app.user_id', :uid, true)"), {"uid": current["id"]})
-
-    assignment = UserResidence(user_id=user_id, residence_id=id)
-    db.add(assignment)
     await db.commit()
+    await response_cache.invalidate("residences", "residents", "measurements")
+    return {"user_id": user_id, "residence_id": id}
 
 @router.delete("/{id}/users/{user_id}", status_code=204)
 async def remove_user_from_residence(
@@ -451,32 +500,29 @@ async def remove_user_from_residence(
     db: AsyncSession = Depends(get_db),
     current = Depends(get_current_user),
 ):
-    """Remove a user from a residence"""
-    # Check permissions
+    """
+    Remove a user from a residence.
+    Un único DELETE ... RETURNING con la comprobación de acceso en el WHERE;
+    solo si no borra nada se comprueba el motivo (404 / 403).
+    """
+    conditions = [
+        UserResidence.user_id == user_id,
+        UserResidence.residence_id == id,
+        exists().where(Residence.id == id, Residence.deleted_at.is_(None)),
+    ]
     if current["role"] != "superadmin":
-        result = await db.execute(
-            select(UserResidence).where(
-                UserResidence.user_id == current["id"],
-                UserResidence.residence_id == id,
-            )
-        )
-        if result.scalar_one_or_none() is None:
-            raise HTTPException(status_code=403, detail="Access denied to this residence")
-
-    await get_residence_or_404(id, db)
-
-    # Set user context for triggers
-    await db.execute(text("SELECT set_config('app.user_id', :uid, true)"), {"uid": current["id"]})
-
-    result = await db.execute(
-        select(UserResidence).where(
-            UserResidence.user_id == user_id,
-            UserResidence.residence_id == id,
-        )
+        current_assignment = aliased(UserResidence)
+        conditions.append(exists().where(
+            current_assignment.user_id == current["id"],
+            current_assignment.residence_id == id,
+        ))
+
+    removed = await db.scalar(
+        delete(UserResidence).where(*conditions).returning(UserResidence.user_id)
     )
-    assignment = result.scalar_one_or_none()
-    if not assignment:
+    if removed is None:
+        await ensure_residence_access(id, db, current)
         raise HTTPException(status_code=404, detail="User not assigned to this residence")
 
-    await db.delete(assignment)
     await db.commit()
+    await response_cache.invalidate("residences", "residents", "measurements")
@@ -1,20 +1,24 @@
 from __future__ import annotations
 
 from typing import Dict, Optional
-from datetime import datetime
+from datetime import datetime, timezone
+import orjson
 from fastapi import APIRouter, Depends, HTTPException, status, Query, Body
-from sqlalchemy import select, func, and_, or_, text
+from fastapi.responses import ORJSONResponse
+from sqlalchemy import select, insert, update, exists, func, and_, or_, tuple_, literal, bindparam
 from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.orm import selectinload, aliased
 
-from app.deps import get_db, get_current_user
+from app.cache import response_cache
+from app.deps import get_db, get_current_user, bind_inferred_residence
+from app.db import first_with_user_guc
 from app.models import (
     Resident, Bed, Residence, User, UserResidence, Room, Floor, Device,
     Measurement, TaskApplication, ResidentHistory, TaskTemplate, TaskCategory
 )
 from app.schemas import (
     ResidentCreate, ResidentUpdate, ResidentOut, ResidentChangeBed,
-    PaginationParams, PaginatedResponse, FilterParams,
+    PaginationParams, PaginatedResponse, FilterParams, encode_cursor, decode_cursor,
     ResidentChronologyResponse, MeasurementEvent, TaskEvent,
     BedChangeEvent, StatusChangeEvent
 )
@@ -23,8 +27,50 @@ from app.services.permission_service import PermissionService
 
 router = APIRouter(prefix="/residents", tags=["residents"])
 
+# Historial de un residente (changed_at DESC, id desempata). Consulta construida una
+# vez: mismo SQL en cada llamada -> asyncpg reutiliza el prepared statement.
+_RESIDENT_HISTORY_QUERY = (
+    select(*ResidentHistory.__table__.c)
+    .where(ResidentHistory.resident_id == bindparam("resident_id"))
+    .order_by(ResidentHistory.changed_at.desc(), ResidentHistory.id.desc())
+    .limit(bindparam("limit"))
+)
+
 # -------------------- Helper Functions --------------------
 
+# Nombres de la estructura del residente como subconsultas escalares correlacionadas
+# (una búsqueda por PK cada una, solo para las filas devueltas) en lugar de outer joins
+_RESIDENT_NAME_COLUMNS = (
+    select(Bed.name).where(Bed.id == Resident.bed_id).scalar_subquery().label("bed_name"),
+    select(Room.name).where(Room.id == Resident.room_id).scalar_subquery().label("room_name"),
+    select(Floor.name).where(Floor.id == Resident.floor_id).scalar_subquery().label("floor_name"),
+    select(Residence.name).where(Residence.id == Resident.residence_id).scalar_subquery().label("residence_name"),
+)
+
+# Campos de estructura de ResidentUpdate que update_resident trata aparte
+_STRUCTURE_FIELDS = frozenset({"bed_id", "room_id", "floor_id"})
+
+# Columnas de ResidentOut: las de la tabla (Core, sin hidratar objetos ORM) + nombres
+_RESIDENT_OUT_COLUMNS = (*Resident.__table__.c, *_RESIDENT_NAME_COLUMNS)
+
+# Campos de ResidentOut, en su orden: listado y detalle se serializan directamente
+# desde las filas, sin pasar por Pydantic (ver _ResidentJSONResponse)
+_RESIDENT_OUT_FIELDS = tuple(ResidentOut.model_fields)
+
+class _ResidentJSONResponse(ORJSONResponse):
+    """
+    ORJSONResponse para lecturas de residentes devueltas con response_model=None:
+    FastAPI no vuelca ni revalida la respuesta. Con OPT_UTC_Z los datetimes UTC salen
+    con 'Z', igual que los serializa Pydantic, así que el cuerpo no cambia.
+    """
+
+    def render(self, content) -> bytes:
+        return orjson.dumps(content, option=orjson.OPT_UTC_Z | orjson.OPT_NON_STR_KEYS)
+
+def _resident_out_dict(row) -> dict:
+    """Fila de _RESIDENT_OUT_COLUMNS -> dict con exactamente los campos de ResidentOut"""
+    return {name: row.get(name) for name in _RESIDENT_OUT_FIELDS}
+
 async def get_resident_or_404(resident_id: str, db: AsyncSession) -> Resident:
     """Get resident by ID or raise 404"""
     result = await db.execute(
@@ -35,6 +81,95 @@ async def get_resident_or_404(resident_id: str, db: AsyncSession) -> Resident:
         raise HTTPException(status_code=404, detail="Resident not found")
     return resident
 
+async def get_accessible_resident_or_404(resident_id: str, db: AsyncSession, current: dict) -> Resident:
+    """
+    Get resident by ID comprobando el acceso a su residencia en la misma consulta:
+    404 si no existe, 403 si el usuario no está asignado (salvo superadmin).
+    """
+    if current["role"] == "superadmin":
+        return await get_resident_or_404(resident_id, db)
+
+    has_access = exists().where(
+        UserResidence.user_id == current["id"],
+        UserResidence.residence_id == Resident.residence_id,
+    )
+    row = (await db.execute(
+        select(Resident, has_access).where(Resident.id == resident_id, Resident.deleted_at.is_(None))
+    )).one_or_none()
+    if row is None:
+        raise HTTPException(status_code=404, detail="Resident not found")
+    resident, allowed = row
+    if not allowed:
+        raise HTTPException(status_code=403, detail="Access denied to this resident")
+    return resident
+
+async def require_resident_access(
+    id: str,
+    db: AsyncSession = Depends(get_db),
+    current = Depends(get_current_user),
+) -> Resident:
+    """
+    Dependencia para endpoints /residents/{id}: residente accesible o 404/403.
+    Comparte con el endpoint la sesión y el usuario (FastAPI cachea las
+    dependencias por petición), así que no añade consultas.
+    """
+    return await get_accessible_resident_or_404(id, db, current)
+
+def _guard_resident_update(stmt, resident_id: str, current: dict, bed_id: str | None):
+    """
+    Condiciones de un UPDATE de residente en una sola sentencia: existe, el usuario
+    tiene acceso a su residencia (salvo superadmin) y, si se asigna cama, la cama
+    existe y es de la misma residencia (UPDATE ... FROM bed, room).
+    """
+    stmt = stmt.where(Resident.id == resident_id, Resident.deleted_at.is_(None))
+    if current["role"] != "superadmin":
+        stmt = stmt.where(exists().where(
+            UserResidence.user_id == current["id"],
+            UserResidence.residence_id == Resident.residence_id,
+        ))
+    if bed_id:
+        stmt = stmt.where(
+            Bed.id == bed_id,
+            Bed.deleted_at.is_(None),
+            Bed.residence_id == Resident.residence_id,
+            Room.id == Bed.room_id,
+        )
+    return stmt
+
+async def _diagnose_bed_assignment(
+    db: AsyncSession, current: dict, resident_id: str, bed_id: str | None
+) -> tuple[str, str | None]:
+    """
+    Tras un UPDATE sin filas: lanza 404/403 si el fallo es del residente o
+    404 si la cama no existe; si no, devuelve (residencia del residente,
+    residencia de la cama) para que el llamador responda 400.
+    """
+    if current["role"] == "superadmin":
+        has_access = literal(True)
+    else:
+        has_access = exists().where(
+            UserResidence.user_id == current["id"],
+            UserResidence.residence_id == Resident.residence_id,
+        )
+    # Residente, acceso y cama en una sola consulta
+    query = select(Resident.residence_id, has_access, Bed.residence_id if bed_id else literal(None))
+    if bed_id:
+        query = query.outerjoin(Bed, and_(Bed.id == bed_id, Bed.deleted_at.is_(None)))
+    row = (await db.execute(
+        query.where(Resident.id == resident_id, Resident.deleted_at.is_(None))
+    )).one_or_none()
+    if row is None:
+        raise HTTPException(status_code=404, detail="Resident not found")
+    resident_residence_id, allowed, bed_residence_id = row
+    if not allowed:
+        raise HTTPException(status_code=403, detail="Access denied to this resident")
+    if not bed_id:
+        # Sin cama el UPDATE solo falla si el residente cambió entre medias
+        raise HTTPException(status_code=404, detail="Resident not found")
+    if bed_residence_id is None:
+        raise HTTPException(status_code=404, detail="Bed not found")
+    return resident_residence_id, bed_residence_id
+
 async def apply_residence_context_or_infer(
     db: AsyncSession,
     current: dict,
@@ -51,6 +186,14 @@ async def apply_residence_context_or_infer(
     """
     rid = residence_id
 
+    # Sin residencia explícita y no superadmin: inferir, validar y fijar contexto
+    # en un único round-trip
+    if not rid and current["role"] != "superadmin":
+        if resident_id:
+            return await bind_inferred_residence(db, current, Resident, resident_id, "Resident not found")
+        if device_id:
+            return await bind_inferred_residence(db, current, Device, device_id, "Device not found")
+
     # Inferir por residente
     if not rid and resident_id:
         rid = await db.scalar(
@@ -79,21 +222,22 @@ async def apply_residence_context_or_infer(
             detail="Select a residence (send residence_id or include resident_id/device_id to infer)"
         )
 
-    # Validar pertenencia (salvo superadmin)
+    # Validar pertenencia y fijar contexto en la misma consulta (salvo superadmin,
+    # que no necesita ni comprobación ni GUC)
     if rid and current["role"] != "superadmin":
-        ok = await db.execute(
-            select(UserResidence).where(
+        # app.user_id va en la misma consulta (first_with_user_guc)
+        ok = await first_with_user_guc(
+            db,
+            select(func.set_config("app.residence_id", rid, True))
+            .select_from(UserResidence)
+            .where(
                 UserResidence.user_id == current["id"],
                 UserResidence.residence_id == rid,
             )
         )
-        if ok.scalar_one_or_none() is None:
+        if ok is None:
             raise HTTPException(status_code=403, detail="Residence not allowed for this user")
 
-    # Fijar contexto
-    if rid:
-        await db.execute(text("SELECT set_config('app.residence_id', :rid, true)"), {"rid": rid})
-
     return rid
 
 async def paginate_query_residents(
@@ -104,9 +248,16 @@ async def paginate_query_residents(
     floor_id: str = None,
     room_id: str = None,
     bed_id: str = None,
-    residence_id: str = None
-) -> PaginatedResponse[ResidentOut]:
-    """Apply pagination and filters to a residents query"""
+    residence_id: str = None,
+    cursor: str | None = None,
+) -> dict:
+    """
+    Apply pagination and filters to a residents query.
+    Devuelve el contenido de PaginatedResponse[ResidentOut] como dict, listo para orjson.
+    Con el orden por defecto (created_at DESC) la respuesta incluye next_cursor:
+    si llega `cursor` se pagina por keyset sobre (created_at, id) DESC en vez de
+    OFFSET, sin total, y se ignoran page y sort_by.
+    """
 
     if filter_params:
         if filter_params.date_from:
@@ -116,6 +267,8 @@ async def paginate_query_residents(
         if filter_params.status:
             query = query.where(Resident.status == filter_params.status)
         if filter_params.search:
+            # ILIKE '%texto%' usa idx_resident_full_name_comments_trgm (GIN pg_trgm);
+            # con menos de 3 caracteres no hay trigramas y Postgres recorre la tabla
             search_term = f"%{filter_params.search}%"
             query = query.where(or_(
                 Resident.full_name.ilike(search_term),
@@ -123,87 +276,84 @@ async def paginate_query_residents(
             ))
 
     # Apply structure filters - apply all filters
+    # Sobre las columnas desnormalizadas de resident (índices propios), no sobre
+    # los outer joins de los nombres: el filtro no depende de cómo se una la consulta
     if residence_id:
         query = query.where(Resident.residence_id == residence_id)
     if floor_id:
-        query = query.where(Floor.id == floor_id)
+        query = query.where(Resident.floor_id == floor_id)
     if room_id:
-        query = query.where(Room.id == room_id)
+        query = query.where(Resident.room_id == room_id)
     if bed_id:
         query = query.where(Resident.bed_id == bed_id)
 
-    # Apply filters to count query as well
-    count_query = select(func.count(Resident.id)).select_from(Resident)
-
-    if filter_params:
-        if filter_params.date_from:
-            count_query = count_query.where(Resident.created_at >= filter_params.date_from)
-        if filter_params.date_to:
-            count_query = count_query.where(Resident.created_at <= filter_params.date_to)
-        if filter_params.status:
-            count_query = count_query.where(Resident.status == filter_params.status)
-        if filter_params.search:
-            search_term = f"%{filter_params.search}%"
-            count_query = count_query.where(or_(
-                Resident.full_name.ilike(search_term),
-                Resident.comments.ilike(search_term)
-            ))
-
-    # Apply structure filters to count query as well - simplify to avoid duplicate joins
-    if residence_id:
-        count_query = count_query.where(Resident.residence_id == residence_id)
-    if floor_id:
-        count_query = count_query.join(Bed, Resident.bed_id == Bed.id, isouter=True).join(Room, Bed.room_id == Room.id, isouter=True).join(Floor, Room.floor_id == Floor.id, isouter=True).where(Floor.id == floor_id)
-    elif room_id:
-        count_query = count_query.join(Bed, Resident.bed_id == Bed.id, isouter=True).join(Room, Bed.room_id == Room.id, isouter=True).where(Room.id == room_id)
-    elif bed_id:
-        count_query = count_query.where(Resident.bed_id == bed_id)
+    # Se guarda sin orden ni límite por si hace falta el COUNT de respaldo
+    count_source = query
 
-    total = await db.scalar(count_query)
+    # Keyset posible solo con el orden por defecto (el de idx_resident_created_keyset)
+    keyset = cursor is not None or pagination.sort_by is None or (
+        pagination.sort_by == 'created_at' and pagination.sort_order == 'desc'
+    )
 
-    if pagination.sort_by:
+    if keyset:
+        # id desempata para que el cursor sea estable
+        query = query.order_by(Resident.created_at.desc(), Resident.id.desc())
+    else:
         sort_field = getattr(Resident, pagination.sort_by, Resident.created_at)
         if pagination.sort_order == 'desc':
             sort_field = sort_field.desc()
         query = query.order_by(sort_field)
+
+    if cursor:
+        cursor_created_at, cursor_id = decode_cursor(cursor)
+        query = query.where(tuple_(Resident.created_at, Resident.id) < tuple_(
+            literal(cursor_created_at, Resident.created_at.type),
+            literal(cursor_id, Resident.id.type),
+        ))
+        # Una fila de más indica si hay página siguiente
+        query = query.limit(pagination.size + 1)
     else:
-        query = query.order_by(Resident.created_at.desc())
-
-    offset = (pagination.page - 1) * pagination.size
-    query = query.offset(offset).limit(pagination.size)
-
-    result = await db.execute(query)
-    items = []
-    for row in result.all():
-        # Row structure: [Resident, bed_name, room_name, floor_name, residence_name]
-        resident = row[0]
-        item_dict = {}
-
-        # Add all Resident columns
-        for column in resident.__table__.columns.keys():
-            item_dict[column] = getattr(resident, column)
-
-        # Add relationship names
-        item_dict['bed_name'] = row[1]
-        item_dict['room_name'] = row[2]
-        item_dict['floor_name'] = row[3]
-        item_dict['residence_name'] = row[4]
-
-        items.append(item_dict)
-
-    pages = (total + pagination.size - 1) // pagination.size
-    has_next = pagination.page < pages
-    has_prev = pagination.page > 1
-
-    return PaginatedResponse(
-        items=items,
-        total=total,
-        page=pagination.page,
-        size=pagination.size,
-        pages=pages,
-        has_next=has_next,
-        has_prev=has_prev
-    )
+        query = query.offset(pagination.offset).limit(pagination.size)
+        # Total en la misma consulta (count() OVER () se calcula antes del LIMIT) y
+        # con exactamente los mismos filtros, permisos incluidos, que la página
+        query = query.add_columns(func.count().over().label("total_count"))
+
+    rows = (await db.execute(query)).mappings().all()
+    if cursor:
+        # Sin total en modo cursor: el filtro keyset lo falsearía
+        total = None
+        has_next = len(rows) > pagination.size
+        rows = rows[:pagination.size]
+    else:
+        if rows:
+            total = rows[0]["total_count"]
+        elif pagination.offset:
+            # Página fuera de rango: no hay filas de las que leer el total
+            total = await db.scalar(select(func.count()).select_from(count_source.subquery()))
+        else:
+            total = 0
+        has_next = pagination.page * pagination.size < total
+
+    next_cursor = None
+    if keyset and has_next and rows and rows[-1]["created_at"] is not None:
+        next_cursor = encode_cursor(rows[-1]["created_at"], rows[-1]["id"])
+
+    # Filas planas (columnas de resident + nombres), sin total_count
+    items = [_resident_out_dict(row) for row in rows]
+
+    pages = (total + pagination.size - 1) // pagination.size if total is not None else None
+    has_prev = cursor is not None or pagination.page > 1
+
+    return {
+        "items": items,
+        "total": total,
+        "page": pagination.page,
+        "size": pagination.size,
+        "pages": pages,
+        "has_next": has_next,
+        "has_prev": has_prev,
+        "next_cursor": next_cursor,
+    }
 
 # -------------------- CRUD Endpoints --------------------
 
@@ -214,71 +364,64 @@ async def create_resident(
     current = Depends(get_current_user),
 ):
     """Create a new resident"""
-    import logging
-    logger = logging.getLogger(__name__)
-
-    try:
-        # Validate that user has permission to create residents
-        if not PermissionService.can_create_resident(current["role"]):
-            raise HTTPException(
-                status_code=status.HTTP_403_FORBIDDEN,
-                detail="No tiene permiso para crear residentes"
-            )
-
-        # Validate access to the specified residence
-        await PermissionService.validate_residence_access(
-            db, current["id"], data.residence_id, current["role"]
+    # Validate that user has permission to create residents
+    if not PermissionService.can_create_resident(current["role"]):
+        raise HTTPException(
+            status_code=status.HTTP_403_FORBIDDEN,
+            detail="No tiene permiso para crear residentes"
         )
 
-        if not data.residence_id:
-            raise HTTPException(status_code=400, detail="Residence ID is required")
+    if not data.residence_id:
+        raise HTTPException(status_code=400, detail="Residence ID is required")
+
+    # Validar acceso a la residencia y fijar app.residence_id en la misma consulta
+    await apply_residence_context_or_infer(db, current, data.residence_id)
+
+    # Create resident data excluding duplicates from model_dump
+    resident_data = data.model_dump()
+    resident_data.pop('residence_id', None)
+    resident_data.pop('room_id', None)    # Remove to avoid duplicate with calculated value
+    resident_data.pop('floor_id', None)   # Remove to avoid duplicate with calculated value
 
-        # Validar cama y obtener room_id y floor_id
-        room_id = None
-        floor_id = None
-        if data.bed_id:
-            bed_result = await db.execute(
-                select(Bed, Room.floor_id).join(Room, Bed.room_id == Room.id)
-                .where(Bed.id == data.bed_id, Bed.deleted_at.is_(None))
+    values = {"id": new_uuid(), "residence_id": data.residence_id, **resident_data}
+    if data.bed_id:
+        # INSERT ... SELECT: solo inserta si la cama existe y es de la residencia;
+        # room_id y floor_id salen de la propia cama
+        cols = Resident.__table__.c
+        source = (
+            select(
+                *(literal(value, cols[name].type) for name, value in values.items()),
+                Bed.room_id,
+                Room.floor_id,
+            )
+            .join_from(Bed, Room, Bed.room_id == Room.id)
+            .where(
+                Bed.id == data.bed_id,
+                Bed.residence_id == data.residence_id,
+                Bed.deleted_at.is_(None),
             )
-            result_row = bed_result.first()
-            if not result_row:
-                raise HTTPException(status_code=404, detail="Bed not found")
-                
-            bed, floor_id = result_row
-            room_id = bed.room_id
-            
-            if bed.residence_id != data.residence_id:
-                raise HTTPException(status_code=400, detail="Bed must belong to the specified residence")
-
-        await db.execute(text("SELECT set_config('app.user_id', :uid, true)"), {"uid": current["id"]})
-
-        logger.error(f"Creating resident with data: {data.model_dump()}")
-
-        # Create resident data excluding duplicates from model_dump
-        resident_data = data.model_dump()
-        resident_data.pop('residence_id', None)
-        resident_data.pop('room_id', None)    # Remove to avoid duplicate with calculated value
-        resident_data.pop('floor_id', None)   # Remove to avoid duplicate with calculated value
-
-        resident = Resident(
-            id=new_uuid(),
-            residence_id=data.residence_id,
-            room_id=room_id,    # Use calculated room_id from bed
-            floor_id=floor_id,  # Use calculated floor_id from bed
-            **resident_data
         )
+        stmt = insert(Resident).from_select([*values, "room_id", "floor_id"], source)
+    else:
+        stmt = insert(Resident).values(**values)
+
+    # RETURNING trae los server defaults sin un refresh posterior
+    row = (await db.execute(stmt.returning(*Resident.__table__.c))).mappings().one_or_none()
+    if row is None:
+        bed_found = await db.scalar(select(exists().where(
+            Bed.id == data.bed_id, Bed.deleted_at.is_(None)
+        )))
+        if not bed_found:
+            raise HTTPException(status_code=404, detail="Bed not found")
+        raise HTTPException(status_code=400, detail="Bed must belong to the specified residence")
 
-        db.add(resident)
-        await db.commit()
-        await db.refresh(resident)
-        return resident
-    except Exception as e:
-        logger.error(f"Error in create_resident: {str(e)}")
-        logger.error(f"Data received: {data.model_dump() if hasattr(data, 'model_dump') else data}")
-        raise HTTPException(status_code=500, detail=f"Internal server error: {str(e)}")
+    await db.commit()
+    await response_cache.invalidate("residents")
+    return ResidentOut.model_construct(**row)
 
-@router.get("/", response_model=PaginatedResponse[ResidentOut])
+# response_model=None: la respuesta se serializa desde las filas con orjson, sin
+# revalidar; el esquema sigue documentado en OpenAPI mediante `responses`
+@router.get("/", response_model=None, responses={200: {"model": PaginatedResponse[ResidentOut]}})
 async def list_residents(
     pagination: PaginationParams = Depends(),
     filters: FilterParams = Depends(),
@@ -288,90 +431,48 @@ async def list_residents(
     room_id: str | None = Query(None),
     bed_id: str | None = Query(None),
     residence_id_param: str | None = Query(None, alias="residence_id"),
-) -> PaginatedResponse[ResidentOut]:
+    cursor: str | None = Query(None, description="Cursor de la página siguiente (next_cursor de la respuesta anterior)"),
+) -> ORJSONResponse:
     """List residents with pagination and filters - filtered by user role and assignments"""
-    import logging
-    logger = logging.getLogger(__name__)
-
-    try:
-        # Build base query with SUPER optimized joins - relaciones directas
-        base_query = select(
-            Resident,
-            Bed.name.label("bed_name"),
-            Room.name.label("room_name"),
-            Floor.name.label("floor_name"),
-            Residence.name.label("residence_name")
-        ).join(Residence, Resident.residence_id == Residence.id
-        ).join(Bed, Resident.bed_id == Bed.id, isouter=True
-        ).join(Room, Resident.room_id == Room.id, isouter=True  # ← DIRECTO desde resident
-        ).join(Floor, Resident.floor_id == Floor.id, isouter=True  # ← DIRECTO desde resident
-        ).where(Resident.deleted_at.is_(None))
-
-        # Apply filtering based on user role and assignments
-        base_query = await PermissionService.filter_query_by_residence(
-            base_query, db, current["id"], current["role"], residence_id_param
-        )
+    # Build base query: los filtros van sobre resident, los nombres en subconsultas escalares
+    # Columnas de la tabla, no la entidad: sin hidratar objetos ORM ni identity map
+    base_query = select(*_RESIDENT_OUT_COLUMNS).where(Resident.deleted_at.is_(None))
+
+    # Apply filtering based on user role and assignments
+    base_query = await PermissionService.filter_query_by_residence(
+        base_query, db, current["id"], current["role"], residence_id_param
+    )
 
-        result = await paginate_query_residents(base_query, db, pagination, filters, floor_id, room_id, bed_id, residence_id_param)
-        return result
-    except Exception as e:
-        logger.error(f"Error in list_residents: {str(e)}")
-        logger.error(f"Params: floor_id={floor_id}, room_id={room_id}, bed_id={bed_id}, residence_id={residence_id_param}")
-        raise HTTPException(status_code=500, detail=f"Internal server error: {str(e)}")
+    result = await paginate_query_residents(base_query, db, pagination, filters, floor_id, room_id, bed_id, residence_id_param, cursor)
+    return _ResidentJSONResponse(result)
 
-@router.get("/{id}", response_model=dict)
+@router.get("/{id}", response_model=None, responses={200: {"model": ResidentOut}})
 async def get_resident(
     id: str,
     db: AsyncSession = Depends(get_db),
     current = Depends(get_current_user),
-):
+) -> ORJSONResponse:
     """Get a specific resident"""
-    resident = await get_resident_or_404(id, db)
-
-    if current["role"] != "superadmin":
-        result = await db.execute(
-            select(UserResidence).where(
-                UserResidence.user_id == current["id"],
-                UserResidence.residence_id == resident.residence_id,
-            )
+    # Residente, nombres (subconsulta escalar) y acceso en una sola consulta
+    if current["role"] == "superadmin":
+        has_access = literal(True)
+    else:
+        has_access = exists().where(
+            UserResidence.user_id == current["id"],
+            UserResidence.residence_id == Resident.residence_id,
         )
-        if result.scalar_one_or_none() is None:
-            raise HTTPException(status_code=403, detail="Access denied to this resident")
-
-    # Get resident with relationship data - OPTIMIZADO con relaciones directas
     result = await db.execute(
-        select(
-            Resident,
-            Bed.name.label("bed_name"),
-            Room.name.label("room_name"), 
-            Floor.name.label("floor_name"),
-            Residence.name.label("residence_name")
-        ).join(Residence, Resident.residence_id == Residence.id
-        ).join(Bed, Resident.bed_id == Bed.id, isouter=True
-        ).join(Room, Resident.room_id == Room.id, isouter=True  # ← DIRECTO, no a través de bed
-        ).join(Floor, Resident.floor_id == Floor.id, isouter=True  # ← DIRECTO, no a través de room
-        ).where(Resident.id == id)
+        select(*_RESIDENT_OUT_COLUMNS, has_access.label("has_access"))
+        .where(Resident.id == id, Resident.deleted_at.is_(None))
     )
 
-    row = result.first()
+    row = result.mappings().first()
     if not row:
         raise HTTPException(status_code=404, detail="Resident not found")
+    if not row["has_access"]:
+        raise HTTPException(status_code=403, detail="Access denied to this resident")
 
-    # Build response dictionary
-    resident_data = row[0]
-    response_dict = {}
-
-    # Add all Resident columns (ahora incluye room_id y floor_id)
-    for column in resident_data.__table__.columns.keys():
-        response_dict[column] = getattr(resident_data, column)
-
-    # Add relationship names
-    response_dict['bed_name'] = row[1]
-    response_dict['room_name'] = row[2]
-    response_dict['floor_name'] = row[3]
-    response_dict['residence_name'] = row[4]
-
-    return response_dict
+    return _ResidentJSONResponse(_resident_out_dict(row))
 
 @router.put("/{id}", response_model=ResidentOut)
 async def update_resident(
@@ -381,89 +482,60 @@ async def update_resident(
     current = Depends(get_current_user),
 ):
     """Update a resident"""
-    import logging
-    logger = logging.getLogger(__name__)
-
-    print(f"PUT - Starting update for resident ID: {id}")
-    print(f"PUT - Data received: {data}")
 
-    resident = await get_resident_or_404(id, db)
-    print(f"PUT - Resident found: {resident.residence_id}")
+    # Campos normales (bed_id, room_id y floor_id se manejan aparte); los enviados
+    # se consultan en model_fields_set sin volver a serializar
+    values = data.model_dump(exclude_unset=True, exclude=_STRUCTURE_FIELDS)
+    sent = data.model_fields_set
 
-    # Validate access to resident's residence
-    await PermissionService.validate_residence_access(
-        db, current["id"], resident.residence_id, current["role"]
-    )
-
-    # Si se está actualizando bed_id, también actualizar room_id y floor_id
-    if data.bed_id:
-        bed_result = await db.execute(
-            select(Bed, Room.floor_id).join(Room, Bed.room_id == Room.id)
-            .where(Bed.id == data.bed_id, Bed.deleted_at.is_(None))
-        )
-        result_row = bed_result.first()
-        if not result_row:
-            raise HTTPException(status_code=404, detail="Bed not found")
-            
-        bed, floor_id = result_row
-
-        # Log para depuración
-        print(f"PUT - Bed residence_id: {bed.residence_id}")
-        print(f"PUT - Resident residence_id: {resident.residence_id}")
-        print(f"PUT - Data residence_id: {data.residence_id}")
-
-        if bed.residence_id != resident.residence_id:
-            raise HTTPException(
-                status_code=400,
-                detail={
-                    "error": "cross_residence_bed_assignment",
-                    "message": "No puedes asignar una cama de una residencia diferente",
-                    "steps_required": [
-                        "1. Primero quita la cama actual (deja bed_id vacío)",
-                        "2. Luego actualiza la residencia si es necesario",
-                        "3. Finalmente asigna la nueva cama"
-                    ],
-                    "current_resident_residence": resident.residence_id,
-                    "target_bed_residence": bed.residence_id
-                }
-            )
-
-    await db.execute(text("SELECT set_config('app.user_id', :uid, true)"), {"uid": current["id"]})
-
-    # Actualizar campos normales (excluyendo bed_id, room_id, floor_id que se manejan especialmente)
-    update_data = data.dict(exclude_unset=True)
-    for field, value in update_data.items():
-        if field not in ['bed_id', 'room_id', 'floor_id']:  # Estos se manejan por separado
-            setattr(resident, field, value)
-    
     # Manejo especial de bed_id, room_id y floor_id
     if data.bed_id:
-        # Si se asigna una cama, actualizar todos los niveles jerárquicos
-        resident.bed_id = data.bed_id
-        resident.room_id = bed.room_id
-        resident.floor_id = floor_id
-    elif 'bed_id' in update_data and data.bed_id is None:
-        # Si explícitamente se quita la cama, solo quitarla
-        resident.bed_id = None
-        # Mantener room_id y floor_id si se proporcionaron explícitamente
-        if 'room_id' in update_data:
-            resident.room_id = data.room_id
-        else:
-            resident.room_id = None
-        if 'floor_id' in update_data:
-            resident.floor_id = data.floor_id
-        else:
-            resident.floor_id = None
+        # Si se asigna una cama, actualizar todos los niveles jerárquicos desde la propia cama
+        values.update(bed_id=data.bed_id, room_id=Bed.room_id, floor_id=Room.floor_id)
+    elif 'bed_id' in sent:
+        # Si explícitamente se quita la cama, mantener room_id y floor_id solo si se proporcionaron
+        values.update(
+            bed_id=None,
+            room_id=data.room_id if 'room_id' in sent else None,
+            floor_id=data.floor_id if 'floor_id' in sent else None,
+        )
     else:
         # Si no se toca bed_id, actualizar room_id y floor_id independientemente si se proporcionaron
-        if 'room_id' in update_data:
-            resident.room_id = data.room_id
-        if 'floor_id' in update_data:
-            resident.floor_id = data.floor_id
+        if 'room_id' in sent:
+            values['room_id'] = data.room_id
+        if 'floor_id' in sent:
+            values['floor_id'] = data.floor_id
+
+    if not values:
+        return await get_accessible_resident_or_404(id, db, current)
+
+    # Existencia, acceso y cama de la misma residencia en el propio UPDATE
+    stmt = _guard_resident_update(update(Resident), id, current, data.bed_id)
+    row = (await db.execute(
+        stmt.values(**values).returning(*Resident.__table__.c),
+        execution_options={"synchronize_session": False},
+    )).mappings().one_or_none()
+
+    if row is None:
+        resident_residence_id, bed_residence_id = await _diagnose_bed_assignment(db, current, id, data.bed_id)
+        raise HTTPException(
+            status_code=400,
+            detail={
+                "error": "cross_residence_bed_assignment",
+                "message": "No puedes asignar una cama de una residencia diferente",
+                "steps_required": [
+                    "1. Primero quita la cama actual (deja bed_id vacío)",
+                    "2. Luego actualiza la residencia si es necesario",
+                    "3. Finalmente asigna la nueva cama"
+                ],
+                "current_resident_residence": resident_residence_id,
+                "target_bed_residence": bed_residence_id
+            }
+        )
 
     await db.commit()
-    await db.refresh(resident)
-    return resident
+    await response_cache.invalidate("residents")
+    return ResidentOut.model_construct(**row)
 
 @router.delete("/{id}", status_code=204)
 async def delete_resident(
@@ -472,22 +544,17 @@ async def delete_resident(
     current = Depends(get_current_user),
 ):
     """Soft delete a resident"""
-    resident = await get_resident_or_404(id, db)
+    # Existencia y acceso en el propio UPDATE; solo si no afecta filas se diagnostica 404/403
+    stmt = _guard_resident_update(update(Resident), id, current, None)
+    deleted = (await db.execute(
+        stmt.values(deleted_at=func.now()).returning(Resident.id),
+        execution_options={"synchronize_session": False},
+    )).scalar_one_or_none()
+    if deleted is None:
+        await _diagnose_bed_assignment(db, current, id, None)
 
-    if current["role"] != "superadmin":
-        result = await db.execute(
-            select(UserResidence).where(
-                UserResidence.user_id == current["id"],
-                UserResidence.residence_id == resident.residence_id,
-            )
-        )
-        if result.scalar_one_or_none() is None:
-            raise HTTPException(status_code=403, detail="Access denied to this resident")
-
-    await db.execute(text("SELECT set_config('app.user_id', :uid, true)"), {"uid": current["id"]})
-
-    resident.deleted_at = func.now()
     await db.commit()
+    await response_cache.invalidate("residents")
 
 # -------------------- Additional Endpoints --------------------
 
@@ -499,85 +566,49 @@ async def change_bed(
     current = Depends(get_current_user),
 ):
     """Change resident's bed assignment"""
-    resident = await get_resident_or_404(resident_id, db)
-
-    if current["role"] != "superadmin":
-        result = await db.execute(
-            select(UserResidence).where(
-                UserResidence.user_id == current["id"],
-                UserResidence.residence_id == resident.residence_id,
-            )
-        )
-        if result.scalar_one_or_none() is None:
-            raise HTTPException(status_code=403, detail="Access denied to this resident")
-
-    if payload.new_bed_id:
-        # Obtener la cama con su información de room y floor
-        bed_result = await db.execute(
-            select(Bed, Room.floor_id).join(Room, Bed.room_id == Room.id)
-            .where(Bed.id == payload.new_bed_id, Bed.deleted_at.is_(None))
-        )
-        result_row = bed_result.first()
-        if not result_row:
-            raise HTTPException(status_code=404, detail="Bed not found")
-        
-        bed, floor_id = result_row
-        if bed.residence_id != resident.residence_id:
-            raise HTTPException(status_code=400, detail="Bed must belong to the same residence")
-
-    await db.execute(text("SELECT set_config('app.user_id', :uid, true)"), {"uid": current["id"]})
+    values = {"status_changed_at": payload.changed_at or datetime.now(timezone.utc)}
 
     # Actualizar bed_id, room_id y floor_id de manera consistente
     if payload.new_bed_id:
-        resident.bed_id = payload.new_bed_id
-        resident.room_id = bed.room_id  # Actualizar room_id
-        resident.floor_id = floor_id    # Actualizar floor_id
+        # room_id y floor_id salen de la propia cama (UPDATE ... FROM bed, room)
+        values.update(bed_id=payload.new_bed_id, room_id=Bed.room_id, floor_id=Room.floor_id)
     else:
         # Si se quita la asignación de cama
-        resident.bed_id = None
-        resident.room_id = None
-        resident.floor_id = None
-        
-    if payload.changed_at:
-        resident.status_changed_at = payload.changed_at  # Corregir nombre del campo
-    else:
-        from datetime import datetime, timezone
-        resident.status_changed_at = datetime.now(timezone.utc)
+        values.update(bed_id=None, room_id=None, floor_id=None)
+
+    stmt = _guard_resident_update(update(Resident), resident_id, current, payload.new_bed_id)
+    row = (await db.execute(
+        stmt.values(**values).returning(*Resident.__table__.c),
+        execution_options={"synchronize_session": False},
+    )).mappings().one_or_none()
+
+    if row is None:
+        await _diagnose_bed_assignment(db, current, resident_id, payload.new_bed_id)
+        raise HTTPException(status_code=400, detail="Bed must belong to the same residence")
 
     await db.commit()
-    await db.refresh(resident)
-    return resident
+    await response_cache.invalidate("residents")
+    return ResidentOut.model_construct(**row)
 
 @router.get("/{id}/history", response_model=list[dict])
 async def get_resident_history(
     id: str,
     db: AsyncSession = Depends(get_db),
-    current = Depends(get_current_user),
+    resident: Resident = Depends(require_resident_access),
+    limit: int = Query(50, ge=1, le=200, description="Máximo de cambios a devolver"),
+    before: datetime | None = Query(None, description="Cursor: changed_at del último cambio recibido"),
 ):
-    """Get resident history"""
-    resident = await get_resident_or_404(id, db)
-
-    if current["role"] != "superadmin":
-        result = await db.execute(
-            select(UserResidence).where(
-                UserResidence.user_id == current["id"],
-                UserResidence.residence_id == resident.residence_id,
-            )
-        )
-        if result.scalar_one_or_none() is None:
-            raise HTTPException(status_code=403, detail="Access denied to this resident")
-
-    result = await db.execute(
-        text("""
-            SELECT h.*
-            FROM resident_history h
-            WHERE h.resident_id = :resident_id
-            ORDER BY h.valid_from DESC
-        """),
-        {"resident_id": id}
-    )
+    """
+    Get resident history (más reciente primero).
+    Paginado por keyset sobre changed_at (idx_resident_history_resident_changed):
+    para la página siguiente se envía `before` con el changed_at de la última fila recibida.
+    """
+    query = _RESIDENT_HISTORY_QUERY
+    if before is not None:
+        query = query.where(ResidentHistory.changed_at < before)
 
-    return [dict(row) for row in result.fetchall()]
+    result = await db.execute(query, {"resident_id": id, "limit": limit})
+    return result.mappings().all()
 
 
 @router.get("/{id}/chronology", response_model=ResidentChronologyResponse)
@@ -631,6 +662,8 @@ async def get_resident_chronology(
         if date_to:
             measurement_query = measurement_query.where(Measurement.taken_at <= date_to)
 
+        # Solo pueden quedar en la respuesta los `limit` más recientes de cada tipo
+        measurement_query = measurement_query.order_by(Measurement.taken_at.desc()).limit(limit)
         measurement_result = await db.execute(measurement_query)
 
         for measurement, recorded_by_name, device_name in measurement_result.all():
@@ -686,6 +719,7 @@ async def get_resident_chronology(
         if date_to:
             task_query = task_query.where(TaskApplication.applied_at <= date_to)
 
+        task_query = task_query.order_by(TaskApplication.applied_at.desc()).limit(limit)
         task_result = await db.execute(task_query)
 
         for task_app, task_name, task_category, applied_by_name in task_result.all():
@@ -706,18 +740,26 @@ async def get_resident_chronology(
         # Crear alias para las tablas Room y Bed (previo y nuevo)
         PrevRoom = aliased(Room)
         PrevBed = aliased(Bed)
+        NewRoom = aliased(Room)
+        NewBed = aliased(Bed)
 
         history_query = select(
             ResidentHistory,
             User.name.label("changed_by_name"),
             PrevRoom.name.label("prev_room_name"),
-            PrevBed.name.label("prev_bed_name")
+            PrevBed.name.label("prev_bed_name"),
+            NewRoom.name.label("new_room_name"),
+            NewBed.name.label("new_bed_name")
         ).join(
             User, ResidentHistory.changed_by == User.id, isouter=True
         ).join(
             PrevRoom, ResidentHistory.previous_room_id == PrevRoom.id, isouter=True
         ).join(
             PrevBed, ResidentHistory.previous_bed_id == PrevBed.id, isouter=True
+        ).join(
+            NewRoom, ResidentHistory.room_id == NewRoom.id, isouter=True
+        ).join(
+            NewBed, ResidentHistory.bed_id == NewBed.id, isouter=True
         ).where(
             ResidentHistory.resident_id == id
         )
@@ -727,21 +769,20 @@ async def get_resident_chronology(
         if date_to:
             history_query = history_query.where(ResidentHistory.changed_at <= date_to)
 
+        # Solo los tipos de cambio que generan eventos, para que el límite sea exacto
+        change_types = []
+        if include_bed_changes:
+            change_types += ['bed_assignment', 'bed_removal', 'residence_transfer']
+        if include_status_changes:
+            change_types.append('status_change')
+        history_query = history_query.where(
+            ResidentHistory.change_type.in_(change_types)
+        ).order_by(ResidentHistory.changed_at.desc()).limit(limit)
         history_result = await db.execute(history_query)
 
-        for history, changed_by_name, prev_room_name, prev_bed_name in history_result.all():
-            # Cambios de cama
+        for history, changed_by_name, prev_room_name, prev_bed_name, new_room, new_bed in history_result.all():
+            # Cambios de cama (nombres de habitación y cama nuevos ya vienen en la consulta)
             if include_bed_changes and history.change_type in ['bed_assignment', 'bed_removal', 'residence_transfer']:
-                # Obtener nombres de habitación y cama nuevos
-                new_room = None
-                new_bed = None
-                if history.room_id:
-                    room_result = await db.execute(select(Room.name).where(Room.id == history.room_id))
-                    new_room = room_result.scalar()
-                if history.bed_id:
-                    bed_result = await db.execute(select(Bed.name).where(Bed.id == history.bed_id))
-                    new_bed = bed_result.scalar()
-
                 prev_location = f"{prev_room_name}, Cama {prev_bed_name}" if prev_room_name and prev_bed_name else None
                 new_location = f"{new_room}, Cama {new_bed}" if new_room and new_bed else None
 
@@ -770,7 +811,8 @@ async def get_resident_chronology(
                     recorded_by_name=changed_by_name
                 ))
 
-    # Ordenar eventos por timestamp descendente (más recientes primero)
+    # Ordenar eventos por timestamp descendente (más recientes primero); cada consulta
+    # trae como mucho `limit` filas, así que se ordenan a lo sumo 3 * limit eventos
     events.sort(key=lambda e: e.timestamp, reverse=True)
 
     # Aplicar límite
@@ -6,7 +6,7 @@ from sqlalchemy import select, func, and_, or_, text
 from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.orm import selectinload
 
-from app.deps import get_db, get_current_user
+from app.deps import get_db, get_current_user, bind_residence_if_member
 from app.models import Floor, Room, Bed, Residence, User, UserResidence, Resident
 from app.schemas import (
     FloorCreate, FloorUpdate, FloorOut,
@@ -24,17 +24,9 @@ router = APIRouter(prefix="/structure", tags=["structure"])
 async def apply_residence_context(db: AsyncSession, current: dict, residence_id: str | None):
     """Apply residence context for RLS"""
     if residence_id:
-        if current["role"] != "superadmin":
-            result = await db.execute(
-                select(UserResidence).where(
-                    UserResidence.user_id == current["id"],
-                    UserResidence.residence_id == residence_id,
-                )
-            )
-            if result.scalar_one_or_none() is None:
-                raise HTTPException(status_code=403, detail="Access denied to this residence")
-
-        await db.execute(text("SELECT set_config('app.residence_id', :rid, true)"), {"rid": residence_id})
+        # Superadmin no necesita comprobación ni GUC
+        if current["role"] != "superadmin" and not await bind_residence_if_member(db, current["id"], residence_id):
+            raise HTTPException(status_code=403, detail="Access denied to this residence")
     elif current["role"] != "superadmin":
         raise HTTPException(status_code=400, detail="Residence ID required for non-superadmin users")
 
@@ -49,9 +41,6 @@ async def get_residence_or_404(residence_id: str, db: AsyncSession) -> Residence
     return residence
 
 async def get_floor_or_404(floor_id: str, db: AsyncSession, current: dict | None = None) -> Floor:
-    if current:
-        await db.execute(text("SELECT set_config('app.user_id', :uid, true)"), {"uid": current['id']})
-
     async def fetch() -> Floor | None:
         result = await db.execute(
             select(Floor).where(Floor.id == floor_id, Floor.deleted_at.is_(None))
@@ -59,7 +48,7 @@ async def get_floor_or_404(floor_id: str, db: AsyncSession, current: dict | None
         return result.scalar_one_or_none()
 
     if current and current.get('role') != 'superadmin':
-        accessible = await PermissionService.get_accessible_residence_ids(db, current['id'], current['role'])
+        accessible = await PermissionService.get_accessible_residence_ids_for(db, current)
         for residence_id in accessible:
             await db.execute(text("SELECT set_config('app.residence_id', :rid, true)"), {"rid": residence_id})
             floor = await fetch()
@@ -120,8 +109,7 @@ async def paginate_query_structure(
     else:
         query = query.order_by(query.column_descriptions[0]['type'].created_at.desc())
 
-    offset = (pagination.page - 1) * pagination.size
-    query = query.offset(offset).limit(pagination.size)
+    query = query.offset(pagination.offset).limit(pagination.size)
 
     result = await db.execute(query)
     items = []
@@ -170,8 +158,7 @@ async def paginate_floors_query(query, db: AsyncSession, pagination: PaginationP
     else:
         query = query.order_by(Floor.created_at.desc())
 
-    offset = (pagination.page - 1) * pagination.size
-    query = query.offset(offset).limit(pagination.size)
+    query = query.offset(pagination.offset).limit(pagination.size)
     result = await db.execute(query)
 
     items = []
@@ -228,8 +215,6 @@ async def create_floor(
     if existing:
         raise HTTPException(status_code=409, detail="Floor name already exists in this residence")
 
-    await db.execute(text("SELECT set_config('app.user_id', :uid, true)"), {"uid": current["id"]})
-
     floor = Floor(
         id=new_uuid(),
         residence_id=residence_id,
@@ -238,7 +223,6 @@ async def create_floor(
 
     db.add(floor)
     await db.commit()
-    await db.refresh(floor)
     return floor
 
 @router.get("/floors", response_model=PaginatedResponse[FloorOut])
@@ -333,13 +317,7 @@ async def get_floor(
     floor = await get_floor_or_404(id, db, current)
 
     if current["role"] != "superadmin":
-        result = await db.execute(
-            select(UserResidence).where(
-                UserResidence.user_id == current["id"],
-                UserResidence.residence_id == floor.residence_id,
-            )
-        )
-        if result.scalar_one_or_none() is None:
+        if not await PermissionService.is_assigned(db, current["id"], floor.residence_id):
             raise HTTPException(status_code=403, detail="Access denied to this floor")
 
     return floor
@@ -357,17 +335,9 @@ async def update_floor(
     floor = await get_floor_or_404(id, db, current)
 
     if current["role"] != "superadmin":
-        result = await db.execute(
-            select(UserResidence).where(
-                UserResidence.user_id == current["id"],
-                UserResidence.residence_id == floor.residence_id,
-            )
-        )
-        if result.scalar_one_or_none() is None:
+        if not await PermissionService.is_assigned(db, current["id"], floor.residence_id):
             raise HTTPException(status_code=403, detail="Access denied to this floor")
 
-    await db.execute(text("SELECT set_config('app.user_id', :uid, true)"), {"uid": current["id"]})
-
     update_data = data.dict(exclude_unset=True)
 
     new_residence_id = update_data.pop('residence_id', None)
@@ -375,13 +345,7 @@ async def update_floor(
         await get_residence_or_404(new_residence_id, db)
 
         if current['role'] != 'superadmin':
-            check = await db.execute(
-                select(UserResidence).where(
-                    UserResidence.user_id == current['id'],
-                    UserResidence.residence_id == new_residence_id,
-                )
-            )
-            if check.scalar_one_or_none() is None:
+            if not await PermissionService.is_assigned(db, current['id'], new_residence_id):
                 raise HTTPException(status_code=403, detail='Access denied to this residence')
 
         floor.residence_id = new_residence_id
@@ -390,7 +354,6 @@ async def update_floor(
         setattr(floor, field, value)
 
     await db.commit()
-    await db.refresh(floor)
     return floor
 
 @router.delete("/floors/{id}", status_code=204)
@@ -405,17 +368,9 @@ async def delete_floor(
     floor = await get_floor_or_404(id, db, current)
 
     if current["role"] != "superadmin":
-        result = await db.execute(
-            select(UserResidence).where(
-                UserResidence.user_id == current["id"],
-                UserResidence.residence_id == floor.residence_id,
-            )
-        )
-        if result.scalar_one_or_none() is None:
+        if not await PermissionService.is_assigned(db, current["id"], floor.residence_id):
             raise HTTPException(status_code=403, detail="Access denied to this floor")
 
-    await db.execute(text("SELECT set_config('app.user_id', :uid, true)"), {"uid": current["id"]})
-
     floor.deleted_at = func.now()
     await db.commit()
 
@@ -443,8 +398,7 @@ async def paginate_query_rooms(
     else:
         query = query.order_by(Room.created_at.desc())
 
-    offset = (pagination.page - 1) * pagination.size
-    query = query.offset(offset).limit(pagination.size)
+    query = query.offset(pagination.offset).limit(pagination.size)
     result = await db.execute(query)
 
     items = []
@@ -488,13 +442,7 @@ async def create_room(
     floor = await get_floor_or_404(data.floor_id, db)
 
     if current["role"] != "superadmin":
-        result = await db.execute(
-            select(UserResidence).where(
-                UserResidence.user_id == current["id"],
-                UserResidence.residence_id == floor.residence_id,
-            )
-        )
-        if result.scalar_one_or_none() is None:
+        if not await PermissionService.is_assigned(db, current["id"], floor.residence_id):
             raise HTTPException(status_code=403, detail="Access denied to this floor")
 
     existing = await db.scalar(
@@ -507,8 +455,6 @@ async def create_room(
     if existing:
         raise HTTPException(status_code=409, detail="Room name already exists on this floor")
 
-    await db.execute(text("SELECT set_config('app.user_id', :uid, true)"), {"uid": current["id"]})
-
     room = Room(
         id=new_uuid(),
         residence_id=floor.residence_id,
@@ -518,7 +464,6 @@ async def create_room(
 
     db.add(room)
     await db.commit()
-    await db.refresh(room)
     return room
 
 @router.get("/rooms", response_model=PaginatedResponse[RoomOut])
@@ -644,13 +589,7 @@ async def get_room(
     room = await get_room_or_404(id, db)
 
     if current["role"] != "superadmin":
-        result = await db.execute(
-            select(UserResidence).where(
-                UserResidence.user_id == current["id"],
-                UserResidence.residence_id == room.residence_id,
-            )
-        )
-        if result.scalar_one_or_none() is None:
+        if not await PermissionService.is_assigned(db, current["id"], room.residence_id):
             raise HTTPException(status_code=403, detail="Access denied to this room")
 
     return room
@@ -666,17 +605,9 @@ async def update_room(
     room = await get_room_or_404(id, db)
 
     if current["role"] != "superadmin":
-        result = await db.execute(
-            select(UserResidence).where(
-                UserResidence.user_id == current["id"],
-                UserResidence.residence_id == room.residence_id,
-            )
-        )
-        if result.scalar_one_or_none() is None:
+        if not await PermissionService.is_assigned(db, current["id"], room.residence_id):
             raise HTTPException(status_code=403, detail="Access denied to this room")
 
-    await db.execute(text("SELECT set_config('app.user_id', :uid, true)"), {"uid": current["id"]})
-
     update_data = data.dict(exclude_unset=True)
     
     # Si se va a cambiar el floor_id, validar que el nuevo piso existe y el usuario tenga acceso
@@ -685,13 +616,7 @@ async def update_room(
         
         # Verificar que el usuario tenga acceso al nuevo piso
         if current["role"] != "superadmin":
-            result = await db.execute(
-                select(UserResidence).where(
-                    UserResidence.user_id == current["id"],
-                    UserResidence.residence_id == new_floor.residence_id,
-                )
-            )
-            if result.scalar_one_or_none() is None:
+            if not await PermissionService.is_assigned(db, current["id"], new_floor.residence_id):
                 raise HTTPException(status_code=403, detail="Access denied to the target floor")
         
         # Actualizar residence_id si el piso pertenece a otra residencia
@@ -701,7 +626,6 @@ async def update_room(
         setattr(room, field, value)
 
     await db.commit()
-    await db.refresh(room)
     return room
 
 @router.delete("/rooms/{id}", status_code=204)
@@ -714,17 +638,9 @@ async def delete_room(
     room = await get_room_or_404(id, db)
 
     if current["role"] != "superadmin":
-        result = await db.execute(
-            select(UserResidence).where(
-                UserResidence.user_id == current["id"],
-                UserResidence.residence_id == room.residence_id,
-            )
-        )
-        if result.scalar_one_or_none() is None:
+        if not await PermissionService.is_assigned(db, current["id"], room.residence_id):
             raise HTTPException(status_code=403, detail="Access denied to this room")
 
-    await db.execute(text("SELECT set_config('app.user_id', :uid, true)"), {"uid": current["id"]})
-
     room.deleted_at = func.now()
     await db.commit()
 
@@ -743,13 +659,7 @@ async def create_bed(
     room = await get_room_or_404(data.room_id, db)
 
     if current["role"] != "superadmin":
-        result = await db.execute(
-            select(UserResidence).where(
-                UserResidence.user_id == current["id"],
-                UserResidence.residence_id == room.residence_id,
-            )
-        )
-        if result.scalar_one_or_none() is None:
+        if not await PermissionService.is_assigned(db, current["id"], room.residence_id):
             raise HTTPException(status_code=403, detail="Access denied to this room")
 
     existing = await db.scalar(
@@ -762,8 +672,6 @@ async def create_bed(
     if existing:
         raise HTTPException(status_code=409, detail="Bed name already exists in this room")
 
-    await db.execute(text("SELECT set_config('app.user_id', :uid, true)"), {"uid": current["id"]})
-
     bed = Bed(
         id=new_uuid(),
         residence_id=room.residence_id,
@@ -773,7 +681,6 @@ async def create_bed(
 
     db.add(bed)
     await db.commit()
-    await db.refresh(bed)
     return bed
 
 @router.get("/beds", response_model=PaginatedResponse[BedOut])
@@ -850,8 +757,7 @@ async def list_beds(
             sort_field = sort_field.desc()
         base_query = base_query.order_by(sort_field)
 
-    offset = (pagination.page - 1) * pagination.size
-    base_query = base_query.distinct().offset(offset).limit(pagination.size)
+    base_query = base_query.distinct().offset(pagination.offset).limit(pagination.size)
 
     # Execute query
     result = await db.execute(base_query)
@@ -922,13 +828,7 @@ async def get_bed(
     bed = await get_bed_or_404(id, db)
 
     if current["role"] != "superadmin":
-        result = await db.execute(
-            select(UserResidence).where(
-                UserResidence.user_id == current["id"],
-                UserResidence.residence_id == bed.residence_id,
-            )
-        )
-        if result.scalar_one_or_none() is None:
+        if not await PermissionService.is_assigned(db, current["id"], bed.residence_id):
             raise HTTPException(status_code=403, detail="Access denied to this bed")
 
     return bed
@@ -943,13 +843,7 @@ async def bed_details(
     bed = await get_bed_or_404(id, db)
 
     if current["role"] != "superadmin":
-        result = await db.execute(
-            select(UserResidence).where(
-                UserResidence.user_id == current["id"],
-                UserResidence.residence_id == bed.residence_id,
-            )
-        )
-        if result.scalar_one_or_none() is None:
+        if not await PermissionService.is_assigned(db, current["id"], bed.residence_id):
             raise HTTPException(status_code=403, detail="Access denied to this bed")
 
     r = await db.execute(
@@ -987,23 +881,14 @@ async def update_bed(
     bed = await get_bed_or_404(id, db)
 
     if current["role"] != "superadmin":
-        result = await db.execute(
-            select(UserResidence).where(
-                UserResidence.user_id == current["id"],
-                UserResidence.residence_id == bed.residence_id,
-            )
-        )
-        if result.scalar_one_or_none() is None:
+        if not await PermissionService.is_assigned(db, current["id"], bed.residence_id):
             raise HTTPException(status_code=403, detail="Access denied to this bed")
 
-    await db.execute(text("SELECT set_config('app.user_id', :uid, true)"), {"uid": current["id"]})
-
     update_data = data.dict(exclude_unset=True)
     for field, value in update_data.items():
         setattr(bed, field, value)
 
     await db.commit()
-    await db.refresh(bed)
     return bed
 
 @router.delete("/beds/{id}", status_code=204)
@@ -1016,17 +901,9 @@ async def delete_bed(
     bed = await get_bed_or_404(id, db)
 
     if current["role"] != "superadmin":
-        result = await db.execute(
-            select(UserResidence).where(
-                UserResidence.user_id == current["id"],
-                UserResidence.residence_id == bed.residence_id,
-            )
-        )
-        if result.scalar_one_or_none() is None:
+        if not await PermissionService.is_assigned(db, current["id"], bed.residence_id):
             raise HTTPException(status_code=403, detail="Access denied to this bed")
 
-    await db.execute(text("SELECT set_config('app.user_id', :uid, true)"), {"uid": current["id"]})
-
     bed.deleted_at = func.now()
     await db.commit()
 
@@ -1,17 +1,18 @@
 from __future__ import annotations
 
 from fastapi import APIRouter, Depends, HTTPException, status, Query, Body
-from sqlalchemy import select, func, and_, or_, text
+from sqlalchemy import select, func, and_, or_
 from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.orm import selectinload
 
-from app.deps import get_db, get_current_user
+from app.deps import get_db, get_current_user, bind_residence_if_member
 from app.models import Tag, ResidentTag, Residence, User, UserResidence, Resident
 from app.schemas import (
     TagCreate, TagUpdate, TagOut, ResidentTagAssign,
     PaginationParams, PaginatedResponse, FilterParams
 )
 from app.security import new_uuid
+from app.services.permission_service import PermissionService
 
 router = APIRouter(prefix="/tags", tags=["tags"])
 
@@ -20,17 +21,9 @@ router = APIRouter(prefix="/tags", tags=["tags"])
 async def apply_residence_context(db: AsyncSession, current: dict, residence_id: str | None):
     """Apply residence context for RLS"""
     if residence_id:
-        if current["role"] != "superadmin":
-            result = await db.execute(
-                select(UserResidence).where(
-                    UserResidence.user_id == current["id"],
-                    UserResidence.residence_id == residence_id,
-                )
-            )
-            if result.scalar_one_or_none() is None:
-                raise HTTPException(status_code=403, detail="Access denied to this residence")
-
-        await db.execute(text("SELECT set_config('app.residence_id', :rid, true)"), {"rid": residence_id})
+        # Superadmin no necesita comprobación ni GUC
+        if current["role"] != "superadmin" and not await bind_residence_if_member(db, current["id"], residence_id):
+            raise HTTPException(status_code=403, detail="Access denied to this residence")
     elif current["role"] != "superadmin":
         raise HTTPException(status_code=400, detail="Residence ID required for non-superadmin users")
 
@@ -67,8 +60,7 @@ async def paginate_query_tags(
     else:
         query = query.order_by(Tag.created_at.desc())
 
-    offset = (pagination.page - 1) * pagination.size
-    query = query.offset(offset).limit(pagination.size)
+    query = query.offset(pagination.offset).limit(pagination.size)
 
     result = await db.execute(query)
     items = [dict(row._mapping) for row in result.scalars().all()]
@@ -112,8 +104,6 @@ async def create_tag(
     if existing:
         raise HTTPException(status_code=409, detail="Tag name already exists in this residence")
 
-    await db.execute(text("SELECT set_config('app.user_id', :uid, true)"), {"uid": current["id"]})
-
     tag = Tag(
         id=new_uuid(),
         residence_id=residence_id,
@@ -122,7 +112,6 @@ async def create_tag(
 
     db.add(tag)
     await db.commit()
-    await db.refresh(tag)
     return tag
 
 @router.get("/", response_model=PaginatedResponse[TagOut])
@@ -179,13 +168,7 @@ async def get_tag(
     tag = await get_tag_or_404(id, db)
 
     if current["role"] != "superadmin":
-        result = await db.execute(
-            select(UserResidence).where(
-                UserResidence.user_id == current["id"],
-                UserResidence.residence_id == tag.residence_id,
-            )
-        )
-        if result.scalar_one_or_none() is None:
+        if not await PermissionService.is_assigned(db, current["id"], tag.residence_id):
             raise HTTPException(status_code=403, detail="Access denied to this tag")
 
     return tag
@@ -201,13 +184,7 @@ async def update_tag(
     tag = await get_tag_or_404(id, db)
 
     if current["role"] != "superadmin":
-        result = await db.execute(
-            select(UserResidence).where(
-                UserResidence.user_id == current["id"],
-                UserResidence.residence_id == tag.residence_id,
-            )
-        )
-        if result.scalar_one_or_none() is None:
+        if not await PermissionService.is_assigned(db, current["id"], tag.residence_id):
             raise HTTPException(status_code=403, detail="Access denied to this tag")
 
     if data.name and data.name != tag.name:
@@ -222,14 +199,11 @@ async def update_tag(
         if existing:
             raise HTTPException(status_code=409, detail="Tag name already exists in this residence")
 
-    await db.execute(text("SELECT set_config('app.user_id', :uid, true)"), {"uid": current["id"]})
-
     update_data = data.dict(exclude_unset=True)
     for field, value in update_data.items():
         setattr(tag, field, value)
 
     await db.commit()
-    await db.refresh(tag)
     return tag
 
 @router.delete("/{id}", status_code=204)
@@ -242,17 +216,9 @@ async def delete_tag(
     tag = await get_tag_or_404(id, db)
 
     if current["role"] != "superadmin":
-        result = await db.execute(
-            select(UserResidence).where(
-                UserResidence.user_id == current["id"],
-                UserResidence.residence_id == tag.residence_id,
-            )
-        )
-        if result.scalar_one_or_none() is None:
+        if not await PermissionService.is_assigned(db, current["id"], tag.residence_id):
             raise HTTPException(status_code=403, detail="Access denied to this tag")
 
-    await db.execute(text("SELECT set_config('app.user_id', :uid, true)"), {"uid": current["id"]})
-
     tag.deleted_at = func.now()
     await db.commit()
 
@@ -269,13 +235,7 @@ async def assign_tag_to_resident(
     tag = await get_tag_or_404(tag_id, db)
 
     if current["role"] != "superadmin":
-        result = await db.execute(
-            select(UserResidence).where(
-                UserResidence.user_id == current["id"],
-                UserResidence.residence_id == tag.residence_id,
-            )
-        )
-        if result.scalar_one_or_none() is None:
+        if not await PermissionService.is_assigned(db, current["id"], tag.residence_id):
             raise HTTPException(status_code=403, detail="Access denied to this tag")
 
     resident_result = await db.execute(
@@ -296,8 +256,6 @@ async def assign_tag_to_resident(
     if existing:
         raise HTTPException(status_code=409, detail="Tag already assigned to this resident")
 
-    await db.execute(text("SELECT set_config('app.user_id', :uid, true)"), {"uid": current["id"]})
-
     assignment = ResidentTag(resident_id=resident_id, tag_id=tag_id)
     db.add(assignment)
     await db.commit()
@@ -313,17 +271,9 @@ async def remove_tag_from_resident(
     tag = await get_tag_or_404(tag_id, db)
 
     if current["role"] != "superadmin":
-        result = await db.execute(
-            select(UserResidence).where(
-                UserResidence.user_id == current["id"],
-                UserResidence.residence_id == tag.residence_id,
-            )
-        )
-        if result.scalar_one_or_none() is None:
+        if not await PermissionService.is_assigned(db, current["id"], tag.residence_id):
             raise HTTPException(status_code=403, detail="Access denied to this tag")
 
-    await db.execute(text("SELECT set_config('app.user_id', :uid, true)"), {"uid": current["id"]})
-
     result = await db.execute(
         select(ResidentTag).where(
             ResidentTag.resident_id == resident_id,
@@ -347,13 +297,7 @@ async def get_tag_residents(
     tag = await get_tag_or_404(tag_id, db)
 
     if current["role"] != "superadmin":
-        result = await db.execute(
-            select(UserResidence).where(
-                UserResidence.user_id == current["id"],
-                UserResidence.residence_id == tag.residence_id,
-            )
-        )
-        if result.scalar_one_or_none() is None:
+        if not await PermissionService.is_assigned(db, current["id"], tag.residence_id):
             raise HTTPException(status_code=403, detail="Access denied to this tag")
 
     result = await db.execute(
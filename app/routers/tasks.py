@@ -8,7 +8,7 @@ from datetime import datetime, timezone
 import uuid
 from typing import List, Optional
 
-from app.deps import get_db, get_current_user
+from app.deps import get_db, get_current_user, bind_residence_if_member
 from app.models import (
     TaskCategory, TaskTemplate, TaskApplication,
     Resident, UserResidence, Residence, User, Bed
@@ -20,9 +20,10 @@ from app.schemas import (
     TaskApplicationBatchRequest, TaskApplicationBatchResponse,
     TaskApplicationDailySummary, TaskApplicationDetail, TaskApplicationResidentDay, UserAssigner,
     VoiceParseRequest, VoiceParseResponse, VoiceApplicationRequest, VoiceApplicationResponse,
-    PaginationParams, PaginatedResponse, FilterParams
+    PaginationParams, PaginatedResponse, FilterParams, MeasurementTimeFilter, TIME_FILTER_DELTAS
 )
 from app.security import new_uuid, decrypt_data
+from app.services.permission_service import PermissionService
 from app.services.voice_service import VoiceService
 
 router = APIRouter(prefix="/tasks", tags=["tasks"])
@@ -39,17 +40,8 @@ async def _set_residence_context(
     Devuelve rid (puede ser None si superadmin no envía cabecera).
     """
     rid = residence_id
-    if rid:
-        if current["role"] != "superadmin":
-            ok = await db.execute(
-                select(UserResidence).where(
-                    UserResidence.user_id == current["id"],
-                    UserResidence.residence_id == rid,
-                )
-            )
-            if ok.scalar_one_or_none() is None:
-                raise HTTPException(status_code=403, detail="Residence not allowed for this user")
-        await db.execute(text("SELECT set_config('app.residence_id', :rid, true)"), {"rid": rid})
+    if rid and current["role"] != "superadmin" and not await bind_residence_if_member(db, current["id"], rid):
+        raise HTTPException(status_code=403, detail="Residence not allowed for this user")
     return rid
 
 def _can_edit_delete(current: dict, owner_id: str | None = None) -> bool:
@@ -128,8 +120,7 @@ async def paginate_query_tasks(
     else:
         query = query.order_by(query.column_descriptions[0]['type'].created_at.desc())
 
-    offset = (pagination.page - 1) * pagination.size
-    query = query.offset(offset).limit(pagination.size)
+    query = query.offset(pagination.offset).limit(pagination.size)
 
     result = await db.execute(query)
     objects = result.scalars().all()
@@ -212,14 +203,7 @@ async def create_category(
 
     # Validar que el usuario tenga acceso a esta residencia (salvo superadmin)
     if current["role"] != "superadmin":
-        from app.models import UserResidence
-        ok = await db.execute(
-            select(UserResidence).where(
-                UserResidence.user_id == current["id"],
-                UserResidence.residence_id == rid,
-            )
-        )
-        if ok.scalar_one_or_none() is None:
+        if not await PermissionService.is_assigned(db, current["id"], rid):
             raise HTTPException(status_code=403, detail="Residence not allowed for this user")
 
     # Configurar el contexto de residencia para RLS
@@ -245,14 +229,12 @@ async def create_category(
     await db.refresh(tc)
     
     # Obtener información del usuario creador
-    from app.models import User
     creator_result = await db.execute(
         select(User.name, User.alias_encrypted).where(User.id == current["id"])
     )
     creator = creator_result.first()
     created_by_info = None
     if creator:
-        from app.security import decrypt_data
         creator_alias = decrypt_data(creator[1]) if creator[1] else "N/A"
         created_by_info = {
             "id": current["id"],
@@ -415,14 +397,7 @@ async def create_template(
 
     # Validar que el usuario tenga acceso a esta residencia (salvo superadmin)
     if current["role"] != "superadmin":
-        from app.models import UserResidence
-        ok = await db.execute(
-            select(UserResidence).where(
-                UserResidence.user_id == current["id"],
-                UserResidence.residence_id == rid,
-            )
-        )
-        if ok.scalar_one_or_none() is None:
+        if not await PermissionService.is_assigned(db, current["id"], rid):
             raise HTTPException(status_code=403, detail="Residence not allowed for this user")
 
     # Configurar el contexto de residencia para RLS
@@ -461,14 +436,12 @@ async def create_template(
     await db.refresh(t)
     
     # Obtener información del usuario creador
-    from app.models import User
     creator_result = await db.execute(
         select(User.name, User.alias_encrypted).where(User.id == current["id"])
     )
     creator = creator_result.first()
     created_by_info = None
     if creator:
-        from app.security import decrypt_data
         creator_alias = decrypt_data(creator[1]) if creator[1] else "N/A"
         created_by_info = {
             "id": current["id"],
@@ -699,14 +672,12 @@ async def apply_task(
     await db.refresh(app)
     
     # Obtener información del usuario que aplicó la tarea
-    from app.models import User
     applier_result = await db.execute(
         select(User.name, User.alias_encrypted).where(User.id == current["id"])
     )
     applier = applier_result.first()
     applied_by_info = None
     if applier:
-        from app.security import decrypt_data
         applier_alias = decrypt_data(applier[1]) if applier[1] else "N/A"
         applied_by_info = {
             "id": current["id"],
@@ -915,7 +886,7 @@ async def get_task_applications_by_resident(
     residence_id: str | None = Query(None, description="Filter by residence ID"),
     category_id: str | None = Query(None, description="Filter by category ID"),
     template_id: str | None = Query(None, description="Filter by template ID"),
-    time_filter: str = Query("all", description="Time filter: 7d|15d|30d|1y|all"),
+    time_filter: MeasurementTimeFilter = Query("all", description="Time filter: 7d|15d|30d|1y|all"),
 ) -> PaginatedResponse[TaskApplicationOut]:
     """
     Get task applications for a specific resident with time filters and category information.
@@ -927,12 +898,8 @@ async def get_task_applications_by_resident(
     - 1y: Last year
     - all: All applications
     """
-    from datetime import datetime, timedelta
-    
-    # Validate time filter
-    valid_filters = ["7d", "15d", "30d", "1y", "all"]
-    if time_filter not in valid_filters:
-        raise HTTPException(status_code=400, detail=f"Invalid time_filter. Must be one of: {valid_filters}")
+    # time_filter ya llega validado por FastAPI (Literal -> 422 si no encaja)
+    time_delta = TIME_FILTER_DELTAS.get(time_filter)  # None para "all"
     
     # Apply residence context
     rid = await _set_residence_context(db, current, residence_id)
@@ -988,15 +955,8 @@ async def get_task_applications_by_resident(
     )
     
     # Apply time filter
-    if time_filter != "all":
-        now = datetime.utcnow()
-        time_deltas = {
-            "7d": timedelta(days=7),
-            "15d": timedelta(days=15),
-            "30d": timedelta(days=30),
-            "1y": timedelta(days=365)
-        }
-        date_from = now - time_deltas[time_filter]
+    if time_delta is not None:
+        date_from = datetime.now(timezone.utc) - time_delta
         query = query.where(TaskApplication.applied_at >= date_from)
     
     # Apply category filter
@@ -1014,8 +974,7 @@ async def get_task_applications_by_resident(
     count_query = select(func.count()).select_from(query.subquery())
     total = await db.scalar(count_query)
     
-    offset = (pagination.page - 1) * pagination.size
-    result = await db.execute(query.offset(offset).limit(pagination.size))
+    result = await db.execute(query.offset(pagination.offset).limit(pagination.size))
     
     items = []
     for row in result.all():
@@ -1029,7 +988,6 @@ async def get_task_applications_by_resident(
             )
             applier = applier_result.first()
             if applier:
-                from app.security import decrypt_data
                 applier_alias = decrypt_data(applier[1]) if applier[1] else "N/A"
                 applied_by_info = {
                     "id": app.applied_by,
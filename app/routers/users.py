@@ -4,18 +4,20 @@
 
 from __future__ import annotations
 
-import bcrypt
 from fastapi import APIRouter, Depends, HTTPException, status, Query, Body
-from sqlalchemy import select, func, text, or_, and_
+from sqlalchemy import select, insert, delete, func, or_, and_, any_, literal, tuple_
+from sqlalchemy.dialects.postgresql import ARRAY
 from sqlalchemy.ext.asyncio import AsyncSession
+from datetime import datetime, timezone
 
 from app.deps import get_db, get_current_user
+from app.cache import response_cache
 from app.models import User, UserResidence, Residence
 from app.schemas import (
     UserCreate, UserOut, UserResidenceAssignment,
-    PaginationParams, PaginatedResponse, FilterParams
+    PaginationParams, PaginatedResponse, FilterParams, encode_cursor, decode_cursor
 )
-from app.security import new_uuid, decrypt_data, encrypt_data, hash_alias
+from app.security import new_uuid, decrypt_data, decrypt_data_many, encrypt_data, hash_alias, hash_password
 from app.services.permission_service import PermissionService
 
 router = APIRouter(prefix="/users", tags=["users"])
@@ -24,11 +26,6 @@ router = APIRouter(prefix="/users", tags=["users"])
 # FUNCIONES AUXILIARES
 # =====================================================================
 
-def _hash_password(password: str) -> str:
-    """Hash de contraseña usando bcrypt"""
-    salt = bcrypt.gensalt()
-    return bcrypt.hashpw(password.encode("utf-8"), salt).decode("utf-8")
-
 async def _ensure_alias_available(db: AsyncSession, alias_hash: str, exclude_user_id: str = None):
     """Verifica que el alias esté disponible"""
     query = select(User).where(User.alias_hash == alias_hash, User.deleted_at.is_(None))
@@ -41,35 +38,40 @@ async def _ensure_alias_available(db: AsyncSession, alias_hash: str, exclude_use
     if result.scalar_one_or_none():
         raise HTTPException(status_code=400, detail="Alias already exists")
 
-async def _validate_residences_exist(db: AsyncSession, residence_ids: list[str]) -> list[str]:
-    """Valida que las residencias existan"""
+async def _validate_residences_exist(db: AsyncSession, residence_ids: list[str]) -> dict[str, str]:
+    """
+    Valida que las residencias existan.
+    Devuelve {id: name}: los nombres sirven para construir la respuesta sin otra consulta.
+    """
     if not residence_ids:
-        return []
+        return {}
     
+    # = ANY(array): un único parámetro, la misma sentencia preparada para cualquier
+    # número de ids (IN expande un parámetro por id). El resultado ya sale sin duplicados.
     result = await db.execute(
-        select(Residence.id).where(
-            Residence.id.in_(residence_ids),
+        select(Residence.id, Residence.name).where(
+            Residence.id == any_(literal(list(residence_ids), ARRAY(Residence.id.type))),
             Residence.deleted_at.is_(None)
         )
     )
-    valid_ids = [row[0] for row in result.fetchall()]
+    valid = {row.id: row.name for row in result.all()}
     
-    invalid_ids = set(residence_ids) - set(valid_ids)
+    invalid_ids = set(residence_ids) - set(valid)
     if invalid_ids:
         raise HTTPException(
             status_code=400,
             detail=f"Invalid residence IDs: {list(invalid_ids)}"
         )
     
-    return valid_ids
+    return valid
 
-async def _validate_assignment_scope(db: AsyncSession, user_role: str, user_id: str, residence_ids: list[str]):
+async def _validate_assignment_scope(db: AsyncSession, current: dict, residence_ids: list[str]):
     """Valida que el usuario pueda asignar estas residencias"""
-    if user_role == "superadmin":
+    if current["role"] == "superadmin":
         return  # Superadmin puede asignar cualquier residencia
     
     # Otros roles solo pueden asignar residencias que tengan asignadas
-    accessible_residences = await PermissionService.get_accessible_residence_ids(db, user_id, user_role)
+    accessible_residences = await PermissionService.get_accessible_residence_ids_for(db, current)
     
     invalid_assignments = set(residence_ids) - set(accessible_residences)
     if invalid_assignments:
@@ -78,6 +80,82 @@ async def _validate_assignment_scope(db: AsyncSession, user_role: str, user_id:
             detail=f"Cannot assign residences: {list(invalid_assignments)}"
         )
 
+async def _load_users_residences(
+    db: AsyncSession, user_ids: list[str], accessible_residences: list[str] | None = None
+) -> dict[str, list[dict]]:
+    """
+    Residencias {id, name} de varios usuarios en una sola consulta (IN),
+    opcionalmente restringidas a las residencias accesibles del usuario actual.
+    """
+    residences_by_user: dict[str, list[dict]] = {uid: [] for uid in user_ids}
+    if not user_ids:
+        return residences_by_user
+
+    query = (
+        select(UserResidence.user_id, Residence.id, Residence.name)
+        .join(Residence, UserResidence.residence_id == Residence.id)
+        .where(UserResidence.user_id.in_(user_ids), Residence.deleted_at.is_(None))
+    )
+    if accessible_residences is not None:
+        query = query.where(Residence.id.in_(accessible_residences))
+
+    for user_id, residence_id, residence_name in (await db.execute(query)).all():
+        residences_by_user[user_id].append({"id": residence_id, "name": residence_name})
+    return residences_by_user
+
+async def _load_creators(db: AsyncSession, creator_ids: set[str]) -> dict[str, dict]:
+    """Info {id, name, alias} de los creadores en una sola consulta (IN)"""
+    if not creator_ids:
+        return {}
+
+    result = await db.execute(
+        select(User.id, User.name, User.alias_encrypted).where(User.id.in_(creator_ids))
+    )
+    rows = result.all()
+    aliases = decrypt_data_many([row.alias_encrypted for row in rows])
+    return {
+        row.id: {
+            "id": row.id,
+            "name": row.name,
+            "alias": alias or "N/A",
+        }
+        for row, alias in zip(rows, aliases)
+    }
+
+def _user_to_dict(user: User, alias_display: str, residences: list[dict], created_by_info: dict | None) -> dict:
+    """Representación de usuario que devuelven list/get/update"""
+    return {
+        "id": user.id,
+        "alias": alias_display,
+        "name": user.name,
+        "role": user.role,
+        "residences": residences,  # Array de objetos {id, name} - para app móvil
+        "residence_names": [r["name"] for r in residences],  # Array de strings - para admin
+        "created_by": created_by_info,
+        "created_at": user.created_at.isoformat() if user.created_at else None,
+        "updated_at": user.updated_at.isoformat() if user.updated_at else None
+    }
+
+async def _build_user_items(
+    db: AsyncSession,
+    users: list[User],
+    accessible_residences: list[str] | None = None,
+    residences_by_user: dict[str, list[dict]] | None = None,
+) -> list[dict]:
+    """
+    Serializa usuarios con residencias y creador: 2 consultas para toda la lista (sin N+1).
+    Si el llamador ya conoce las residencias (residences_by_user) se omite su consulta.
+    """
+    if residences_by_user is None:
+        residences_by_user = await _load_users_residences(db, [u.id for u in users], accessible_residences)
+    creators = await _load_creators(db, {u.created_by for u in users if u.created_by})
+    # Decrypt aliases for display (un solo lote por página)
+    aliases = decrypt_data_many([u.alias_encrypted for u in users])
+    return [
+        _user_to_dict(user, alias or "N/A", residences_by_user[user.id], creators.get(user.created_by))
+        for user, alias in zip(users, aliases)
+    ]
+
 # =====================================================================
 # ENDPOINTS CRUD
 # =====================================================================
@@ -89,8 +167,14 @@ async def list_users(
     db: AsyncSession = Depends(get_db),
     current = Depends(get_current_user),
     role: str = Query(None, description="Filter by role: manager, professional"),
+    cursor: str | None = Query(None, description="Cursor de la página siguiente (next_cursor de la respuesta anterior)"),
 ) -> PaginatedResponse[UserOut]:
-    """List users with pagination and role-based filtering"""
+    """
+    List users with pagination and role-based filtering.
+    Con el orden por defecto (created_at DESC) la respuesta incluye next_cursor:
+    si llega `cursor` se pagina por keyset sobre (created_at, id) DESC en vez de
+    OFFSET, sin total, y se ignoran page y sort_by.
+    """
     
     # Build base query
     base_query = select(User).where(User.deleted_at.is_(None))
@@ -109,9 +193,7 @@ async def list_users(
         # Managers can see:
         # 1. Managers they created themselves
         # 2. Professionals from their assigned residences
-        accessible_residences = await PermissionService.get_accessible_residence_ids(
-            db, current["id"], current["role"]
-        )
+        accessible_residences = await PermissionService.get_accessible_residence_ids_for(db, current)
         
         if not accessible_residences:
             # No residences = no users visible
@@ -143,82 +225,66 @@ async def list_users(
         # Search by name if available
         base_query = base_query.where(User.name.ilike(f"%{filters.search}%"))
     
-    # Get total count
-    count_result = await db.execute(select(func.count()).select_from(base_query.subquery()))
-    total = count_result.scalar()
+    # Se guarda sin orden ni límite por si hace falta el COUNT de respaldo
+    count_source = base_query
+    
+    # Keyset posible solo con el orden por defecto (el de idx_user_created_keyset)
+    keyset = cursor is not None or pagination.sort_by is None or (
+        pagination.sort_by == "created_at" and pagination.sort_order == "desc"
+    )
     
     # Apply pagination and sorting
-    if pagination.sort_by == "created_at":
-        if pagination.sort_order == "desc":
-            base_query = base_query.order_by(User.created_at.desc())
-        else:
-            base_query = base_query.order_by(User.created_at.asc())
+    if keyset:
+        # id desempata para que el cursor sea estable
+        base_query = base_query.order_by(User.created_at.desc(), User.id.desc())
+    elif pagination.sort_by == "created_at":
+        base_query = base_query.order_by(User.created_at.asc())
     elif pagination.sort_by == "name":
         if pagination.sort_order == "desc":
             base_query = base_query.order_by(User.name.desc())
         else:
             base_query = base_query.order_by(User.name.asc())
     
-    base_query = base_query.offset((pagination.page - 1) * pagination.size).limit(pagination.size)
+    if cursor:
+        # Modo cursor: sin OFFSET ni total (el filtro keyset falsearía el COUNT);
+        # una fila de más indica si hay página siguiente
+        cursor_created_at, cursor_id = decode_cursor(cursor)
+        base_query = base_query.where(tuple_(User.created_at, User.id) < tuple_(
+            literal(cursor_created_at, User.created_at.type),
+            literal(cursor_id, User.id.type),
+        )).limit(pagination.size + 1)
+        users = (await db.execute(base_query)).scalars().all()
+        has_next = len(users) > pagination.size
+        users = users[:pagination.size]
+        total = None
+    else:
+        base_query = base_query.offset(pagination.offset).limit(pagination.size)
+        
+        # Execute query: el total sale en la misma consulta (count() OVER () se calcula antes del LIMIT)
+        result = await db.execute(base_query.add_columns(func.count().over().label("_total")))
+        rows = result.all()
+        users = [row[0] for row in rows]
+        if rows:
+            total = rows[0]._total
+        elif pagination.offset:
+            # Página fuera de rango: no hay filas de las que leer el total
+            total = await db.scalar(select(func.count()).select_from(count_source.subquery()))
+        else:
+            total = 0
+        has_next = pagination.page * pagination.size < total
     
-    # Execute query
-    result = await db.execute(base_query)
-    users = result.scalars().all()
+    next_cursor = None
+    if keyset and has_next and users[-1].created_at is not None:
+        next_cursor = encode_cursor(users[-1].created_at, users[-1].id)
     
-    # Get residence assignments and creator info for each user
-    items = []
-    for user in users:
-        # Get user's residence assignments with names
-        residence_query = (
-            select(Residence.id, Residence.name)
-            .join(UserResidence, UserResidence.residence_id == Residence.id)
-            .where(UserResidence.user_id == user.id, Residence.deleted_at.is_(None))
-        )
-        
-        # If current user is not superadmin, filter residences by their accessible residences
-        if current["role"] != "superadmin":
-            accessible_residences = await PermissionService.get_accessible_residence_ids(
-                db, current["id"], current["role"]
-            )
-            residence_query = residence_query.where(Residence.id.in_(accessible_residences))
-        
-        residence_result = await db.execute(residence_query)
-        residences = [{"id": row[0], "name": row[1]} for row in residence_result.fetchall()]
-        
-        # Get creator info
-        created_by_info = None
-        if user.created_by:
-            creator_result = await db.execute(
-                select(User.name, User.alias_encrypted).where(User.id == user.created_by)
-            )
-            creator = creator_result.first()
-            if creator:
-                creator_alias = decrypt_data(creator[1]) if creator[1] else "N/A"
-                created_by_info = {
-                    "id": user.created_by,
-                    "name": creator[0],
-                    "alias": creator_alias
-                }
-        
-        # Decrypt alias for display
-        alias_display = decrypt_data(user.alias_encrypted) if user.alias_encrypted else "N/A"
-        
-        items.append({
-            "id": user.id,
-            "alias": alias_display,
-            "name": user.name,
-            "role": user.role,
-            "residences": residences,  # Array de objetos {id, name} - para app móvil
-            "residence_names": [r["name"] for r in residences],  # Array de strings - para admin
-            "created_by": created_by_info,
-            "created_at": user.created_at.isoformat() if user.created_at else None,
-            "updated_at": user.updated_at.isoformat() if user.updated_at else None
-        })
+    # Residencias y creadores de toda la página en dos consultas (antes 2-3 por usuario)
+    items = await _build_user_items(
+        db, users, accessible_residences if current["role"] != "superadmin" else None
+    )
     
     # Calculate pagination metadata
-    pages = (total + pagination.size - 1) // pagination.size  # Ceiling division
-    has_next = pagination.page < pages
-    has_prev = pagination.page > 1
+    pages = (total + pagination.size - 1) // pagination.size if total is not None else None  # Ceiling division
+    has_prev = cursor is not None or pagination.page > 1
     
     return PaginatedResponse(
         items=items,
@@ -227,7 +293,8 @@ async def list_users(
         size=pagination.size,
         pages=pages,
         has_next=has_next,
-        has_prev=has_prev
+        has_prev=has_prev,
+        next_cursor=next_cursor
     )
 
 @router.get("/{user_id}", response_model=dict)
@@ -258,9 +325,7 @@ async def get_user(
                 raise HTTPException(status_code=403, detail="Access denied to this user")
         elif user.role == "professional":
             # Can see professionals from their assigned residences
-            accessible_residences = await PermissionService.get_accessible_residence_ids(
-                db, current["id"], current["role"]
-            )
+            accessible_residences = await PermissionService.get_accessible_residence_ids_for(db, current)
             
             # Check if this professional is assigned to any of the manager's residences
             user_residences = await db.execute(
@@ -274,52 +339,13 @@ async def get_user(
             if not any(rid in accessible_residences for rid in user_residence_ids):
                 raise HTTPException(status_code=403, detail="Access denied to this user")
     
-    # Get user's residence assignments with names
-    residence_query = (
-        select(Residence.id, Residence.name)
-        .join(UserResidence, UserResidence.residence_id == Residence.id)
-        .where(UserResidence.user_id == user.id, Residence.deleted_at.is_(None))
-    )
-    
-    # If current user is not superadmin, filter residences by their accessible residences
+    # Residencias (filtradas a las accesibles si no es superadmin) y creador
     if current["role"] != "superadmin":
-        accessible_residences = await PermissionService.get_accessible_residence_ids(
-            db, current["id"], current["role"]
-        )
-        residence_query = residence_query.where(Residence.id.in_(accessible_residences))
-    
-    residence_result = await db.execute(residence_query)
-    residences = [{"id": row[0], "name": row[1]} for row in residence_result.fetchall()]
-    
-    # Get creator info
-    created_by_info = None
-    if user.created_by:
-        creator_result = await db.execute(
-            select(User.name, User.alias_encrypted).where(User.id == user.created_by)
-        )
-        creator = creator_result.first()
-        if creator:
-            creator_alias = decrypt_data(creator[1]) if creator[1] else "N/A"
-            created_by_info = {
-                "id": user.created_by,
-                "name": creator[0],
-                "alias": creator_alias
-            }
-    
-    # Decrypt alias for display
-    alias_display = decrypt_data(user.alias_encrypted) if user.alias_encrypted else "N/A"
-
-    return {
-        "id": user.id,
-        "alias": alias_display,
-        "name": user.name,
-        "role": user.role,
-        "residences": residences,  # Array de objetos {id, name} - para app móvil
-        "residence_names": [r["name"] for r in residences],  # Array de strings - para admin
-        "created_by": created_by_info,
-        "created_at": user.created_at.isoformat() if user.created_at else None,
-        "updated_at": user.updated_at.isoformat() if user.updated_at else None
-    }
+        accessible_residences = await PermissionService.get_accessible_residence_ids_for(db, current)
+        items = await _build_user_items(db, [user], accessible_residences)
+    else:
+        items = await _build_user_items(db, [user])
+    return items[0]
 
 @router.post("/", response_model=UserOut, status_code=status.HTTP_201_CREATED)
 async def create_user(
@@ -343,17 +369,10 @@ async def create_user(
     alias_hash = hash_alias(alias_input)
     await _ensure_alias_available(db, alias_hash)
 
-    unique_residences: list[str] = []
-    seen: set[str] = set()
-    for residence_id in payload.residence_ids:
-        if residence_id not in seen:
-            unique_residences.append(residence_id)
-            seen.add(residence_id)
+    valid_residences = await _validate_residences_exist(db, payload.residence_ids)
+    await _validate_assignment_scope(db, current, valid_residences)
 
-    valid_residences = await _validate_residences_exist(db, unique_residences)
-    await _validate_assignment_scope(db, current["role"], current["id"], valid_residences)
-
-    password_hash = _hash_password(payload.password)
+    password_hash = await hash_password(payload.password)
     user = User(
         id=new_uuid(),
         role=target_role,
@@ -367,20 +386,22 @@ async def create_user(
     db.add(user)
     await db.flush()
 
-    assignments: list[UserResidence] = []
-    for residence_id in valid_residences:
-        assignment = UserResidence(user_id=user.id, residence_id=residence_id)
-        db.add(assignment)
-        assignments.append(assignment)
+    # Un único INSERT multi-fila (executemany) en vez de un INSERT por asignación
+    if valid_residences:
+        await db.execute(
+            insert(UserResidence),
+            [{"user_id": user.id, "residence_id": rid} for rid in valid_residences],
+        )
 
+    # created_at llega en el RETURNING del INSERT (eager_defaults en User): sin refresh
     await db.commit()
-    await db.refresh(user)
+    await response_cache.invalidate("residences", "residents")
 
     return UserOut(
         id=user.id,
         alias=alias_input,
         role=user.role,
-        residences=[UserResidenceAssignment(id=a.residence_id) for a in assignments],
+        residences=[UserResidenceAssignment(id=rid) for rid in valid_residences],
         created_at=user.created_at,  # El serializador lo convierte automáticamente
     )
 
@@ -413,9 +434,7 @@ async def update_user(
                 raise HTTPException(status_code=403, detail="Access denied to this user")
         elif user.role == "professional":
             # Can manage professionals from their assigned residences
-            accessible_residences = await PermissionService.get_accessible_residence_ids(
-                db, current["id"], current["role"]
-            )
+            accessible_residences = await PermissionService.get_accessible_residence_ids_for(db, current)
             
             # Check if this professional is assigned to any of the manager's residences
             user_residences = await db.execute(
@@ -439,7 +458,7 @@ async def update_user(
         valid_residences = await _validate_residences_exist(db, new_residence_ids)
         
         # Check assignment scope
-        await _validate_assignment_scope(db, current["role"], current["id"], valid_residences)
+        await _validate_assignment_scope(db, current, valid_residences)
     
     # Update fields if provided
     if "name" in payload and payload["name"]:
@@ -468,61 +487,39 @@ async def update_user(
             print(f"DEBUG: Alias no cambió, es el mismo")
     
     if "password" in payload and payload["password"]:
-        user.password_hash = _hash_password(payload["password"])
+        user.password_hash = await hash_password(payload["password"])
+    
+    # Valor en Python (no func.now()): así no hay que releerlo tras el UPDATE
+    user.updated_at = datetime.now(timezone.utc)
     
     # Update residence assignments if provided
+    residences_by_user = None
     if "residence_ids" in payload:
-        # Remove existing assignments
-        await db.execute(
-            text("DELETE FROM user_residence WHERE user_id = :user_id"),
-            {"user_id": user_id}
-        )
+        # Remove existing assignments (sentencia ORM: compilada una vez y cacheada)
+        await db.execute(delete(UserResidence).where(UserResidence.user_id == user_id))
         
-        # Add new assignments
-        for residence_id in new_residence_ids:
-            assignment = UserResidence(user_id=user_id, residence_id=residence_id)
-            db.add(assignment)
-    
-    await db.commit()
-    await db.refresh(user)
+        # Add new assignments (un único INSERT multi-fila, misma transacción que el DELETE)
+        new_residence_ids = list(dict.fromkeys(new_residence_ids))
+        if new_residence_ids:
+            await db.execute(
+                insert(UserResidence),
+                [{"user_id": user_id, "residence_id": rid} for rid in new_residence_ids],
+            )
+        # Nombres ya obtenidos al validar: sin releer las asignaciones
+        residences_by_user = {
+            user.id: [{"id": rid, "name": valid_residences[rid]} for rid in new_residence_ids]
+        }
     
-    # Get updated residence assignments
-    residence_result = await db.execute(
-        select(Residence.id, Residence.name)
-        .join(UserResidence, UserResidence.residence_id == Residence.id)
-        .where(UserResidence.user_id == user.id, Residence.deleted_at.is_(None))
-    )
-    residences = [{"id": row[0], "name": row[1]} for row in residence_result.fetchall()]
+    # Lecturas antes del commit, en la misma transacción/conexión: tras él la sesión
+    # volvería a pedir conexión al pool
+    await db.flush()
     
-    # Get creator info
-    created_by_info = None
-    if user.created_by:
-        creator_result = await db.execute(
-            select(User.name, User.alias_encrypted).where(User.id == user.created_by)
-        )
-        creator = creator_result.first()
-        if creator:
-            creator_alias = decrypt_data(creator[1]) if creator[1] else "N/A"
-            created_by_info = {
-                "id": user.created_by,
-                "name": creator[0],
-                "alias": creator_alias
-            }
-    
-    # Decrypt alias for display
-    alias_display = decrypt_data(user.alias_encrypted) if user.alias_encrypted else "N/A"
+    # Get updated residence assignments and creator info
+    items = await _build_user_items(db, [user], residences_by_user=residences_by_user)
 
-    return {
-        "id": user.id,
-        "alias": alias_display,
-        "name": user.name,
-        "role": user.role,
-        "residences": residences,  # Array de objetos {id, name} - para app móvil
-        "residence_names": [r["name"] for r in residences],  # Array de strings - para admin
-        "created_by": created_by_info,
-        "created_at": user.created_at.isoformat() if user.created_at else None,
-        "updated_at": user.updated_at.isoformat() if user.updated_at else None
-    }
+    await db.commit()
+    await response_cache.invalidate("residences", "residents", "measurements")
+    return items[0]
 
 @router.delete("/{user_id}", status_code=204)
 async def delete_user(
@@ -552,4 +549,5 @@ async def delete_user(
     # Soft delete
     user.deleted_at = func.now()
     
-    await db.commit()
\ No newline at end of file
+    await db.commit()
+    await response_cache.invalidate("residences", "residents", "measurements")
\ No newline at end of file
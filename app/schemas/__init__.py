@@ -18,7 +18,9 @@ from .enums import (
     ResidentStatus,
     DeviceType,
     MeasurementSource,
-    MeasurementType
+    MeasurementType,
+    MeasurementTimeFilter,
+    TIME_FILTER_DELTAS
 )
 
 # Importar esquemas por entidad
@@ -35,7 +37,7 @@ from .measurement import (
 )
 from .tag import TagCreate, TagUpdate, TagOut, ResidentTagAssign
 from .dashboard import DashboardMetric, MonthlyData, YearComparison, ResidentStats, MeasurementStats, TaskStats, TaskCategoryWithCount, MonthlyResidentData, NewResidentStats, DeviceStats, DashboardData
-from .pagination import PaginationParams, PaginatedResponse, FilterParams
+from .pagination import PaginationParams, PaginatedResponse, FilterParams, encode_cursor, decode_cursor
 from .chronology import (
     ChronologyEvent, MeasurementEvent, TaskEvent, BedChangeEvent, StatusChangeEvent,
     ResidentChronologyResponse, ChronologyFilters
@@ -91,6 +93,8 @@ __all__ = [
     "DeviceType",
     "MeasurementSource",
     "MeasurementType",
+    "MeasurementTimeFilter",
+    "TIME_FILTER_DELTAS",
 
     # Autenticación
     "LoginRequest",
@@ -183,6 +187,8 @@ __all__ = [
     "PaginationParams",
     "PaginatedResponse",
     "FilterParams",
+    "encode_cursor",
+    "decode_cursor",
 
     # Cronología
     "ChronologyEvent",
@@ -4,6 +4,7 @@
 
 from __future__ import annotations
 
+from datetime import timedelta
 from typing import Literal
 
 # =========================================================
@@ -28,4 +29,16 @@ DeviceType = Literal["blood_pressure", "pulse_oximeter", "scale", "thermometer"]
 MeasurementSource = Literal["device", "voice", "manual"]
 
 # Tipos de mediciones médicas soportadas
-MeasurementType = Literal["bp", "spo2", "weight", "temperature"]
\ No newline at end of file
+MeasurementType = Literal["bp", "spo2", "weight", "temperature"]
+
+# Ventanas de tiempo para los historiales (últimos N días / año / todo)
+MeasurementTimeFilter = Literal["7d", "15d", "30d", "1y", "all"]
+
+# Duración de cada ventana de MeasurementTimeFilter ("all" = sin filtro, no aparece).
+# Compartida por los historiales de mediciones y de tareas
+TIME_FILTER_DELTAS = {
+    "7d": timedelta(days=7),
+    "15d": timedelta(days=15),
+    "30d": timedelta(days=30),
+    "1y": timedelta(days=365),
+}
@@ -4,8 +4,10 @@
 
 from __future__ import annotations
 
+import base64
 from typing import Optional, List, Dict, Literal, TypeVar, Generic
 from datetime import datetime
+from fastapi import HTTPException
 from pydantic import BaseModel, Field
 
 # TypeVar para hacer PaginatedResponse genérica
@@ -25,12 +27,19 @@ class PaginationParams(BaseModel):
         search (Optional[str]): Término de búsqueda
         sort_by (Optional[str]): Campo de ordenamiento
         sort_order (Optional[Literal['asc', 'desc']]): Orden de clasificación
+        with_total (bool): Calcular total/pages (requiere un COUNT adicional)
     """
     page: int = Field(1, ge=1, description="Número de página")
     size: int = Field(20, ge=1, le=100, description="Tamaño de página")
     search: Optional[str] = Field(None, description="Término de búsqueda")
     sort_by: Optional[str] = Field(None, description="Campo de ordenamiento")
     sort_order: Optional[Literal['asc', 'desc']] = Field('asc', description="Orden de clasificación")
+    with_total: bool = Field(False, description="Calcular total/pages (COUNT adicional)")
+
+    @property
+    def offset(self) -> int:
+        """Filas a saltar para la página actual."""
+        return (self.page - 1) * self.size
 
 
 class PaginatedResponse(BaseModel, Generic[T]):
@@ -39,20 +48,41 @@ class PaginatedResponse(BaseModel, Generic[T]):
 
     Attributes:
         items (List[T]): Elementos de la página actual con tipo específico
-        total (int): Total de elementos
+        total (Optional[int]): Total de elementos (None si no se pidió with_total)
         page (int): Página actual
         size (int): Tamaño de página
-        pages (int): Total de páginas
+        pages (Optional[int]): Total de páginas (None si no se pidió with_total)
         has_next (bool): Indica si hay página siguiente
         has_prev (bool): Indica si hay página anterior
+        next_cursor (Optional[str]): Cursor opaco para pedir la página siguiente (paginación keyset)
     """
     items: List[T]
-    total: int
+    total: Optional[int] = None
     page: int
     size: int
-    pages: int
+    pages: Optional[int] = None
     has_next: bool
     has_prev: bool
+    next_cursor: Optional[str] = None
+
+
+# =========================================================
+# CURSORES KEYSET
+# =========================================================
+
+def encode_cursor(sort_value: datetime, row_id: str) -> str:
+    """Cursor opaco (base64url) con la clave keyset (fecha, id) de la última fila."""
+    raw = f"{sort_value.isoformat()}|{row_id}".encode("utf-8")
+    return base64.urlsafe_b64encode(raw).decode("ascii")
+
+
+def decode_cursor(cursor: str) -> tuple[datetime, str]:
+    """Inverso de encode_cursor. Cursor mal formado -> 400."""
+    try:
+        sort_value, row_id = base64.urlsafe_b64decode(cursor.encode("ascii")).decode("utf-8").split("|", 1)
+        return datetime.fromisoformat(sort_value), row_id
+    except Exception:
+        raise HTTPException(status_code=400, detail="Invalid cursor")
 
 
 # =========================================================
@@ -1,5 +1,10 @@
 import hashlib, jwt, datetime, bcrypt
+import asyncio
+import multiprocessing
 import uuid
+from concurrent.futures import ProcessPoolExecutor
+from functools import lru_cache
+from fastapi import HTTPException, status
 from app.config import settings
 
 def new_uuid() -> str:
@@ -9,7 +14,9 @@ def new_uuid() -> str:
 def normalize_alias(alias: str) -> str:
     return alias.strip().lower()
 
+@lru_cache(maxsize=4096)
 def hash_alias(alias: str) -> str:
+    # Cacheado: el mismo alias se hashea en cada login y en cada comprobación de alias
     h = hashlib.new(settings.alias_hash_alg)
     h.update(normalize_alias(alias).encode("utf-8"))
     return h.hexdigest()
@@ -21,6 +28,53 @@ def verify_password(plain: str, hashed: str) -> bool:
     except Exception:
         return False
 
+def _hash_password_sync(password: str, rounds: int) -> str:
+    return bcrypt.hashpw(password.encode("utf-8"), bcrypt.gensalt(rounds=rounds)).decode("utf-8")
+
+# bcrypt (coste 12) tarda ~100-300ms por llamada: se ejecuta en un pool de procesos
+# para no bloquear el event loop. El pool se crea al primer uso (no en el import,
+# así cada worker de uvicorn tiene el suyo) y se cierra en el shutdown.
+# Se crea con "spawn": a esas alturas el proceso ya tiene el event loop y sus hilos,
+# y hacer fork de un proceso con hilos puede dejar al hijo bloqueado en un lock.
+# Tamaño acotado (BCRYPT_WORKERS) porque cada worker de uvicorn tiene su propio pool.
+_bcrypt_pool: ProcessPoolExecutor | None = None
+# Backpressure: con demasiadas operaciones en cola se responde 503 en vez de acumular
+_bcrypt_slots = asyncio.Semaphore(settings.bcrypt_max_pending)
+
+def _get_bcrypt_pool() -> ProcessPoolExecutor:
+    global _bcrypt_pool
+    if _bcrypt_pool is None:
+        _bcrypt_pool = ProcessPoolExecutor(
+            max_workers=settings.bcrypt_workers,
+            mp_context=multiprocessing.get_context("spawn"),
+        )
+    return _bcrypt_pool
+
+def shutdown_bcrypt_pool() -> None:
+    global _bcrypt_pool
+    if _bcrypt_pool is not None:
+        _bcrypt_pool.shutdown(wait=False, cancel_futures=True)
+        _bcrypt_pool = None
+
+async def _run_bcrypt(fn, *args):
+    if _bcrypt_slots.locked():
+        raise HTTPException(
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+            detail="Server busy, retry later",
+            headers={"Retry-After": "1"},
+        )
+    async with _bcrypt_slots:
+        return await asyncio.get_running_loop().run_in_executor(_get_bcrypt_pool(), fn, *args)
+
+async def hash_password(password: str) -> str:
+    """Hash bcrypt de la contraseña, calculado fuera del event loop."""
+    # El coste va en cada hash: cambiar BCRYPT_ROUNDS no invalida las contraseñas existentes
+    return await _run_bcrypt(_hash_password_sync, password, settings.bcrypt_rounds)
+
+async def verify_password_async(plain: str, hashed: str) -> bool:
+    """verify_password fuera del event loop (login)."""
+    return await _run_bcrypt(verify_password, plain, hashed)
+
 def create_access_token(sub: str, role: str, expires_minutes: int = 120, alias: str = None) -> str:
     now = datetime.datetime.utcnow()
     payload = {
@@ -50,9 +104,26 @@ def encrypt_data(data: str) -> bytes:
 def decrypt_data(encrypted_data: bytes) -> str:
     """
     Desencripta datos sensibles.
+    El resultado se cachea por ciphertext: los listados descifran los mismos
+    teléfonos/emails en cada petición y así solo se descifran una vez.
     """
     if not encrypted_data:
         return ''
+    if isinstance(encrypted_data, (bytearray, memoryview)):
+        encrypted_data = bytes(encrypted_data)
+    return _decrypt_cached(encrypted_data)
+
+def decrypt_data_many(values) -> list[str]:
+    """
+    decrypt_data para una lista (p. ej. una página de usuarios): los ciphertexts
+    repetidos se descifran una sola vez y el descifrado queda en un único punto,
+    donde un cifrado real podrá reutilizar un solo contexto para todo el lote.
+    """
+    unique = {v: decrypt_data(v) for v in {bytes(v) for v in values if v}}
+    return [unique[bytes(v)] if v else '' for v in values]
+
+@lru_cache(maxsize=4096)
+def _decrypt_cached(encrypted_data: bytes) -> str:
     # Por ahora, decodificar directamente como UTF-8 para compatibilidad
     # TODO: Implementar Fernet decryption cuando se genere la clave
     try:
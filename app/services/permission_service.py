@@ -2,14 +2,26 @@
 Servicio centralizado para validación de permisos basado en roles
 """
 from typing import List, Optional
-from sqlalchemy import select, text
+from sqlalchemy import select, exists, bindparam
 from sqlalchemy.ext.asyncio import AsyncSession
 from fastapi import HTTPException, status
 from app.models import User, UserResidence, Residence, Resident, Device, TaskApplication
 
+# ¿Está el usuario asignado a la residencia? Sentencia construida una vez (la
+# comprobación más repetida de la API): solo EXISTS, sin hidratar UserResidence.
+_IS_ASSIGNED_QUERY = select(exists().where(
+    UserResidence.user_id == bindparam("user_id"),
+    UserResidence.residence_id == bindparam("residence_id"),
+))
+
 class PermissionService:
     """Servicio para gestionar permisos y acceso basado en roles"""
 
+    @staticmethod
+    async def is_assigned(db: AsyncSession, user_id: str, residence_id: str) -> bool:
+        """Verificar si la residencia está asignada al usuario (sin excepción por rol)"""
+        return bool(await db.scalar(_IS_ASSIGNED_QUERY, {"user_id": user_id, "residence_id": residence_id}))
+
     @staticmethod
     async def get_user_residences(db: AsyncSession, user_id: str) -> List[str]:
         """Obtener IDs de residencias asignadas a un usuario"""
@@ -26,14 +38,7 @@ class PermissionService:
             return True
 
         # Verificar si la residencia está asignada al usuario
-        result = await db.execute(
-            select(UserResidence)
-            .where(
-                UserResidence.user_id == user_id,
-                UserResidence.residence_id == residence_id
-            )
-        )
-        return result.scalar_one_or_none() is not None
+        return await PermissionService.is_assigned(db, user_id, residence_id)
 
     @staticmethod
     async def get_accessible_residence_ids(db: AsyncSession, user_id: str, user_role: str) -> List[str]:
@@ -46,6 +51,19 @@ class PermissionService:
         # Otros roles solo ven sus residencias asignadas
         return await PermissionService.get_user_residences(db, user_id)
 
+    @staticmethod
+    async def get_accessible_residence_ids_for(db: AsyncSession, current: dict) -> List[str]:
+        """
+        get_accessible_residence_ids memoizado en el dict `current` de la petición:
+        FastAPI resuelve get_current_user una sola vez por petición, así que todos
+        los helpers que reciben el mismo `current` comparten el resultado.
+        """
+        cached = current.get("_accessible_residences")
+        if cached is None:
+            cached = await PermissionService.get_accessible_residence_ids(db, current["id"], current["role"])
+            current["_accessible_residences"] = cached
+        return cached
+
     @staticmethod
     async def validate_residence_access(db: AsyncSession, user_id: str, residence_id: str, user_role: str) -> None:
         """Validar acceso a una residencia y lanzar excepción si no tiene permiso"""
@@ -93,19 +111,17 @@ class PermissionService:
             user_role: Rol del usuario actual
             residence_id: ID específico de residencia (opcional)
         """
-        # Obtener residencias accesibles para el usuario
-        accessible_residences = await PermissionService.get_accessible_residence_ids(db, user_id, user_role)
-
         if residence_id:
             # Si se especifica una residencia, verificar acceso y filtrar por esa
             await PermissionService.validate_residence_access(db, user_id, residence_id, user_role)
             # Resident ya está importado al inicio del archivo
             return query.where(Resident.residence_id == residence_id)
+
+        # Si no se especifica, filtrar por todas las residencias accesibles con una
+        # subconsulta: viaja en la propia consulta, sin leer antes la lista de IDs
+        # (sin residencias asignadas la subconsulta está vacía y no devuelve filas)
+        if user_role == "superadmin":
+            accessible_residences = select(Residence.id).where(Residence.deleted_at.is_(None))
         else:
-            # Si no se especifica, filtrar por todas las residencias accesibles
-            if accessible_residences:
-                # Resident ya está importado al inicio del archivo
-                return query.where(Resident.residence_id.in_(accessible_residences))
-            else:
-                # Si no tiene residencias asignadas, retornar consulta vacía
-                return query.where(text("1=0"))
+            accessible_residences = select(UserResidence.residence_id).where(UserResidence.user_id == user_id)
+        return query.where(Resident.residence_id.in_(accessible_residences))
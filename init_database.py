@@ -90,6 +90,70 @@ async def create_tables(engine):
     
     print("✅ Todas las tablas creadas")
 
+async def create_measurement_partitions(engine, months_back: int = 12, months_ahead: int = 3):
+    """
+    Crea las particiones mensuales de measurement (PARTITION BY RANGE taken_at)
+    y una partición DEFAULT para valores fuera de rango.
+    La función ensure_measurement_partition(fecha) queda en la BD para crear
+    particiones futuras: la API la llama al arrancar (app.db.ensure_measurement_partitions).
+    Si la partición DEFAULT ya tiene filas de ese mes, las mueve a la nueva partición
+    (un CREATE TABLE ... PARTITION OF fallaría en ese caso).
+    """
+    print("🗂️  Creando particiones mensuales de measurement...")
+
+    async with engine.begin() as conn:
+        await conn.execute(text("""
+            CREATE OR REPLACE FUNCTION ensure_measurement_partition(p_month DATE)
+            RETURNS VOID AS $$
+            DECLARE
+                v_start DATE := date_trunc('month', p_month)::DATE;
+                v_end   DATE := (date_trunc('month', p_month) + INTERVAL '1 month')::DATE;
+                v_name  TEXT := 'measurement_' || to_char(v_start, 'YYYY_MM');
+            BEGIN
+                -- Varios workers pueden llamarla a la vez al arrancar
+                PERFORM pg_advisory_xact_lock(hashtext('ensure_measurement_partition'));
+                IF to_regclass(v_name) IS NOT NULL THEN
+                    RETURN;
+                END IF;
+                -- Tabla suelta + filas de ese mes que hubieran caído en DEFAULT + ATTACH:
+                -- CREATE TABLE ... PARTITION OF fallaría si DEFAULT ya tiene filas del rango.
+                -- ATTACH crea en la partición los índices y triggers de measurement.
+                EXECUTE format(
+                    'CREATE TABLE %I (LIKE measurement INCLUDING DEFAULTS INCLUDING CONSTRAINTS)',
+                    v_name
+                );
+                IF to_regclass('measurement_default') IS NOT NULL THEN
+                    EXECUTE format(
+                        'WITH moved AS (DELETE FROM measurement_default WHERE taken_at >= %L AND taken_at < %L RETURNING *) '
+                        'INSERT INTO %I SELECT * FROM moved',
+                        v_start, v_end, v_name
+                    );
+                END IF;
+                EXECUTE format(
+                    'ALTER TABLE measurement ATTACH PARTITION %I FOR VALUES FROM (%L) TO (%L)',
+                    v_name, v_start, v_end
+                );
+            END;
+            $$ LANGUAGE plpgsql;
+        """))
+        print("  ✅ Función ensure_measurement_partition() creada")
+
+        await conn.execute(text(
+            "CREATE TABLE IF NOT EXISTS measurement_default PARTITION OF measurement DEFAULT"
+        ))
+        await conn.execute(
+            text("""
+                SELECT ensure_measurement_partition(m::DATE)
+                FROM generate_series(
+                    date_trunc('month', now()) - make_interval(months => :back),
+                    date_trunc('month', now()) + make_interval(months => :ahead),
+                    INTERVAL '1 month'
+                ) AS m
+            """),
+            {"back": months_back, "ahead": months_ahead},
+        )
+        print(f"  ✅ Particiones creadas ({months_back} meses atrás, {months_ahead} adelante) + DEFAULT")
+
 async def create_triggers(engine):
     """Crea triggers para resident_history que registran automáticamente cambios"""
     print("🔔 Creando triggers para resident_history...")
@@ -189,22 +253,44 @@ async def create_indexes(engine):
     
     indexes = [
         # Índices para búsquedas frecuentes
-        'CREATE INDEX CONCURRENTLY IF NOT EXISTS idx_user_alias_hash ON "user" (alias_hash)',
+        # alias_hash ya tiene el índice de su restricción UNIQUE: uno extra solo encarece escrituras
+        'DROP INDEX CONCURRENTLY IF EXISTS idx_user_alias_hash',
         'CREATE INDEX CONCURRENTLY IF NOT EXISTS idx_user_role ON "user" (role)',
         'CREATE INDEX CONCURRENTLY IF NOT EXISTS idx_user_deleted_at ON "user" (deleted_at)',
+        # Listado de usuarios paginado por keyset (created_at, id) DESC
+        'CREATE INDEX CONCURRENTLY IF NOT EXISTS idx_user_created_keyset ON "user" (created_at DESC, id DESC) WHERE deleted_at IS NULL',
         
 
+        # user_residence: la PK (user_id, residence_id) sirve las búsquedas por usuario;
+        # este índice sirve las de "usuarios de una residencia" (index-only scan)
+        'CREATE INDEX CONCURRENTLY IF NOT EXISTS idx_user_residence_residence_user ON user_residence (residence_id, user_id)',
+
         'CREATE INDEX CONCURRENTLY IF NOT EXISTS idx_resident_room_id ON resident (room_id)',
         'CREATE INDEX CONCURRENTLY IF NOT EXISTS idx_resident_floor_id ON resident (floor_id)',
 
-        'CREATE INDEX CONCURRENTLY IF NOT EXISTS idx_residence_name ON residence (name)',
+        # Nombre de residencias activas (orden por nombre en /mine y listados, duplicados al crear)
+        'DROP INDEX CONCURRENTLY IF EXISTS idx_residence_name',
+        'CREATE INDEX CONCURRENTLY IF NOT EXISTS idx_residence_name_active ON residence (name) WHERE deleted_at IS NULL',
+        # Búsqueda '%texto%' (ILIKE) en nombre/dirección: GIN con trigramas en lugar de seq scan
+        'CREATE EXTENSION IF NOT EXISTS pg_trgm',
+        'CREATE INDEX CONCURRENTLY IF NOT EXISTS idx_residence_name_address_trgm ON residence USING gin (name gin_trgm_ops, address gin_trgm_ops)',
         'CREATE INDEX CONCURRENTLY IF NOT EXISTS idx_residence_deleted_at ON residence (deleted_at)',
+        # Listado de residencias paginado por keyset (created_at, id) DESC
+        'CREATE INDEX CONCURRENTLY IF NOT EXISTS idx_residence_created_keyset ON residence (created_at DESC, id DESC) WHERE deleted_at IS NULL',
         
         'CREATE INDEX CONCURRENTLY IF NOT EXISTS idx_resident_full_name ON resident (full_name)',
+        # Búsqueda '%texto%' (ILIKE) en nombre/comentarios de residentes: GIN con trigramas
+        # (pg_trgm se crea antes, con los índices de residence)
+        'CREATE INDEX CONCURRENTLY IF NOT EXISTS idx_resident_full_name_comments_trgm ON resident USING gin (full_name gin_trgm_ops, comments gin_trgm_ops)',
         'CREATE INDEX CONCURRENTLY IF NOT EXISTS idx_resident_status ON resident (status)',
         'CREATE INDEX CONCURRENTLY IF NOT EXISTS idx_resident_residence_id ON resident (residence_id)',
         'CREATE INDEX CONCURRENTLY IF NOT EXISTS idx_resident_bed_id ON resident (bed_id)',
         'CREATE INDEX CONCURRENTLY IF NOT EXISTS idx_resident_deleted_at ON resident (deleted_at)',
+        # Listado de residentes paginado por keyset (created_at, id) DESC
+        'CREATE INDEX CONCURRENTLY IF NOT EXISTS idx_resident_created_keyset ON resident (created_at DESC, id DESC) WHERE deleted_at IS NULL',
+        # Mismo orden filtrado por residencia (?residence_id= o una sola residencia asignada):
+        # index scan sin Sort también con el filtro de residence_id
+        'CREATE INDEX CONCURRENTLY IF NOT EXISTS idx_resident_residence_created_keyset ON resident (residence_id, created_at DESC, id DESC) WHERE deleted_at IS NULL',
         
         'CREATE INDEX CONCURRENTLY IF NOT EXISTS idx_floor_residence_id ON floor (residence_id)',
         'CREATE INDEX CONCURRENTLY IF NOT EXISTS idx_floor_deleted_at ON floor (deleted_at)',
@@ -222,11 +308,12 @@ async def create_indexes(engine):
         'CREATE INDEX CONCURRENTLY IF NOT EXISTS idx_device_mac ON device (mac)',
         'CREATE INDEX CONCURRENTLY IF NOT EXISTS idx_device_deleted_at ON device (deleted_at)',
         
-        'CREATE INDEX CONCURRENTLY IF NOT EXISTS idx_measurement_residence_id ON measurement (residence_id)',
-        'CREATE INDEX CONCURRENTLY IF NOT EXISTS idx_measurement_resident_id ON measurement (resident_id)',
-        'CREATE INDEX CONCURRENTLY IF NOT EXISTS idx_measurement_type ON measurement (type)',
-        'CREATE INDEX CONCURRENTLY IF NOT EXISTS idx_measurement_taken_at ON measurement (taken_at)',
-        'CREATE INDEX CONCURRENTLY IF NOT EXISTS idx_measurement_deleted_at ON measurement (deleted_at)',
+        # measurement está particionada: CONCURRENTLY no se admite en tablas particionadas
+        'CREATE INDEX IF NOT EXISTS idx_measurement_residence_id ON measurement (residence_id)',
+        'CREATE INDEX IF NOT EXISTS idx_measurement_resident_id ON measurement (resident_id)',
+        'CREATE INDEX IF NOT EXISTS idx_measurement_type ON measurement (type)',
+        'CREATE INDEX IF NOT EXISTS idx_measurement_taken_at ON measurement (taken_at)',
+        'CREATE INDEX IF NOT EXISTS idx_measurement_deleted_at ON measurement (deleted_at)',
         
         'CREATE INDEX CONCURRENTLY IF NOT EXISTS idx_task_category_residence_id ON task_category (residence_id)',
         'CREATE INDEX CONCURRENTLY IF NOT EXISTS idx_task_category_deleted_at ON task_category (deleted_at)',
@@ -240,6 +327,8 @@ async def create_indexes(engine):
         'CREATE INDEX CONCURRENTLY IF NOT EXISTS idx_task_application_template_id ON task_application (task_template_id)',
         'CREATE INDEX CONCURRENTLY IF NOT EXISTS idx_task_application_applied_at ON task_application (applied_at)',
         'CREATE INDEX CONCURRENTLY IF NOT EXISTS idx_task_application_deleted_at ON task_application (deleted_at)',
+        # Cronología del residente: últimas `limit` tareas aplicadas sin ordenar todas
+        'CREATE INDEX CONCURRENTLY IF NOT EXISTS idx_task_application_resident_applied ON task_application (resident_id, applied_at DESC) WHERE deleted_at IS NULL',
         
         'CREATE INDEX CONCURRENTLY IF NOT EXISTS idx_tag_name ON tag (name)',
         'CREATE INDEX CONCURRENTLY IF NOT EXISTS idx_tag_deleted_at ON tag (deleted_at)',
@@ -260,12 +349,26 @@ async def create_indexes(engine):
 
         # Índices compuestos para consultas complejas
         'CREATE INDEX CONCURRENTLY IF NOT EXISTS idx_resident_residence_status ON resident (residence_id, status)',
-        'CREATE INDEX CONCURRENTLY IF NOT EXISTS idx_measurement_resident_type_taken ON measurement (resident_id, type, taken_at)',
+        'CREATE INDEX IF NOT EXISTS idx_measurement_resident_type_taken ON measurement (resident_id, type, taken_at)',
+        'CREATE INDEX IF NOT EXISTS idx_measurement_residence_taken ON measurement (residence_id, taken_at)',
+        # Historial de un residente (keyset (taken_at, id) DESC). Índice parcial y "covering":
+        # INCLUDE con el resto de columnas que devuelve el listado -> index-only scan.
+        # Sustituye al antiguo idx_measurement_resident_keyset (mismas claves, sin INCLUDE).
+        'DROP INDEX IF EXISTS idx_measurement_resident_keyset',
+        'CREATE INDEX IF NOT EXISTS idx_measurement_resident_list ON measurement '
+        '(resident_id, residence_id, taken_at DESC, id DESC) '
+        'INCLUDE (type, systolic, diastolic, pulse_bpm, spo2, weight_kg, temperature_c, source, device_id, recorded_by, created_at, updated_at, deleted_at) '
+        'WHERE deleted_at IS NULL',
         'CREATE INDEX CONCURRENTLY IF NOT EXISTS idx_task_app_resident_status ON task_application (resident_id, selected_status_text)',
         'CREATE INDEX CONCURRENTLY IF NOT EXISTS idx_resident_history_resident_changed ON resident_history (resident_id, changed_at DESC)',
+        # Historial de mediciones paginado por valid_from (GET /measurements/{id}/history)
+        'CREATE INDEX IF NOT EXISTS idx_measurement_history_measurement_valid_from ON measurement_history (measurement_id, valid_from DESC)',
     ]
     
-    async with engine.begin() as conn:
+    # CONCURRENTLY no puede ir dentro de una transacción: cada sentencia en autocommit
+    # (además, un fallo ya no aborta el resto de índices)
+    async with engine.connect() as conn:
+        conn = await conn.execution_options(isolation_level="AUTOCOMMIT")
         for index_sql in indexes:
             try:
                 await conn.execute(text(index_sql))
@@ -350,13 +453,16 @@ async def main():
         # 3. Crear todas las tablas
         await create_tables(engine)
 
-        # 4. Crear triggers para resident_history
+        # 4. Crear particiones mensuales de measurement
+        await create_measurement_partitions(engine)
+
+        # 5. Crear triggers para resident_history
         await create_triggers(engine)
 
-        # 5. Crear índices de rendimiento
+        # 6. Crear índices de rendimiento
         await create_indexes(engine)
 
-        # 6. Verificar configuración
+        # 7. Verificar configuración
         await verify_setup(engine)
         
         print("=" * 60)
@@ -1,12 +1,16 @@
 import uvicorn
 from fastapi import FastAPI, Depends
+from fastapi.responses import ORJSONResponse
 from app.middlewares import setup_middlewares
 from app.deps import get_current_user
 from app.exceptions import setup_exception_handlers
 from app.routers import auth, users, residences, structure, residents, tags, devices, tasks, measurements, dashboard
 from app.logging_config import logger
+from app.security import shutdown_bcrypt_pool
+from app.db import ensure_measurement_partitions
 
-app = FastAPI(title="Residences API", version="1.0.0")
+# orjson serializa datetimes/UUIDs en C: bastante más rápido que json en listados grandes
+app = FastAPI(title="Residences API", version="1.0.0", default_response_class=ORJSONResponse)
 
 setup_middlewares(app)
 setup_exception_handlers(app)
@@ -14,6 +18,21 @@ setup_exception_handlers(app)
 @app.on_event("startup")
 async def startup_event():
     logger.info("Application starting", extra={"version": "1.0.0"})
+    # Particiones mensuales de measurement por delante (sin cron externo)
+    try:
+        rows_in_default = await ensure_measurement_partitions()
+    except Exception:
+        logger.exception("Could not ensure measurement partitions")
+    else:
+        if rows_in_default:
+            logger.warning(
+                "Measurements outside monthly partitions",
+                extra={"rows_in_default_partition": rows_in_default},
+            )
+
+@app.on_event("shutdown")
+async def shutdown_event():
+    shutdown_bcrypt_pool()
 
 app.include_router(auth.router)
 app.include_router(users.router)